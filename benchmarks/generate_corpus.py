@@ -0,0 +1,255 @@
+# generate_corpus.py
+
+"""
+Synthetic Middle Korean corpus generator for benchmarks.
+
+Builds corpora of any size (10^4 .. 10^7 tokens and more) in the statistical
+shape of tests/fixtures/sample_sekpo_excerpt.txt:
+
+    - lines are sampled from the fixture's line shapes: number of words,
+      [note] ... [/note] spans (and their lengths), [head] and [add] markup;
+    - a new source tag (<釋詳3:1a>, <釋詳3:1b>, ...) starts a line as often as in the fixture;
+    - words keep the fixture's mix of Hanyang PUA syllables, modern syllables and hanja.
+
+The vocabulary grows with the corpus as natural text does (Heaps' law, V ~ K * n^0.65,
+calibrated on the fixture). New word types are made by splicing two fixture words, and
+repeated words are drawn in proportion to how often they were used before (Simon's model),
+which gives the usual Zipf-like frequency distribution. Without this, a large corpus would
+be a few hundred word types repeated, and every per-type cache would look perfect.
+
+Output formats:
+    txt   UTF-16 text, like the fixture
+    xml   NIKL-style XML (<title>, <date>, <sent page= n= lang= type=>), as read by parse_xml_file
+
+Usage:
+    python benchmarks/generate_corpus.py --tokens 1000000 --format txt --out /tmp/corpus
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, TextIO
+from xml.sax.saxutils import escape, quoteattr
+
+ROOT = Path(__file__).resolve().parent.parent
+FIXTURE = ROOT / "tests" / "fixtures" / "sample_sekpo_excerpt.txt"
+
+SOURCE_TAG_RE = re.compile(r"^<([^>]+)>\s*")
+MARKUP_RE = re.compile(r"\[/?(?:note|head|add)\]|【|】")
+ADD_RE = re.compile(r"\[add\].*?\[/add\]")
+
+# Heaps' law exponent for the growth of the vocabulary
+HEAPS_BETA = 0.65
+
+# Preferential sampling keeps at most this many past tokens (a uniform sample of all of them).
+RESERVOIR_SIZE = 2_000_000
+
+
+@dataclass
+class LineShape:
+    """Structure of one fixture line: word counts of its main/note parts, and its markup."""
+    new_source: bool
+    parts: list[tuple[str, int]]     # ("MAIN" | "NOTE", number of words)
+    head: bool
+    add: bool
+
+
+def load_fixture(path: Path = FIXTURE) -> tuple[list[LineShape], list[str]]:
+    """Return the line shapes and the words (in order) of the fixture."""
+    shapes: list[LineShape] = []
+    words: list[str] = []
+
+    with open(path, encoding="utf-8") as f:
+        for raw in f:
+            line = raw.strip()
+            if not line:
+                continue
+
+            m = SOURCE_TAG_RE.match(line)
+            new_source = m is not None
+            if m:
+                line = line[m.end():]
+
+            # The [add] block (one placeholder word in the fixture) is generated separately, see generate_lines.
+            head = "[head]" in line
+            add = "[add]" in line
+            line = re.sub(r"\[/?head\]", "", ADD_RE.sub("", line))
+
+            parts: list[tuple[str, int]] = []
+            state = "MAIN"
+            for piece in re.split(r"(\[note\]|\[/note\])", line):
+                if piece == "[note]":
+                    state = "NOTE"
+                elif piece == "[/note]":
+                    state = "MAIN"
+                else:
+                    ws = [w for w in piece.split() if not MARKUP_RE.fullmatch(w)]
+                    if ws:
+                        parts.append((state, len(ws)))
+                        words.extend(ws)
+
+            shapes.append(LineShape(new_source, parts, head, add))
+
+    return shapes, words
+
+
+class WordSource:
+    """Endless stream of words with fixture-like types and a growing, Zipf-like vocabulary."""
+
+    def __init__(self, seed_words: list[str], rng: random.Random) -> None:
+        self.rng = rng
+        self.seed_words = seed_words
+        self.pool: list[str] = list(seed_words)     # past tokens, for preferential sampling
+        self.n = len(seed_words)
+
+        types = len(set(seed_words))
+        self.k = types / (self.n ** HEAPS_BETA)
+
+    def _new_type(self) -> str:
+        a, b = self.rng.choice(self.seed_words), self.rng.choice(self.seed_words)
+        i = self.rng.randint(1, max(1, len(a)))
+        j = self.rng.randint(0, max(0, len(b) - 1))
+        return a[:i] + b[j:]
+
+    def next(self) -> str:
+        self.n += 1
+        # Probability of a new type = dV/dn for V = k * n^beta
+        if self.rng.random() < self.k * HEAPS_BETA * self.n ** (HEAPS_BETA - 1):
+            word = self._new_type()
+        else:
+            word = self.rng.choice(self.pool)
+
+        if len(self.pool) < RESERVOIR_SIZE:
+            self.pool.append(word)
+        else:
+            self.pool[self.rng.randrange(RESERVOIR_SIZE)] = word
+        return word
+
+
+def generate_lines(n_tokens: int, *, seed: int = 0, fixture: Path = FIXTURE) -> Iterator[tuple[str, str, list[tuple[str, list[str]]], bool, str | None]]:
+    """
+    Yield (volume, page, parts, head, add) for each generated line, until n_tokens words were produced.
+
+    `page` is the current page id (e.g. "1a"); parts are ("MAIN" | "NOTE", words); `add` is the
+    word of the line's [add] block, or None. The [add] words count toward n_tokens.
+    """
+    rng = random.Random(seed)
+    shapes, seed_words = load_fixture(fixture)
+    words = WordSource(seed_words, rng)
+
+    volume, leaf, side = 3, 1, "a"
+    produced = 0
+    first = True
+
+    while produced < n_tokens:
+        shape = rng.choice(shapes)
+
+        if shape.new_source and not first:
+            if side == "a":
+                side = "b"
+            else:
+                side, leaf = "a", leaf + 1
+                # Start a new volume every ~80 leaves
+                if leaf > 80:
+                    volume, leaf = volume + 1, 1
+        first = False
+
+        parts = []
+        for state, count in shape.parts:
+            count = min(count, n_tokens - produced)
+            if count <= 0:
+                break
+            parts.append((state, [words.next() for _ in range(count)]))
+            produced += count
+
+        add = None
+        if shape.add and parts and produced < n_tokens:
+            add = words.next()
+            produced += 1
+
+        if parts:
+            yield str(volume), f"{leaf}{side}", parts, shape.head, add
+
+
+def write_txt(out: TextIO, n_tokens: int, *, seed: int = 0) -> None:
+    """Write a fixture-style text corpus (source tags, [note]/[head]/[add] markup)."""
+    current = None
+    for volume, page, parts, head, add in generate_lines(n_tokens, seed=seed):
+        pieces = []
+        source = f"釋詳{volume}:{page}"
+        if source != current:
+            pieces.append(f"<{source}>")
+            current = source
+
+        for k, (state, ws) in enumerate(parts):
+            if k == 0 and head and state == "MAIN":
+                ws = ["[head]", ws[0], "[/head]", *ws[1:]]
+            text = " ".join(ws)
+            pieces.append(f"[note] {text} [/note]" if state == "NOTE" else text)
+
+        if add is not None:
+            pieces.append(f"[add] {add} [/add]")
+
+        out.write(" ".join(pieces) + "\n")
+
+
+def write_xml(out: TextIO, n_tokens: int, *, seed: int = 0, title: str = "釋譜詳節", date: str = "1447") -> None:
+    """Write a NIKL-style XML corpus: one <sent> per main/note part of each generated line."""
+    out.write('<?xml version="1.0" encoding="utf-8"?>\n<text>\n<teiHeader>\n')
+    out.write(f"<title>{escape(title)}</title>\n<date>{escape(date)}</date>\n</teiHeader>\n<body>\n")
+    n = 0
+    for volume, page, parts, head, add in generate_lines(n_tokens, seed=seed):
+        # The [add] word is plain main text, at the end of the line
+        if add is not None:
+            if parts[-1][0] == "MAIN":
+                parts = [*parts[:-1], ("MAIN", [*parts[-1][1], add])]
+            else:
+                parts = [*parts, ("MAIN", [add])]
+        for state, ws in parts:
+            n += 1
+            attrs = f"page={quoteattr(volume + ':' + page)} n={quoteattr(str(n))} lang=\"kor\" type={quoteattr(state)}"
+            out.write(f"<sent {attrs}>{escape(' '.join(ws))}</sent>\n")
+    out.write("</body>\n</text>\n")
+
+
+def generate(out_dir: Path, n_tokens: int, *, fmt: str = "txt", files: int = 1, seed: int = 0) -> list[Path]:
+    """Write `files` files of about n_tokens / files tokens each; return their paths."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    per_file = -(-n_tokens // files)
+    for i in range(files):
+        count = min(per_file, n_tokens - i * per_file)
+        if count <= 0:
+            break
+        if fmt == "xml":
+            path = out_dir / f"synthetic_{n_tokens}_{i:03d}.xml"
+            with open(path, "w", encoding="utf-8") as f:
+                write_xml(f, count, seed=seed + i)
+        else:
+            path = out_dir / f"synthetic_{n_tokens}_{i:03d}.txt"
+            with open(path, "w", encoding="utf-16", newline="\n") as f:
+                write_txt(f, count, seed=seed + i)
+        paths.append(path)
+    return paths
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Generate a synthetic Middle Korean corpus for benchmarks.")
+    p.add_argument("--tokens", type=int, default=100_000, help="Total number of tokens (default: 100000)")
+    p.add_argument("--format", choices=("txt", "xml", "both"), default="txt", help="Output format (default: txt, UTF-16)")
+    p.add_argument("--files", type=int, default=1, help="Split the corpus into this many files (default: 1)")
+    p.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    p.add_argument("--out", type=Path, required=True, help="Output directory")
+    ns = p.parse_args(argv)
+
+    for fmt in (("txt", "xml") if ns.format == "both" else (ns.format,)):
+        for path in generate(ns.out, ns.tokens, fmt=fmt, files=ns.files, seed=ns.seed):
+            print(f"[INFO] Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# run_benchmarks.py
+
+"""
+Benchmark the pipeline stages on synthetic corpora of increasing size.
+
+For each corpus size (and format), a corpus is generated with generate_corpus.py and
+every stage is timed on its own:
+
+    parse_file        read + split into tokens
+    attach_yale       PUA -> Unicode + Yale (with a fresh ConversionCache, so nothing is warm)
+    tag_tokens        LEM/INFL tagging (with a fresh Tagger)
+    search_monogram   search_tokens() with a single-token pattern
+    search_bigram     search_tokens() with a two-token pattern
+    write_hits        write the bigram hits to a result file
+
+For each stage the report gives the wall time, tokens/sec and the peak memory allocated
+during the stage (from tracemalloc, in a second pass so that tracing does not slow down
+the timed pass). Results are printed (or written) as JSON:
+
+    python benchmarks/run_benchmarks.py --tokens 10000 100000 1000000 --output results.json
+
+Corpora are written to a temporary directory unless --workdir is given; a kept workdir
+is reused by later runs (generation of 10^7 tokens takes a while).
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(BENCH_DIR.parent / "src"))
+
+from generate_corpus import generate                                        # noqa: E402
+from midkrregextool.parser import parse_file                                # noqa: E402
+from midkrregextool.report import write_hits                                # noqa: E402
+from midkrregextool.search import search_tokens                             # noqa: E402
+from midkrregextool.tagger import Tagger, load_infl_suffixes, load_lemma_whitelist, tag_tokens    # noqa: E402
+from midkrregextool.yale import ConversionCache, attach_yale                # noqa: E402
+
+DEFAULT_SIZES = (10_000, 100_000)
+DEFAULT_MONOGRAM = "nila"
+DEFAULT_BIGRAM = r"LEM-i/INFL \S+/LEM"
+
+STAGES = ("parse_file", "attach_yale", "tag_tokens", "search_monogram", "search_bigram", "write_hits")
+
+
+def _measure(fn: Callable[[], object], *, memory: bool) -> tuple[object, float, int | None]:
+    """Run fn once; return (result, seconds, peak bytes allocated while it ran or None)."""
+    gc.collect()
+    if not memory:
+        started = time.perf_counter()
+        result = fn()
+        return result, time.perf_counter() - started, None
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def run_stages(path: Path, *, encoding: str, out_dir: Path, monogram: str, bigram: str, memory: bool) -> dict[str, tuple[float, int | None]]:
+    """Run the whole pipeline on one file, measuring every stage. Returns {stage: (seconds, peak)}."""
+    infl_suffixes = load_infl_suffixes()
+    lemma_list = sorted(load_lemma_whitelist(), key=len, reverse=True)
+    # Building the tagger is start-up work, not tagging work.
+    tagger = Tagger(infl_suffixes, lemma_list)
+
+    measured: dict[str, tuple[float, int | None]] = {}
+
+    def stage(name: str, fn: Callable[[], object]) -> object:
+        result, seconds, peak = _measure(fn, memory=memory)
+        measured[name] = (seconds, peak)
+        return result
+
+    tokens = stage("parse_file", lambda: parse_file(path, encoding=encoding))
+    tokens = stage("attach_yale", lambda: attach_yale(tokens, vocab=ConversionCache()))
+    tokens = stage("tag_tokens", lambda: tag_tokens(tokens, infl_suffixes, lemma_list, tagger=tagger))
+    mono_hits = stage("search_monogram", lambda: search_tokens(tokens, monogram))
+    hits = stage("search_bigram", lambda: search_tokens(tokens, bigram))
+    stage("write_hits", lambda: write_hits(out_dir / f"{path.stem}_hits.txt", hits, pattern=bigram))
+
+    measured["_tokens"] = (len(tokens), None)
+    measured["_monogram_hits"] = (len(mono_hits), None)
+    measured["_bigram_hits"] = (len(hits), None)
+    return measured
+
+
+def benchmark(size: int, fmt: str, *, workdir: Path, monogram: str, bigram: str, memory: bool, seed: int) -> dict:
+    corpus_dir = workdir / f"{fmt}_{size}"
+    path = corpus_dir / f"synthetic_{size}_000.{fmt}"
+    if not path.exists():
+        print(f"[INFO] Generating {size} tokens ({fmt}) ...", file=sys.stderr)
+        generate(corpus_dir, size, fmt=fmt, seed=seed)
+    encoding = "utf-8" if fmt == "xml" else "utf-16"
+
+    print(f"[INFO] Timing {path.name} ...", file=sys.stderr)
+    timed = run_stages(path, encoding=encoding, out_dir=corpus_dir, monogram=monogram, bigram=bigram, memory=False)
+    traced = None
+    if memory:
+        print(f"[INFO] Tracing memory for {path.name} ...", file=sys.stderr)
+        traced = run_stages(path, encoding=encoding, out_dir=corpus_dir, monogram=monogram, bigram=bigram, memory=True)
+
+    n_tokens = int(timed["_tokens"][0])
+    stages = {}
+    for name in STAGES:
+        seconds = timed[name][0]
+        stages[name] = {
+            "seconds": round(seconds, 6),
+            "tokens_per_sec": round(n_tokens / seconds) if seconds > 0 else None,
+            "peak_bytes": traced[name][1] if traced is not None else None,
+        }
+
+    return {
+        "format": fmt,
+        "requested_tokens": size,
+        "tokens": n_tokens,
+        "file_bytes": path.stat().st_size,
+        "monogram_hits": int(timed["_monogram_hits"][0]),
+        "bigram_hits": int(timed["_bigram_hits"][0]),
+        "stages": stages,
+        "total_seconds": round(sum(s["seconds"] for s in stages.values()), 6),
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Benchmark midkrregextool pipeline stages on synthetic corpora.")
+    p.add_argument("--tokens", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Corpus sizes in tokens (default: 10000 100000)")
+    p.add_argument("--format", choices=("txt", "xml", "both"), default="txt", help="Corpus format (default: txt)")
+    p.add_argument("--monogram", default=DEFAULT_MONOGRAM, help=f"Single-token pattern (default: {DEFAULT_MONOGRAM!r})")
+    p.add_argument("--bigram", default=DEFAULT_BIGRAM, help=f"Two-token pattern (default: {DEFAULT_BIGRAM!r})")
+    p.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass (peak_bytes will be null)")
+    p.add_argument("--seed", type=int, default=0, help="Corpus generator seed (default: 0)")
+    p.add_argument("--workdir", type=Path, default=None, help="Keep generated corpora here (default: a temporary directory)")
+    p.add_argument("--output", type=Path, default=None, help="Write the JSON report here (default: stdout)")
+    ns = p.parse_args(argv)
+
+    formats = ("txt", "xml") if ns.format == "both" else (ns.format,)
+
+    with tempfile.TemporaryDirectory(prefix="midkr_bench_") as tmp:
+        workdir = ns.workdir if ns.workdir is not None else Path(tmp)
+        results = [
+            benchmark(size, fmt, workdir=workdir, monogram=ns.monogram, bigram=ns.bigram, memory=not ns.no_memory, seed=ns.seed)
+            for fmt in formats
+            for size in ns.tokens
+        ]
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "patterns": {"monogram": ns.monogram, "bigram": ns.bigram},
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if ns.output is not None:
+        ns.output.write_text(text + "\n", encoding="utf-8")
+        print(f"[INFO] Wrote {ns.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# startup_benchmark.py
+
+"""
+Measure CLI start-up time, for scripts that call the tool many times.
+
+Each command is run --runs times in a fresh interpreter and the median (and minimum)
+wall time is reported:
+
+    python           `python -c pass`, the interpreter alone
+    help             `midkrregextool --help`
+    cached_query     a one-pattern --patterns-file run over the test fixture, with
+                     the file already in the token cache (the "trivial query" case)
+
+For each command the report also says whether the converter (YaleKorean) was imported,
+from `python -X importtime`. In-process, it times loading the tagger resources from the
+precompiled resources.bin and from the text files.
+
+    python benchmarks/startup_benchmark.py --runs 20 --output startup.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from midkrregextool.resources import compile_resources, load_compiled   # noqa: E402
+from midkrregextool.tagger import Tagger                                # noqa: E402
+
+FIXTURE = ROOT / "tests" / "fixtures" / "sample_sekpo_excerpt.txt"
+
+
+def _env() -> dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT / "src"), env.get("PYTHONPATH")]))
+    return env
+
+
+def time_command(argv: list[str], runs: int) -> dict:
+    env = _env()
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(argv, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - started)
+
+    # One more run with -X importtime, to see which modules were loaded.
+    traced = subprocess.run([argv[0], "-X", "importtime", *argv[1:]], env=env, capture_output=True, text=True, check=True)
+    return {
+        "median_seconds": round(statistics.median(times), 6),
+        "min_seconds": round(min(times), 6),
+        "converter_imported": "YaleKorean" in traced.stderr,
+        "modules_imported": traced.stderr.count("import time:") - 1,
+    }
+
+
+def time_resources(number: int = 1000) -> dict:
+    def compiled():
+        Tagger.from_resources(load_compiled())
+
+    def from_text():
+        res = compile_resources()
+        Tagger(res.infl_suffixes, res.lemma_list)
+
+    return {
+        "compiled_available": load_compiled() is not None,
+        "compiled_us": round(timeit.timeit(compiled, number=number) / number * 1e6, 2),
+        "text_us": round(timeit.timeit(from_text, number=number) / number * 1e6, 2),
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Benchmark midkrregextool start-up time.")
+    p.add_argument("--runs", type=int, default=10, help="Runs per command (default: 10)")
+    p.add_argument("--output", type=Path, default=None, help="Write the JSON report here (default: stdout)")
+    ns = p.parse_args(argv)
+
+    py = sys.executable
+    tool = [py, "-m", "midkrregextool"]
+
+    with tempfile.TemporaryDirectory(prefix="midkr_startup_") as tmp:
+        tmp = Path(tmp)
+        patterns = tmp / "query.tsv"
+        patterns.write_text("nila\tstartup benchmark\tout.txt\n", encoding="utf-8")
+        cached_query = [*tool, "--path", str(FIXTURE), "--encoding", "utf-8", "--patterns-file", str(patterns), "--cache-dir", str(tmp / "cache")]
+
+        # Fill the token cache first.
+        subprocess.run(cached_query, env=_env(), stdout=subprocess.DEVNULL, check=True)
+
+        commands = {
+            "python": time_command([py, "-c", "pass"], ns.runs),
+            "help": time_command([*tool, "--help"], ns.runs),
+            "cached_query": time_command(cached_query, ns.runs),
+        }
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": ns.runs,
+        "commands": commands,
+        "resources": time_resources(),
+    }
+    text = json.dumps(report, indent=2)
+    if ns.output is not None:
+        ns.output.write_text(text + "\n", encoding="utf-8")
+        print(f"[INFO] Wrote {ns.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
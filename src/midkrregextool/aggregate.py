@@ -0,0 +1,288 @@
+# aggregate.py
+
+"""
+Frequency mode (--group-by): count the hits of a pattern per group instead of listing them.
+
+Group keys:
+
+    lemma, infl, tagged     lemma / INFL suffix / tagged form of the hit
+                            (for n-gram hits: those of all its tokens, joined by spaces)
+    source, file, is_note   source id / input file / main text or note of the hit's first token
+    period                  century of the hit's file (from the file catalog, see catalog.py)
+
+Relative frequencies are given per 10,000 tokens: for source, file, is_note and period,
+per 10k tokens of that group (so that groups of different sizes can be compared);
+for lemma, infl and tagged, per 10k tokens of everything searched.
+
+Counting never builds hits, let alone formats them:
+
+- monogram patterns are matched once per distinct tagged form; the counts then come
+  from per-corpus tables of how often each form occurs (in each group), so the cost
+  depends on the vocabulary and the number of groups, not on the number of hits;
+- n-gram hits are counted as the regex finds them, by their first row (they are the same
+  windows of k+1 tokens as search_corpus finds, see search.iter_ngram_spans);
+- in --stream mode, hits are counted as they are streamed, in constant memory.
+"""
+
+from __future__ import annotations
+
+import weakref
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from . import profiling
+from .corpus import Corpus
+from .model import Token
+from .search import is_ngram_pattern, iter_ngram_spans, iter_search_tokens, matching_form_ids
+
+GROUP_KEYS = ("lemma", "infl", "tagged", "source", "file", "period", "is_note")
+
+# Keys that group hits by their forms (relative to all tokens searched) rather than by where they occur
+FORM_KEYS = ("lemma", "infl", "tagged")
+
+DEFAULT_TOP = 20
+
+PER_TOKENS = 10_000
+
+# Label of hits whose group value is empty (no INFL suffix, no date, ...)
+NO_VALUE = "(none)"
+
+
+@dataclass
+class GroupCounts:
+    key: str                        # one of GROUP_KEYS
+    hits: Counter[str]              # group label -> hits
+    tokens: Counter[str] | None     # group label -> tokens in that group (None for FORM_KEYS)
+    total_tokens: int               # tokens searched
+
+    @property
+    def total_hits(self) -> int:
+        return sum(self.hits.values())
+
+    def rows(self, top: int | None = None) -> list[tuple]:
+        """
+        (rank, group, hits, share of all hits, hits per 10k tokens, tokens of the group), most frequent first.
+
+        Ties are ordered by label; `top` keeps only the first rows (None or 0: all).
+        """
+        total = self.total_hits
+        ranked = sorted(self.hits.items(), key=lambda item: (-item[1], item[0]))
+        if top:
+            ranked = ranked[:top]
+
+        rows = []
+        for rank, (label, n) in enumerate(ranked, 1):
+            base = self.tokens[label] if self.tokens is not None else self.total_tokens
+            rows.append((
+                rank, label, n,
+                n / total if total else 0.0,
+                n * PER_TOKENS / base if base else 0.0,
+                base if self.tokens is not None else None,
+            ))
+        return rows
+
+
+def period_label(century: int | None) -> str:
+    return f"{century}c" if century is not None else NO_VALUE
+
+
+# ----------------------------------------------------------------------
+# Corpus
+# ----------------------------------------------------------------------
+
+# Per-corpus tables (form frequencies, form x group counts), with the number of rows they were built for
+_TABLES: weakref.WeakKeyDictionary[Corpus, tuple[int, dict]] = weakref.WeakKeyDictionary()
+
+def _corpus_tables(corpus: Corpus) -> dict:
+    size, tables = _TABLES.get(corpus, (-1, {}))
+    if size != len(corpus):
+        tables = {}
+        _TABLES[corpus] = (len(corpus), tables)
+    return tables
+
+def _group_column(corpus: Corpus, key: str, centuries: dict[str, int | None]) -> tuple[array, list[str]]:
+    """The corpus column a key groups by, and the label of each of its ids."""
+    c = corpus
+    if key in FORM_KEYS:
+        from .tagger import parse_tagged_form
+        if key == "tagged":
+            labels = [v or NO_VALUE for v in c.tagged.values]
+        else:
+            part = 0 if key == "lemma" else 1
+            labels = [parse_tagged_form(v)[part] or NO_VALUE for v in c.tagged.values]
+        return c.tagged_ids, labels
+    if key == "source":
+        return c.source_ids, [v or NO_VALUE for v in c.sources.values]
+    if key == "is_note":
+        return c.note_ids, [v or NO_VALUE for v in c.notes.values]
+    if key == "file":
+        return c.path_ids, [str(v) for v in c.paths.values]
+    if key == "period":
+        return c.path_ids, [period_label(centuries.get(str(v))) for v in c.paths.values]
+    raise ValueError(f"Unknown group key {key!r} (expected one of: {', '.join(GROUP_KEYS)})")
+
+def _form_frequencies(corpus: Corpus) -> Counter[int]:
+    """Number of rows of each tagged form id (built once per corpus)."""
+    tables = _corpus_tables(corpus)
+    freq = tables.get("forms")
+    if freq is None:
+        freq = tables["forms"] = Counter(corpus.tagged_ids)
+    return freq
+
+def _form_group_counts(corpus: Corpus, name: str, column: array) -> dict[int, Counter[int]]:
+    """tagged form id -> Counter(group id -> rows) for a group column (built once per corpus and column)."""
+    tables = _corpus_tables(corpus)
+    cross = tables.get(name)
+    if cross is None:
+        cross = {}
+        for (f, g), n in Counter(zip(corpus.tagged_ids, column)).items():
+            per_form = cross.get(f)
+            if per_form is None:
+                per_form = cross[f] = Counter()
+            per_form[g] = n
+        tables[name] = cross
+    return cross
+
+def _group_sizes(corpus: Corpus, name: str, column: array) -> Counter[int]:
+    """Number of rows of each group id of a group column (built once per corpus and column)."""
+    tables = _corpus_tables(corpus)
+    sizes = tables.get(("sizes", name))
+    if sizes is None:
+        sizes = tables[("sizes", name)] = Counter(column)
+    return sizes
+
+def count_corpus(corpus: Corpus, pattern: str, key: str, *, flags=0, centuries: dict[str, int | None] | None = None) -> GroupCounts:
+    """
+    Count the hits of `pattern` (the same as search.search_corpus would find) per `key` group.
+
+    `centuries` maps each file (as str) to its century, for key="period".
+    """
+    column, labels = _group_column(corpus, key, centuries or {})
+    by_id: Counter[int] = Counter()
+    hits: Counter[str] = Counter()
+
+    with profiling.stage("group") as st:
+        if is_ngram_pattern(pattern):
+            spans = iter_ngram_spans(corpus, pattern, flags)
+            if key in FORM_KEYS:
+                # The labels of the k+1 tokens of the hit, as count_tokens joins them
+                hits.update(" ".join([labels[column[r]] for r in range(first, last + 1)]) for first, last in spans)
+            else:
+                by_id.update(column[first] for first, _ in spans)
+        else:
+            matched = matching_form_ids(corpus, pattern, flags)
+            if key in FORM_KEYS:
+                freq = _form_frequencies(corpus)
+                for f in matched:
+                    by_id[f] += freq[f]
+            else:
+                cross = _form_group_counts(corpus, key if key != "period" else "file", column)
+                for f in matched:
+                    by_id.update(cross.get(f, ()))
+
+        for i, n in by_id.items():
+            if n:
+                hits[labels[i]] += n
+
+        tokens = None
+        if key not in FORM_KEYS:
+            tokens = Counter()
+            for i, n in _group_sizes(corpus, key if key != "period" else "file", column).items():
+                tokens[labels[i]] += n
+
+        st.count(tokens=len(corpus), matches=sum(hits.values()))
+    return GroupCounts(key, hits, tokens, len(corpus))
+
+
+# ----------------------------------------------------------------------
+# Streams
+# ----------------------------------------------------------------------
+
+def _token_label(key: str, centuries: dict[str, int | None]):
+    """Function returning the group label of one token."""
+    if key in FORM_KEYS:
+        from .tagger import parse_tagged_form
+        if key == "tagged":
+            return lambda t: t.tagged_form or NO_VALUE
+        part = 0 if key == "lemma" else 1
+        return lambda t: parse_tagged_form(t.tagged_form)[part] or NO_VALUE
+    if key == "source":
+        return lambda t: t.source_id or NO_VALUE
+    if key == "is_note":
+        return lambda t: t.is_note or NO_VALUE
+    if key == "file":
+        return lambda t: str(t.path)
+    if key == "period":
+        return lambda t: period_label(centuries.get(str(t.path)))
+    raise ValueError(f"Unknown group key {key!r} (expected one of: {', '.join(GROUP_KEYS)})")
+
+def count_tokens(tokens: Iterable[Token], pattern: str, key: str, *, flags=0, centuries: dict[str, int | None] | None = None) -> GroupCounts:
+    """Count the hits of `pattern` in a token stream per `key` group (see search.iter_search_tokens), in constant memory."""
+    label = _token_label(key, centuries or {})
+    group_tokens: Counter[str] = Counter()
+    seen = 0
+
+    def counted(tokens: Iterable[Token]) -> Iterator[Token]:
+        nonlocal seen
+        for t in tokens:
+            seen += 1
+            if key not in FORM_KEYS:
+                group_tokens[label(t)] += 1
+            yield t
+
+    hits: Counter[str] = Counter()
+    for hit in iter_search_tokens(counted(tokens), pattern, flags):
+        if key in FORM_KEYS:
+            hits[" ".join(label(t) for t in hit)] += 1
+        else:
+            hits[label(hit[0])] += 1
+
+    return GroupCounts(key, hits, group_tokens if key not in FORM_KEYS else None, seen)
+
+
+# ----------------------------------------------------------------------
+# Output
+# ----------------------------------------------------------------------
+
+def format_counts(counts: GroupCounts, *, top: int | None = DEFAULT_TOP) -> list[str]:
+    """The top groups as the lines of an aligned table."""
+    from .kwic import text_width
+
+    with_tokens = counts.tokens is not None
+    header = ["rank", counts.key, "hits", "share", "per 10k"] + (["tokens"] if with_tokens else [])
+    table = [header]
+    for rank, label, n, share, per_10k, base in counts.rows(top):
+        row = [str(rank), label, str(n), f"{share:.1%}", f"{per_10k:.2f}"]
+        if with_tokens:
+            row.append(str(base))
+        table.append(row)
+
+    widths = [max(text_width(r[i]) for r in table) for i in range(len(header))]
+    lines = []
+    for n, r in enumerate(table):
+        cells = []
+        for i, (cell, w) in enumerate(zip(r, widths)):
+            pad = " " * (w - text_width(cell))
+            cells.append(cell + pad if i == 1 else pad + cell)     # numbers right-aligned
+        lines.append("  ".join(cells).rstrip())
+        if n == 0:
+            lines.append("-" * (sum(widths) + 2 * (len(widths) - 1)))
+    return lines
+
+def print_counts(counts: GroupCounts, *, top: int | None = DEFAULT_TOP) -> None:
+    groups = len(counts.hits)
+    shown = f"top {top} of {groups}" if top and top < groups else f"{groups}"
+    per_10k = counts.total_hits * PER_TOKENS / counts.total_tokens if counts.total_tokens else 0.0
+    print(f"[INFO] hits={counts.total_hits} in {counts.total_tokens} tokens ({per_10k:.2f} per 10k), {shown} groups by {counts.key}")
+    for line in format_counts(counts, top=top):
+        print(line)
+
+def export_counts(path: Path, counts: GroupCounts, *, fmt: str) -> int:
+    """Write every group (not only the top ones) as JSONL, TSV or CSV (see export.py)."""
+    from .export import write_records
+
+    columns = ("rank", counts.key, "hits", "share", "per_10k_tokens", "tokens")
+    return write_records(path, counts.rows(), fmt=fmt, columns=columns)
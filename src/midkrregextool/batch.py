@@ -0,0 +1,139 @@
+# batch.py
+
+"""
+Batch mode: many patterns over the same files, in one run.
+
+The patterns file is a tab-separated table with up to three columns:
+
+    pattern                 purpose                 output
+    nila                    -nila endings           nila.txt
+    LEM-i/INFL \\S+/LEM      nominative + noun       nom_bigram.txt
+
+- `purpose` and `output` may be left empty. Without an output name, the results go to
+  `<patterns file stem>_<line number>.txt`. With --export, the results are written in that
+  format instead (see export.py), with the output's extension replaced by the format's.
+- Relative output paths are taken relative to the patterns file.
+- Empty lines and lines starting with `#` are skipped, as is a first line whose
+  first column is `pattern` (a header).
+
+Every input file is parsed, converted and tagged once into a Corpus. Each pattern is then
+checked against the distinct tagged forms (or form pairs) through the trigram index, instead
+of rerunning the whole pipeline per pattern.
+"""
+
+from __future__ import annotations
+
+import re
+from bisect import bisect_left
+from dataclasses import dataclass
+from pathlib import Path
+
+from .corpus import Corpus
+from .export import export_row_hits
+from .index import TrigramIndex
+from .report import DEFAULT_OUTPUT_ENCODING, write_hits
+from .search import RowHits, search_corpus
+
+
+@dataclass(frozen=True)
+class BatchQuery:
+    pattern: str
+    purpose: str | None
+    output: Path
+    line_no: int
+
+
+def load_patterns_file(path: Path) -> list[BatchQuery]:
+    """Read a patterns file (see module docstring). Raises SystemExit on unreadable files."""
+    try:
+        with open(path, encoding="utf-8-sig") as f:
+            lines = f.read().splitlines()
+    except OSError as e:
+        raise SystemExit(f"[Error] Could not read patterns file {path}: {e}")
+
+    queries: list[BatchQuery] = []
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+
+        cols = [c.strip() for c in line.split("\t")]
+        if not queries and cols[0].lower() == "pattern":
+            continue    # header
+
+        pattern = cols[0].strip("\"")
+        purpose = cols[1] if len(cols) > 1 and cols[1] else None
+        output = Path(cols[2]) if len(cols) > 2 and cols[2] else Path(f"{path.stem}_{line_no}.txt")
+        if not output.is_absolute():
+            output = path.parent / output
+
+        queries.append(BatchQuery(pattern, purpose, output, line_no))
+
+    return queries
+
+
+def split_by_file(corpus: Corpus, row_hits: RowHits) -> list[RowHits]:
+    """Split row-ordered hits into one list per file of the corpus."""
+    return [
+        row_hits[bisect_left(row_hits, (start,)):bisect_left(row_hits, (end,))]
+        for _, start, end in corpus.files
+    ]
+
+
+def run_batch(corpus: Corpus, queries: list[BatchQuery], *, index: TrigramIndex | None = None, export_format: str | None = None) -> dict[int, list[int]]:
+    """
+    Evaluate every query over the corpus and write one result file per query
+    (a text report, or a `export_format` export).
+
+    Returns {line_no: [hit count per file]} for the queries that ran.
+    """
+    if index is None:
+        index = TrigramIndex.from_corpus(corpus)
+
+    counts: dict[int, list[int]] = {}
+
+    for q in queries:
+        try:
+            row_hits = search_corpus(corpus, q.pattern, index=index)
+        except re.error as e:
+            print(f"[WARN] Skipping pattern on line {q.line_no} ({q.pattern!r}): {e}")
+            continue
+
+        counts[q.line_no] = [len(hits) for hits in split_by_file(corpus, row_hits)]
+
+        output = q.output if export_format is None else q.output.with_suffix(f".{export_format}")
+        if output.exists():
+            print(f"[WARN] Overwriting existing file: {output}")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        if export_format is None:
+            write_hits(output, [corpus.views(rows) for rows in row_hits], pattern=q.pattern, purpose=q.purpose)
+        else:
+            export_row_hits(output, corpus, row_hits, fmt=export_format)
+
+        print(f"[INFO] pattern={q.pattern!r} hits={len(row_hits)} -> {output}")
+
+    return counts
+
+
+def format_summary(corpus: Corpus, queries: list[BatchQuery], counts: dict[int, list[int]]) -> list[list[str]]:
+    """Summary table rows: pattern, one hit count per file, total."""
+    rows = [["pattern", *(str(p) for p, _, _ in corpus.files), "total"]]
+    for q in queries:
+        per_file = counts.get(q.line_no)
+        if per_file is None:
+            continue
+        rows.append([q.pattern, *map(str, per_file), str(sum(per_file))])
+    return rows
+
+
+def print_summary(rows: list[list[str]]) -> None:
+    widths = [max(len(r[i]) for r in rows) for i in range(len(rows[0]))]
+    for n, r in enumerate(rows):
+        print("  ".join(cell.ljust(w) if i == 0 else cell.rjust(w) for i, (cell, w) in enumerate(zip(r, widths))))
+        if n == 0:
+            print("-" * (sum(widths) + 2 * (len(widths) - 1)))
+
+
+def write_summary(path: Path, rows: list[list[str]]) -> None:
+    with open(path, "w", encoding=DEFAULT_OUTPUT_ENCODING, newline="\n") as f:
+        for r in rows:
+            f.write("\t".join(r) + "\n")
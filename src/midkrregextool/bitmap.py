@@ -0,0 +1,283 @@
+# bitmap.py
+
+"""
+Compressed bitmaps over global token ids (corpus rows), and hit sets built on them.
+
+`Bitmap` follows the layout of Roaring bitmaps: rows are split into chunks of
+2**16 by their high bits, and each non-empty chunk stores its low 16 bits in
+one of two containers:
+
+    - a sorted array('H') when the chunk holds at most 4096 rows (2 bytes per row),
+    - a 65536-bit Python int otherwise (8 KiB, and AND/OR/NOT run in C).
+
+Empty chunks are not stored at all. Boolean operations work chunk by chunk, so
+combining two result sets costs about one container operation per 65536 tokens,
+whatever the number of hits.
+
+`HitSet` is a search result: the start rows of its hits, grouped by hit length
+(1 for monograms, 2 for bigrams, ...). On top of that it provides the query
+algebra used by the interactive loop:
+
+    a & b          hits of a that contain a hit of b     ("and" at the prompt)
+    a | b          hits of either
+    a - b          hits of a that contain no hit of b    (NOT)
+    a.then(b, ...) a hit of a immediately followed by a hit of b, as one longer hit
+"""
+
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator
+
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+CHUNK_MASK = CHUNK_SIZE - 1
+FULL_CHUNK = (1 << CHUNK_SIZE) - 1
+
+# Containers with more rows than this are stored as bitsets
+ARRAY_LIMIT = 4096
+
+# Bit positions set in each byte value, for turning bitsets back into rows
+_BYTE_BITS = tuple(tuple(b for b in range(8) if v >> b & 1) for v in range(256))
+
+
+def _to_int(c: array | int) -> int:
+    if isinstance(c, int):
+        return c
+    buf = bytearray(CHUNK_SIZE // 8)
+    for v in c:
+        buf[v >> 3] |= 1 << (v & 7)
+    return int.from_bytes(buf, "little")
+
+def _to_array(c: array | int) -> array:
+    if not isinstance(c, int):
+        return c
+    values = array("H")
+    for i, byte in enumerate(c.to_bytes(CHUNK_SIZE // 8, "little")):
+        if byte:
+            base = i << 3
+            values.extend(base + b for b in _BYTE_BITS[byte])
+    return values
+
+def _cardinality(c: array | int) -> int:
+    return c.bit_count() if isinstance(c, int) else len(c)
+
+def _normalize(c: array | int) -> array | int | None:
+    """Pick the container type that fits the number of rows; None for an empty chunk."""
+    n = _cardinality(c)
+    if n == 0:
+        return None
+    if isinstance(c, int):
+        return _to_array(c) if n <= ARRAY_LIMIT else c
+    return _to_int(c) if n > ARRAY_LIMIT else c
+
+
+class Bitmap:
+    """Set of non-negative ints (token rows), stored as Roaring-style chunks."""
+
+    __slots__ = ("chunks",)
+
+    def __init__(self, chunks: dict[int, array | int] | None = None) -> None:
+        self.chunks: dict[int, array | int] = chunks if chunks is not None else {}
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[int]) -> Bitmap:
+        """Build from rows in any order."""
+        grouped: dict[int, list[int]] = {}
+        for r in rows:
+            grouped.setdefault(r >> CHUNK_BITS, []).append(r & CHUNK_MASK)
+        chunks = {}
+        for key, values in grouped.items():
+            chunks[key] = _normalize(array("H", sorted(set(values))))
+        return cls(chunks)
+
+    @classmethod
+    def full(cls, n: int) -> Bitmap:
+        """All rows 0 .. n-1."""
+        chunks: dict[int, array | int] = {}
+        for key in range((n + CHUNK_MASK) >> CHUNK_BITS):
+            size = min(CHUNK_SIZE, n - (key << CHUNK_BITS))
+            chunks[key] = _normalize((1 << size) - 1)
+        return cls(chunks)
+
+    def __len__(self) -> int:
+        return sum(_cardinality(c) for c in self.chunks.values())
+
+    def __bool__(self) -> bool:
+        return bool(self.chunks)
+
+    def __iter__(self) -> Iterator[int]:
+        for key in sorted(self.chunks):
+            base = key << CHUNK_BITS
+            for v in _to_array(self.chunks[key]):
+                yield base + v
+
+    def __contains__(self, row: int) -> bool:
+        c = self.chunks.get(row >> CHUNK_BITS)
+        if c is None:
+            return False
+        v = row & CHUNK_MASK
+        if isinstance(c, int):
+            return bool(c >> v & 1)
+        i = bisect_left(c, v)
+        return i < len(c) and c[i] == v
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Bitmap) and list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f"Bitmap(rows={len(self)}, chunks={len(self.chunks)})"
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate size of the containers in bytes."""
+        return sum(CHUNK_SIZE // 8 if isinstance(c, int) else 2 * len(c) for c in self.chunks.values())
+
+    # ------------------------------------------------------------------
+    # Boolean operations
+    # ------------------------------------------------------------------
+
+    def __and__(self, other: Bitmap) -> Bitmap:
+        chunks = {}
+        for key in self.chunks.keys() & other.chunks.keys():
+            a, b = self.chunks[key], other.chunks[key]
+            if isinstance(a, int) or isinstance(b, int):
+                c = _normalize(_to_int(a) & _to_int(b))
+            else:
+                c = _normalize(array("H", sorted(set(a).intersection(b))))
+            if c is not None:
+                chunks[key] = c
+        return Bitmap(chunks)
+
+    def __or__(self, other: Bitmap) -> Bitmap:
+        chunks = dict(self.chunks)
+        for key, b in other.chunks.items():
+            a = chunks.get(key)
+            if a is None:
+                chunks[key] = b
+            elif isinstance(a, int) or isinstance(b, int) or len(a) + len(b) > ARRAY_LIMIT:
+                chunks[key] = _normalize(_to_int(a) | _to_int(b))
+            else:
+                chunks[key] = array("H", sorted(set(a).union(b)))
+        return Bitmap(chunks)
+
+    def __sub__(self, other: Bitmap) -> Bitmap:
+        chunks = {}
+        for key, a in self.chunks.items():
+            b = other.chunks.get(key)
+            if b is None:
+                chunks[key] = a
+                continue
+            if isinstance(a, int) or isinstance(b, int):
+                c = _normalize(_to_int(a) & ~_to_int(b) & FULL_CHUNK)
+            else:
+                c = array("H", sorted(set(a).difference(b))) or None
+            if c is not None:
+                chunks[key] = c
+        return Bitmap(chunks)
+
+    def complement(self, n: int) -> Bitmap:
+        """Rows 0 .. n-1 that are not in this bitmap."""
+        return Bitmap.full(n) - self
+
+    def shift(self, k: int) -> Bitmap:
+        """Add k (possibly negative) to every row; rows that would become negative are dropped."""
+        if k == 0:
+            return self
+        # Small shifts move bits within a chunk and spill over into the neighbouring chunk.
+        if abs(k) < CHUNK_SIZE:
+            parts: dict[int, int] = {}
+            for key, c in self.chunks.items():
+                x = _to_int(c)
+                if k > 0:
+                    lo, hi = (x << k) & FULL_CHUNK, x >> (CHUNK_SIZE - k)
+                    parts[key] = parts.get(key, 0) | lo
+                    if hi:
+                        parts[key + 1] = parts.get(key + 1, 0) | hi
+                else:
+                    lo, hi = x >> -k, (x << (CHUNK_SIZE + k)) & FULL_CHUNK
+                    parts[key] = parts.get(key, 0) | lo
+                    if hi and key > 0:
+                        parts[key - 1] = parts.get(key - 1, 0) | hi
+            chunks = {}
+            for key, x in parts.items():
+                c = _normalize(x)
+                if c is not None:
+                    chunks[key] = c
+            return Bitmap(chunks)
+        return Bitmap.from_rows(r + k for r in self if r + k >= 0)
+
+
+class HitSet:
+    """
+    Search hits as bitmaps of start rows, one bitmap per hit length.
+
+    A hit of length s starting at row r covers rows r .. r+s-1. There is at most one
+    hit per (start, length), which is what the searches in search.py produce.
+    """
+
+    __slots__ = ("by_span",)
+
+    def __init__(self, by_span: dict[int, Bitmap] | None = None) -> None:
+        self.by_span: dict[int, Bitmap] = {s: b for s, b in (by_span or {}).items() if b}
+
+    @classmethod
+    def from_row_hits(cls, hits: Iterable[tuple[int, ...]]) -> HitSet:
+        """Build from hits as returned by search_corpus (tuples of consecutive rows)."""
+        starts: dict[int, list[int]] = {}
+        for rows in hits:
+            starts.setdefault(len(rows), []).append(rows[0])
+        return cls({s: Bitmap.from_rows(rows) for s, rows in starts.items()})
+
+    def row_hits(self) -> list[tuple[int, ...]]:
+        """Hits as row tuples, in row order (the format of search_corpus)."""
+        hits = [tuple(range(r, r + s)) for s, b in self.by_span.items() for r in b]
+        hits.sort()
+        return hits
+
+    def __len__(self) -> int:
+        return sum(len(b) for b in self.by_span.values())
+
+    def __repr__(self) -> str:
+        return f"HitSet(hits={len(self)}, spans={sorted(self.by_span)})"
+
+    def _containing(self, other: HitSet) -> dict[int, Bitmap]:
+        """For each span s of self: the starts of self's hits that contain at least one hit of other."""
+        result: dict[int, Bitmap] = {}
+        for s, starts in self.by_span.items():
+            # A hit (r, s) contains a hit (q, t) when r <= q and q + t <= r + s.
+            inner = Bitmap()
+            for t, other_starts in other.by_span.items():
+                for k in range(s - t + 1):
+                    inner = inner | other_starts.shift(-k)
+            result[s] = starts & inner
+        return result
+
+    def __and__(self, other: HitSet) -> HitSet:
+        return HitSet(self._containing(other))
+
+    def __sub__(self, other: HitSet) -> HitSet:
+        containing = self._containing(other)
+        return HitSet({s: starts - containing[s] for s, starts in self.by_span.items()})
+
+    def __or__(self, other: HitSet) -> HitSet:
+        by_span = dict(self.by_span)
+        for s, starts in other.by_span.items():
+            by_span[s] = by_span[s] | starts if s in by_span else starts
+        return HitSet(by_span)
+
+    def then(self, other: HitSet, boundaries: Bitmap) -> HitSet:
+        """
+        Hits of self directly followed by a hit of other, joined into one hit.
+
+        `boundaries` holds the rows that start a new segment (file or is_note change);
+        a hit of other starting there does not continue the hit before it.
+        """
+        by_span: dict[int, Bitmap] = {}
+        for s, starts in self.by_span.items():
+            for t, other_starts in other.by_span.items():
+                joined = starts & (other_starts - boundaries).shift(-s)
+                if joined:
+                    by_span[s + t] = by_span[s + t] | joined if s + t in by_span else joined
+        return HitSet(by_span)
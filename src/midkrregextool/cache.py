@@ -0,0 +1,187 @@
+# cache.py
+
+"""
+Persistent on-disk cache of preprocessed corpus files.
+
+Parsing, Yale conversion and tagging a file always produce the same tokens
+as long as none of their inputs change. This module stores the result of
+that pipeline once per input file, so that later runs (and later searches
+in the same run) can skip straight to searching.
+
+Each cache entry is keyed by:
+    - the SHA-256 digest of the file's contents,
+    - the file encoding and the --displaycontext setting,
+    - the digests of `infl_suffixes.txt` and `lemma_whitelist.txt`,
+    - the conversion backend (--converter) and the installed YaleKorean version.
+
+If any of these differ from what was stored, the entry is treated as stale
+and the file is reprocessed. Entries are stored one per input file, so only
+new or modified files are ever reprocessed.
+
+Entry layout (binary):
+    MAGIC | pickled header (key + file stat) | zlib-compressed pickled (rows, contexts)
+
+With --displaycontext y, `contexts` is the file's list of context lines and
+each row refers to its line by index.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import zlib
+from pathlib import Path
+
+from .model import ContextTable, Token
+from .yale import converter_version, get_backend
+
+CACHE_FORMAT_VERSION = 3
+MAGIC = b"MKRC"
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "midkrregextool"
+
+_RESOURCE_FILES = ("infl_suffixes.txt", "lemma_whitelist.txt")
+
+
+def file_digest(path: str | Path) -> str:
+    """Return the SHA-256 hex digest of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def resource_digests() -> tuple[str, ...]:
+    """Digests of the tagger resources that tagged forms depend on."""
+    here = Path(__file__).parent
+    return tuple(file_digest(here / name) for name in _RESOURCE_FILES)
+
+
+def tokens_to_rows(tokens: list[Token]) -> list[tuple]:
+    """Flatten tokens into plain tuples (the path is implied by the entry)."""
+    return [
+        (t.source_id, t.token_index, t.pua, t.unicode_form, t.yale, t.is_note, t.tagged_form, t.context_id)
+        for t in tokens
+    ]
+
+def tokens_contexts(tokens: list[Token]) -> list[str]:
+    """Raw context lines that the rows of `tokens_to_rows` refer to (empty without contexts)."""
+    for t in tokens:
+        if t.contexts is not None:
+            return t.contexts.raw
+    return []
+
+def rows_to_tokens(path: str | Path, rows: list[tuple], contexts: list[str] | None = None) -> list[Token]:
+    """Rebuild Token objects from rows produced by `tokens_to_rows` (and their context lines)."""
+    table = ContextTable(contexts) if contexts else None
+    return [
+        Token(
+            path=path,
+            source_id=source_id,
+            token_index=token_index,
+            pua=pua,
+            unicode_form=unicode_form,
+            yale=yale,
+            is_note=is_note,
+            tagged_form=tagged_form,
+            context_id=context_id,
+            contexts=table if context_id is not None else None,
+        )
+        for (source_id, token_index, pua, unicode_form, yale, is_note, tagged_form, context_id) in rows
+    ]
+
+
+class TokenCache:
+    """
+    Directory of per-file token cache entries.
+
+    Usage:
+
+        cache = TokenCache(DEFAULT_CACHE_DIR)
+        tokens = cache.load(path, encoding="utf-16", displaycontext="n")
+        if tokens is None:
+            tokens = ...  # parse, convert and tag
+            cache.store(path, tokens, encoding="utf-16", displaycontext="n")
+    """
+
+    def __init__(self, directory: str | Path = DEFAULT_CACHE_DIR) -> None:
+        self.directory = Path(directory)
+        self.resources = resource_digests()
+        self.hits = 0
+        self.misses = 0
+
+    def entry_path(self, path: str | Path) -> Path:
+        name = hashlib.sha1(str(Path(path).resolve()).encode("utf-8")).hexdigest()
+        return self.directory / "tokens" / f"{name}.bin"
+
+    def _key(self, digest: str, encoding: str, displaycontext: str) -> tuple:
+        # The backend is read here rather than in __init__, since --converter is applied after the cache is opened.
+        converter = (get_backend(), converter_version())
+        return (CACHE_FORMAT_VERSION, digest, encoding.lower(), displaycontext.strip().lower(), self.resources, converter)
+
+    def _read(self, path: str | Path, *, encoding: str, displaycontext: str, with_rows: bool) -> tuple[bool, tuple | None]:
+        """Check the entry for `path`; return (valid, (rows, contexts)) where the payload is only read if requested."""
+        entry = self.entry_path(path)
+        try:
+            st = os.stat(path)
+            with open(entry, "rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    raise ValueError("not a cache entry")
+                header = pickle.load(f)
+
+                # Same size and mtime: trust the stored digest instead of re-hashing.
+                if header["stat"] == (st.st_size, st.st_mtime_ns):
+                    digest = header["key"][1]
+                else:
+                    digest = file_digest(path)
+
+                if header["key"] != self._key(digest, encoding, displaycontext):
+                    return False, None
+
+                payload = pickle.loads(zlib.decompress(f.read())) if with_rows else None
+        except (OSError, EOFError, ValueError, KeyError, IndexError, pickle.UnpicklingError, zlib.error):
+            # Missing, unreadable or corrupt entries are simply rebuilt.
+            return False, None
+
+        return True, payload
+
+    def is_fresh(self, path: str | Path, *, encoding: str, displaycontext: str) -> bool:
+        """Return True if `path` has a valid entry, without loading its tokens."""
+        valid, _ = self._read(path, encoding=encoding, displaycontext=displaycontext, with_rows=False)
+        return valid
+
+    def load(self, path: str | Path, *, encoding: str, displaycontext: str) -> list[Token] | None:
+        """Return cached tokens for `path`, or None if there is no valid entry."""
+        valid, payload = self._read(path, encoding=encoding, displaycontext=displaycontext, with_rows=True)
+        if not valid:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        rows, contexts = payload
+        return rows_to_tokens(path, rows, contexts)
+
+    def store(self, path: str | Path, tokens: list[Token], *, encoding: str, displaycontext: str) -> None:
+        """Write (or replace) the cache entry for `path`."""
+        self.store_rows(path, tokens_to_rows(tokens), tokens_contexts(tokens), encoding=encoding, displaycontext=displaycontext)
+
+    def store_rows(self, path: str | Path, rows: list[tuple], contexts: list[str], *, encoding: str, displaycontext: str) -> None:
+        """Like `store`, for rows already produced by `tokens_to_rows` (and `tokens_contexts`)."""
+        st = os.stat(path)
+        header = {
+            "key": self._key(file_digest(path), encoding, displaycontext),
+            "stat": (st.st_size, st.st_mtime_ns),
+        }
+        payload = zlib.compress(pickle.dumps((rows, contexts), protocol=pickle.HIGHEST_PROTOCOL))
+
+        entry = self.entry_path(path)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary file first so that an interrupted run never leaves a half-written entry.
+        tmp = entry.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.write(payload)
+        os.replace(tmp, entry)
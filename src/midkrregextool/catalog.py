@@ -0,0 +1,253 @@
+# catalog.py
+
+"""
+Catalog of input files and their metadata, so that files can be filtered before they are read.
+
+For every input file the catalog records:
+
+    path, format (txt / xml), size, mtime,
+    title and date (XML: <title>, <date>), century (from the date),
+    source (XML: the title; TXT: the book part of the first source tag, e.g. "釋詳3"),
+    tokens (known once the file has been ingested).
+
+Metadata is read cheaply: XML files are read with iterparse up to their first <sent>
+(the header only), TXT files up to their first source tag. The catalog is saved as
+JSON next to the token cache (`catalog.json`) and refreshed incrementally: a file is
+only looked at again when its size or mtime changed, so --period / --title / --source
+filters cost one stat() per file once the catalog exists.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+CATALOG_FORMAT_VERSION = 1
+CATALOG_FILE = "catalog.json"
+
+FORMATS = {".txt": "txt", ".xml": "xml"}
+
+# TXT files: only look for the first source tag in this many lines.
+TXT_HEADER_LINES = 50
+
+
+@dataclass
+class CatalogEntry:
+    path: str                       # resolved path
+    format: str                     # "txt" or "xml"
+    size: int
+    mtime_ns: int
+    title: str | None = None
+    date: str | None = None
+    century: int | None = None
+    source: str | None = None
+    tokens: int | None = None       # set once the file has been ingested
+    encoding: str | None = None     # TXT only: encoding the header was read with
+
+
+def convert_to_century(year: str) -> int | None:
+    year = (year or "").strip()
+    if not year:
+        return None
+
+    digits = "".join(ch for ch in year if ch.isdigit())
+    if not digits:
+        return None
+
+    y = int(digits)
+
+    # If the input is in the century format already
+    if y < 20:
+        return y
+
+    # If the input is in the year format
+    else:
+        return (y - 1) // 100 + 1
+
+
+def read_xml_header(path: Path) -> tuple[str | None, str | None]:
+    """
+    Return (title, date) of a NIKL-style XML file, reading it only up to its first <sent>.
+
+    Raises ET.ParseError for malformed XML before that point.
+    """
+    import xml.etree.ElementTree as ET
+
+    title = date = None
+    with open(path, "rb") as f:
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            tag = elem.tag.rsplit("}", 1)[-1]      # ignore namespaces
+            if event == "start":
+                if tag == "sent":
+                    break
+                continue
+            if tag == "title" and title is None:
+                title = (elem.text or "").strip() or None
+            elif tag == "date" and date is None:
+                date = (elem.text or "").strip() or None
+            if title is not None and date is not None:
+                break
+    return title, date
+
+
+def read_txt_header(path: Path, encoding: str) -> str | None:
+    """Return the book part of the first source tag (e.g. "釋詳3" for <釋詳3:1a>), or None."""
+    from .parser import SOURCE_TAG_RE
+
+    try:
+        with open(path, encoding=encoding) as f:
+            for n, line in enumerate(f):
+                if n >= TXT_HEADER_LINES:
+                    break
+                m = SOURCE_TAG_RE.match(line.strip())
+                if m:
+                    return m.group(1).split(":", 1)[0]
+    except UnicodeError:
+        pass
+    return None
+
+
+def scan_file(path: Path, st: os.stat_result, *, encoding: str) -> CatalogEntry:
+    """Build the catalog entry of one file from its header."""
+    fmt = FORMATS[path.suffix.lower()]
+    entry = CatalogEntry(path=str(path.resolve()), format=fmt, size=st.st_size, mtime_ns=st.st_mtime_ns)
+
+    if fmt == "xml":
+        import xml.etree.ElementTree as ET
+        try:
+            entry.title, entry.date = read_xml_header(path)
+        except ET.ParseError as e:
+            print(f"[WARN] Could not read the XML header of {path}: {e}")
+        entry.source = entry.title
+        entry.century = convert_to_century(entry.date) if entry.date else None
+    else:
+        entry.encoding = encoding
+        entry.source = read_txt_header(path, encoding)
+
+    return entry
+
+
+class Catalog:
+    """File metadata, keyed by resolved path; saved to `path` (if given) as JSON."""
+
+    def __init__(self, path: Path | None = None) -> None:
+        self.path = path
+        self.entries: dict[str, CatalogEntry] = {}
+        self.dirty = False
+        self.scanned = 0        # files (re)scanned by the last refresh()
+        if path is not None:
+            self.load()
+
+    def load(self) -> None:
+        """Read the saved catalog; a missing, corrupt or outdated file gives an empty catalog."""
+        import json
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != CATALOG_FORMAT_VERSION:
+                return
+            self.entries = {e["path"]: CatalogEntry(**e) for e in data["files"]}
+        except (OSError, ValueError, KeyError, TypeError):
+            self.entries = {}
+
+    def save(self) -> None:
+        """Write the catalog back if anything changed."""
+        if self.path is None or not self.dirty:
+            return
+        import json
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": CATALOG_FORMAT_VERSION, "files": [asdict(e) for e in self.entries.values()]}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+    def refresh(self, files: list[Path], *, encoding: str) -> list[CatalogEntry]:
+        """Return the entries of `files` (in order), scanning only new or changed files."""
+        self.scanned = 0
+        result = []
+        for path in files:
+            st = path.stat()
+            entry = self.entries.get(str(path.resolve()))
+            if (
+                entry is None
+                or entry.size != st.st_size
+                or entry.mtime_ns != st.st_mtime_ns
+                or (entry.format == "txt" and entry.encoding != encoding)
+            ):
+                entry = scan_file(path, st, encoding=encoding)
+                self.entries[entry.path] = entry
+                self.scanned += 1
+                self.dirty = True
+            result.append(entry)
+        return result
+
+    def set_tokens(self, path: str | Path, tokens: int) -> None:
+        """Record the token count of an ingested file."""
+        entry = self.entries.get(str(Path(path).resolve()))
+        if entry is not None and entry.tokens != tokens:
+            entry.tokens = tokens
+            self.dirty = True
+
+
+def filter_files(
+        files: list[Path],
+        entries: list[CatalogEntry],
+        *,
+        period: str | None = None,
+        title: str | None = None,
+        source: str | None = None,
+) -> tuple[list[Path], list[Path]]:
+    """
+    Keep the files whose metadata matches every given filter.
+
+    - period: century (e.g. "15") or year (e.g. "1447"), compared by century,
+    - title / source: regular expressions searched in the title / source.
+
+    Returns (kept files, files without a date that were dropped by the period filter).
+    """
+    century = convert_to_century(period) if period is not None else None
+    title_rx = re.compile(title) if title is not None else None
+    source_rx = re.compile(source) if source is not None else None
+
+    kept: list[Path] = []
+    undated: list[Path] = []
+    for path, e in zip(files, entries):
+        if period is not None:
+            if e.century is None:
+                undated.append(path)
+                continue
+            if e.century != century:
+                continue
+        if title_rx is not None and not (e.title and title_rx.search(e.title)):
+            continue
+        if source_rx is not None and not (e.source and source_rx.search(e.source)):
+            continue
+        kept.append(path)
+    return kept, undated
+
+
+def format_catalog(files: list[Path], entries: list[CatalogEntry]) -> list[str]:
+    """Catalog entries as the lines of an aligned table."""
+    from .kwic import text_width
+
+    rows = [["file", "format", "date", "century", "tokens", "size", "source", "title"]]
+    for path, e in zip(files, entries):
+        rows.append([
+            str(path), e.format, e.date or "", "" if e.century is None else str(e.century),
+            "" if e.tokens is None else str(e.tokens), str(e.size), e.source or "", e.title or "",
+        ])
+    widths = [max(text_width(r[i]) for r in rows) for i in range(len(rows[0]))]
+    right = {3, 4, 5}       # numeric columns
+    lines = []
+    for n, r in enumerate(rows):
+        cells = []
+        for i, (cell, w) in enumerate(zip(r, widths)):
+            pad = " " * (w - text_width(cell))
+            cells.append(pad + cell if i in right else cell + pad)
+        lines.append("  ".join(cells).rstrip())
+        if n == 0:
+            lines.append("-" * (sum(widths) + 2 * (len(widths) - 1)))
+    return lines
@@ -3,28 +3,59 @@
 from __future__ import annotations
 
 import argparse                 # To avoid positional arguments
+import re
 import sys
 from dataclasses import dataclass
 from pathlib import Path                    # is_file(), is_dir()
-from collections import Counter
-
-from midkrregextool.parser import parse_file    
-from midkrregextool.model import Token
-from midkrregextool.yale import attach_yale
-from midkrregextool.search import search_tokens
-from midkrregextool.report import report_hits, maybe_save_hits
-from midkrregextool.tagger import tag_tokens, load_infl_suffixes, update_suffix_counter, finalize_suffix_proposals, dump_known_lemmas, display_lemma_candidates, display_suffix_candidates, load_lemma_whitelist
-import re
-import xml.etree.ElementTree as ET
+from typing import TYPE_CHECKING
+
+from midkrregextool import profiling
+from midkrregextool.cache import DEFAULT_CACHE_DIR
+from midkrregextool.aggregate import DEFAULT_TOP, GROUP_KEYS
+from midkrregextool.export import EXPORT_FORMATS, format_from_path
+from midkrregextool.kwic import DEFAULT_WIDTH as DEFAULT_KWIC_WIDTH, parse_sort_keys
+from midkrregextool.yale import BACKENDS, DEFAULT_BACKEND
+
+# Everything else is imported by the function that needs it, so that --help and runs
+# that only read cached files do not pay for the server, the process pool or the converter.
+if TYPE_CHECKING:
+    from midkrregextool.cache import TokenCache
+    from midkrregextool.catalog import Catalog
+    from midkrregextool.corpus import Corpus
+    from midkrregextool.tagger import Tagger
 
 @dataclass(frozen=True)
 class CLIArgs:
     path: Path
-    pattern: str
+    pattern: str | None
     purpose: str | None
     period: str | None
+    title: str | None = None
+    source: str | None = None
     encoding: str = "utf-16"
     displaycontext: str = "n"
+    cache_dir: Path | None = DEFAULT_CACHE_DIR
+    converter: str = DEFAULT_BACKEND
+    jobs: int = 1
+    stream: bool = False
+    patterns_file: Path | None = None
+    serve: bool = False
+    catalog: bool = False           # "catalog" subcommand: list the files and their metadata
+    host: str | None = None         # None: server.DEFAULT_HOST / DEFAULT_PORT
+    port: int | None = None
+    socket: Path | None = None
+    profile: bool = False
+    profile_trace: Path | None = None
+    export: str | None = None       # "jsonl", "tsv" or "csv": write hits to `output` without prompting
+    output: Path | None = None
+    kwic: str | None = None         # show hits as a concordance sorted by these keys ("": corpus order; see kwic.py)
+    kwic_width: int = DEFAULT_KWIC_WIDTH
+    group_by: str | None = None     # count hits per group instead of listing them (see aggregate.py)
+    top: int = DEFAULT_TOP
+
+# Answers to "search within the previous results?" that combine the new search with the previous results
+# ("y" instead re-checks the previous hits against the new pattern, see search.filter_row_hits).
+COMBINE_OPS = {"and": "and", "or": "or", "not": "not", "then": "then"}
 
 @dataclass(frozen=True)
 class DebugOptions:
@@ -35,15 +66,34 @@ class DebugOptions:
 def build_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(
         prog="midkrregextool",
-        description="Parse Middle Korean text and run regex search."
+        description="Parse Middle Korean text and run regex search. Use \"midkrregextool serve ...\" to start a query server, or \"midkrregextool catalog ...\" to list the input files and their metadata."
     )
 
     p.add_argument("--path", type=Path, help="Input file or directory.")
-    p.add_argument("--pattern", type=str, default=None, help="Regex pattern to search over Yale-romanized Korean texts")
+    p.add_argument("--pattern", type=str, default=None, help="Regex pattern to search over Yale-romanized Korean texts, or a structured query such as \"lem=pwuthye infl~^si\"")
     p.add_argument("--purpose", type=str, default=None, help="User's purposes for the performed regex search")
     p.add_argument("--encoding", type=str, default="utf-16", help="File encoding (default: utf-16)")
     p.add_argument("--displaycontext", type=str, default = "n", help="Display context around matches (y/n), (default n)")
-    p.add_argument("--period", type=str, default=None, help="Filter by historical period")
+    p.add_argument("--period", type=str, default=None, help="Filter by historical period: a century (15) or a year (1447), matched against the file's date")
+    p.add_argument("--title", type=str, default=None, help="Only search files whose title (XML <title>) matches this regex")
+    p.add_argument("--source", type=str, default=None, help="Only search files whose source (XML title, or the book of the first TXT source tag, e.g. 釋詳3) matches this regex")
+    p.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR, help=f"Directory for cached preprocessed files (default: {DEFAULT_CACHE_DIR})")
+    p.add_argument("--no-cache", action="store_true", help="Always reprocess input files instead of using the cache")
+    p.add_argument("--jobs", type=int, default=1, help="Number of worker processes used to preprocess input files (default: 1)")
+    p.add_argument("--converter", choices=BACKENDS, default=DEFAULT_BACKEND, help=f"PUA -> Unicode/Yale conversion backend (default: {DEFAULT_BACKEND})")
+    p.add_argument("--patterns-file", type=Path, default=None, help="Tab-separated file of patterns (pattern, purpose, output) to run in one batch; replaces --pattern")
+    p.add_argument("--host", type=str, default=None, help="serve: address to listen on (default: 127.0.0.1)")
+    p.add_argument("--port", type=int, default=None, help="serve: port to listen on (default: 8765)")
+    p.add_argument("--socket", type=Path, default=None, help="serve: listen on this Unix socket instead of host/port")
+    p.add_argument("--export", choices=EXPORT_FORMATS, default=None, help="Write every hit to --output as JSONL, TSV or CSV (one row per hit, with all token fields and the context) instead of the interactive prompts; with --patterns-file, write each pattern's results in this format")
+    p.add_argument("--output", type=Path, default=None, help="File for --export (the format can also be taken from its extension: .jsonl, .tsv, .csv)")
+    p.add_argument("--kwic", type=str, nargs="?", const="", default=None, metavar="KEYS", help="Show hits as a keyword-in-context concordance, optionally sorted by comma-separated keys: L1, L2, ... (tokens to the left), R1, R2, ... (to the right), hit, lemma, infl (e.g. --kwic R1,L1)")
+    p.add_argument("--kwic-width", type=int, default=DEFAULT_KWIC_WIDTH, help=f"Context tokens shown on either side of a hit in the concordance (default: {DEFAULT_KWIC_WIDTH})")
+    p.add_argument("--group-by", choices=GROUP_KEYS, default=None, help="Count the hits per lemma, INFL suffix, tagged form, source id, file, period (century) or main text/note, and print the most frequent groups with their frequency per 10k tokens, instead of listing the hits")
+    p.add_argument("--top", type=int, default=DEFAULT_TOP, help=f"--group-by: number of groups printed, 0 for all (default: {DEFAULT_TOP}); --output always gets every group")
+    p.add_argument("--stream", action="store_true", help="Run a single search and print hits while the files are being read (constant memory, no interactive prompts)")
+    p.add_argument("--profile", action="store_true", help="Print the time, token counts, cache hit rates and allocations of each stage (parse, convert, tag, search, report) at the end of the run")
+    p.add_argument("--profile-trace", type=Path, default=None, help="Also write the profiled stages to this file as a Chrome trace (JSON); implies --profile")
 
     return p
 
@@ -52,6 +102,12 @@ def parse_cli_args(args: list[str] | None) -> CLIArgs:
     if args is None:
         args = sys.argv[1:]
 
+    # "serve" and "catalog" subcommands: same options, no --pattern needed
+    serve = bool(args) and args[0] == "serve"
+    catalog = bool(args) and args[0] == "catalog"
+    if serve or catalog:
+        args = args[1:]
+
     parser = build_parser()
     ns = parser.parse_args(args)
 
@@ -61,7 +117,40 @@ def parse_cli_args(args: list[str] | None) -> CLIArgs:
     if ns.path is None:
         print(f"[INFO] No --path provided. Running on the working directory: {path}")
 
-    if ns.pattern is None: raise SystemExit("[Error] --pattern is required.")
+    if ns.pattern is None and ns.patterns_file is None and not (serve or catalog): raise SystemExit("[Error] --pattern (or --patterns-file) is required.")
+
+    if ns.patterns_file is not None and ns.stream: raise SystemExit("[Error] --patterns-file cannot be combined with --stream.")
+
+    if ns.jobs < 1: raise SystemExit("[Error] --jobs must be at least 1.")
+
+    export = ns.export
+    if ns.output is not None:
+        if ns.patterns_file is not None: raise SystemExit("[Error] --output cannot be combined with --patterns-file (give the output files in the patterns file).")
+        if export is None:
+            export = format_from_path(ns.output)
+            if export is None: raise SystemExit(f"[Error] Cannot tell the export format from {ns.output}; use --export {{{','.join(EXPORT_FORMATS)}}}.")
+    elif export is not None and ns.patterns_file is None and not serve:
+        raise SystemExit("[Error] --export needs --output.")
+
+    if ns.kwic is not None:
+        if ns.stream or ns.patterns_file is not None: raise SystemExit("[Error] --kwic cannot be combined with --stream or --patterns-file.")
+        try:
+            parse_sort_keys(ns.kwic)
+        except ValueError as e:
+            raise SystemExit(f"[Error] --kwic: {e}")
+
+    if ns.kwic_width < 1: raise SystemExit("[Error] --kwic-width must be at least 1.")
+
+    if ns.group_by is not None and (ns.kwic is not None or ns.patterns_file is not None): raise SystemExit("[Error] --group-by cannot be combined with --kwic or --patterns-file.")
+
+    if ns.top < 0: raise SystemExit("[Error] --top must be 0 or more.")
+
+    for option, value in (("--title", ns.title), ("--source", ns.source)):
+        if value is not None:
+            try:
+                re.compile(value)
+            except re.error as e:
+                raise SystemExit(f"[Error] Invalid {option} regex {value!r}: {e}")
 
     return CLIArgs(
         path,
@@ -69,74 +158,86 @@ def parse_cli_args(args: list[str] | None) -> CLIArgs:
         purpose=ns.purpose,
         encoding=ns.encoding,
         displaycontext=ns.displaycontext,
-        period=ns.period
+        period=ns.period,
+        title=ns.title,
+        source=ns.source,
+        cache_dir=None if ns.no_cache else ns.cache_dir,
+        converter=ns.converter,
+        jobs=ns.jobs,
+        stream=ns.stream,
+        patterns_file=ns.patterns_file,
+        serve=serve,
+        catalog=catalog,
+        host=ns.host,
+        port=ns.port,
+        socket=ns.socket,
+        profile=ns.profile or ns.profile_trace is not None,
+        profile_trace=ns.profile_trace,
+        export=export,
+        output=ns.output,
+        kwic=ns.kwic,
+        kwic_width=ns.kwic_width,
+        group_by=ns.group_by,
+        top=ns.top,
     )
 
 # Input-file-collecting function
 
-def collect_input_files(path: Path, period: str | None) -> list[Path]:
+def collect_input_files(path: Path) -> list[Path]:
+    """All .txt/.xml files under `path`; filtering by metadata is done on the catalog (see catalog.py)."""
 
     if path.is_file():
         return [path]
-    
+
     if path.is_dir():
-        # When filtering by periods
-        if period is not None:
-            period_in_century = convert_to_century(period) # Guard clause
-            matched_files: list[Path] = []
-            for file in path.iterdir():
-                if file.suffix.lower() != ".txt" and file.suffix.lower() != ".xml":
-                    continue
-                if file.suffix.lower() == ".xml":
-                    root = ET.parse(file).getroot()
-                    published_year = (root.findtext(".//date")).strip()
-                    published_century = convert_to_century(published_year)
-                    if published_century == period_in_century:
-                        matched_files.append(file)
-                    else:
-                        continue
-            return sorted(matched_files)
-        else:
-            return sorted([*path.rglob("*.txt"),*path.rglob("*.xml")])
-    
+        return sorted([*path.rglob("*.txt"),*path.rglob("*.xml")])
+
     return []
 
-def convert_to_century(year: str) -> int | None:
-    year = (year or "").strip()
-    if not year:
-        return None
+def select_files(args: CLIArgs, files: list[Path], catalog: Catalog) -> list[Path]:
+    """Apply --period / --title / --source using the catalog, without opening files already catalogued."""
+    from midkrregextool.catalog import filter_files
 
-    digits = "".join(ch for ch in year if ch.isdigit())
-    if not digits:
-        return None
+    # Without filters no metadata is needed, so no file is opened for it.
+    if args.period is None and args.title is None and args.source is None:
+        return files
 
-    y = int(digits)
+    entries = catalog.refresh(files, encoding=args.encoding)
+    kept, undated = filter_files(files, entries, period=args.period, title=args.title, source=args.source)
 
-    # If the input is in the century format already
-    if y < 20:
-        return y
-    
-    # If the input is in the year format
-    else:
-        return (y - 1) // 100 + 1
+    if undated:
+        print(f"[WARN] Skipped {len(undated)} file(s) without a date for --period (e.g. {undated[0]})")
+    print(f"[INFO] Catalog: {len(kept)} of {len(files)} files selected ({catalog.scanned} scanned)")
+    return kept
 
 def run(args: CLIArgs) -> None:
     
     # Assigning objects to arguments
-    pattern = args.pattern
-    purpose = args.purpose
-    encoding = args.encoding
-    displaycontext = args.displaycontext
-    period = args.period
-    bigram_flag = " " in pattern
-    files = collect_input_files(args.path,period)
+    files = collect_input_files(args.path)
 
     # No input files found
     if not files:
         print(f"[INFO] No .txt files found under: {args.path}\n")
         print(f"[INFO] No supported files found under: {args.path} (expected: .txt, .xml)") 
         return
-    
+
+    from midkrregextool.catalog import CATALOG_FILE, Catalog
+
+    # File metadata (title, date, source, token count), kept next to the token cache.
+    catalog = Catalog(args.cache_dir / CATALOG_FILE if args.cache_dir is not None else None)
+
+    if args.catalog:
+        show_catalog(files, catalog, encoding=args.encoding)
+        save_catalog(catalog)
+        return
+
+    # --period / --title / --source
+    files = select_files(args, files, catalog)
+    if not files:
+        save_catalog(catalog)
+        print(f"[INFO] No files under {args.path} match the given filters.")
+        return
+
     # Debug mode?
     debug = DebugOptions(
         suffix_proposals = False,
@@ -147,86 +248,467 @@ def run(args: CLIArgs) -> None:
 
     batch_mode = (len(files) > 1)
 
+    from midkrregextool.cache import TokenCache
+    from midkrregextool.resources import load_resources
+    from midkrregextool.tagger import Tagger
+    from midkrregextool.yale import get_conversion_cache, set_backend
+
+    # Suffix and lemma lists (longest first) and their tries, precompiled in resources.bin.
+    resources = load_resources()
+    infl_suffixes = resources.infl_suffixes
+    lemma_list = resources.lemma_list
+
+    # One compiled tagger (and its per-form memo) shared by tagging and lemma/suffix discovery.
+    tagger = Tagger.from_resources(resources)
+
+    cache = TokenCache(args.cache_dir) if args.cache_dir is not None else None
+
+    set_backend(args.converter)
+
+    # Word-type conversion cache, shared by all files and kept between runs next to the token cache.
+    # It is read when the first form is converted, so fully cached runs skip it.
+    vocab = get_conversion_cache()
+    vocab_path = args.cache_dir / "vocab.bin" if args.cache_dir is not None else None
+    if vocab_path is not None:
+        vocab.load_on_first_use(vocab_path)
+
+    if args.profile:
+        profiling.enable()
+
+    try:
+        if args.serve:
+            serve_corpus(args, files, infl_suffixes=infl_suffixes, lemma_list=lemma_list, tagger=tagger, cache=cache, catalog=catalog)
+            return
+        if args.patterns_file is not None:
+            batch_search(args, files, infl_suffixes=infl_suffixes, lemma_list=lemma_list, tagger=tagger, cache=cache, catalog=catalog)
+            return
+        if args.group_by is not None:
+            group_search(args, files, infl_suffixes=infl_suffixes, lemma_list=lemma_list, tagger=tagger, cache=cache, catalog=catalog)
+            return
+        if args.export is not None:
+            export_search(args, files, infl_suffixes=infl_suffixes, lemma_list=lemma_list, tagger=tagger, cache=cache, catalog=catalog)
+            return
+        if args.stream:
+            stream_search(args, files, infl_suffixes=infl_suffixes, lemma_list=lemma_list, tagger=tagger)
+            return
+        search_loop(args, files, infl_suffixes=infl_suffixes, lemma_list=lemma_list, tagger=tagger, cache=cache, catalog=catalog, debug=debug, debug_mode=debug_mode)
+    finally:
+        save_catalog(catalog)
+
+        if vocab.hits or vocab.misses:
+            print(f"[INFO] Yale conversion cache: {vocab.stats()}")
+        if vocab_path is not None and vocab.misses:
+            try:
+                vocab.save(vocab_path)
+            except OSError as e:
+                print(f"[WARN] Could not save conversion cache to {vocab_path}: {e}")
+
+        profiler = profiling.disable()
+        if profiler is not None:
+            print(profiler.format_summary())
+            if args.profile_trace is not None:
+                profiler.write_trace(args.profile_trace)
+                print(f"[INFO] Profile trace saved to: {args.profile_trace}")
+
+
+def show_catalog(files: list[Path], catalog: Catalog, *, encoding: str) -> None:
+    """The "catalog" subcommand: print the metadata of every input file."""
+    from midkrregextool.catalog import format_catalog
+
+    entries = catalog.refresh(files, encoding=encoding)
+    for line in format_catalog(files, entries):
+        print(line)
+    print(f"[INFO] {len(files)} files ({catalog.scanned} scanned)")
+
+def save_catalog(catalog: Catalog) -> None:
+    try:
+        catalog.save()
+    except OSError as e:
+        print(f"[WARN] Could not save the file catalog to {catalog.path}: {e}")
+
+def record_token_counts(catalog: Catalog, corpus: Corpus) -> None:
+    """Store the token count of each ingested file in the catalog."""
+    for file_path, start, end in corpus.files:
+        catalog.set_tokens(file_path, end - start)
+
+
+def serve_corpus(
+        args: CLIArgs,
+        files: list[Path],
+        *,
+        infl_suffixes: list[str],
+        lemma_list: list[str],
+        tagger: Tagger,
+        cache: TokenCache | None,
+        catalog: Catalog,
+) -> None:
+    """Load the files once and answer search requests until interrupted (see server.py)."""
+    from midkrregextool.pipeline import load_corpus
+    from midkrregextool.server import DEFAULT_HOST, DEFAULT_PORT, QueryService, make_server
+
+    host = args.host if args.host is not None else DEFAULT_HOST
+    port = args.port if args.port is not None else DEFAULT_PORT
+
+    corpus = load_corpus(files, encoding=args.encoding, displaycontext=args.displaycontext, infl_suffixes=infl_suffixes, lemma_list=lemma_list, jobs=args.jobs, cache=cache, tagger=tagger)
+    record_token_counts(catalog, corpus)
+
+    service = QueryService(corpus)
+    server = make_server(service, host=host, port=port, socket_path=args.socket)
+    where = args.socket if args.socket is not None else f"http://{host}:{server.server_address[1]}"
+    print(f"[INFO] Serving {len(corpus.files)} files ({len(corpus)} tokens) on {where} (Ctrl+C to stop)", flush=True)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("[INFO] Server stopped.")
+    finally:
+        server.server_close()
+        if args.socket is not None and args.socket.exists():
+            args.socket.unlink()
+
+
+def batch_search(
+        args: CLIArgs,
+        files: list[Path],
+        *,
+        infl_suffixes: list[str],
+        lemma_list: list[str],
+        tagger: Tagger,
+        cache: TokenCache | None,
+        catalog: Catalog,
+) -> None:
+    """Run every pattern of --patterns-file over the files, ingesting each file once (see batch.py)."""
+    from midkrregextool.batch import format_summary, load_patterns_file, print_summary, run_batch, write_summary
+    from midkrregextool.pipeline import load_corpus
+
+    queries = load_patterns_file(args.patterns_file)
+    if not queries:
+        print(f"[INFO] No patterns found in: {args.patterns_file}")
+        return
 
-    c = Counter()
+    corpus = load_corpus(files, encoding=args.encoding, displaycontext=args.displaycontext, infl_suffixes=infl_suffixes, lemma_list=lemma_list, jobs=args.jobs, cache=cache, tagger=tagger)
+    record_token_counts(catalog, corpus)
 
-    if debug.dump_lemma_seed:
-        lemma_counter: Counter[str] = Counter()
+    print(f"[INFO] Running {len(queries)} patterns over {len(corpus.files)} files ({len(corpus)} tokens)")
+    counts = run_batch(corpus, queries, export_format=args.export)
 
-    infl_suffixes = load_infl_suffixes()
-    lemmas = load_lemma_whitelist()
-    lemma_list = sorted(lemmas, key=len, reverse=True)
+    rows = format_summary(corpus, queries, counts)
+    print()
+    print_summary(rows)
 
-    # debug loop
+    summary_path = args.patterns_file.with_name(f"{args.patterns_file.stem}_summary.tsv")
+    write_summary(summary_path, rows)
+    print(f"[INFO] Summary saved to: {summary_path}")
 
-    if debug_mode == True:
 
-        for file_path in files:
+def export_search(
+        args: CLIArgs,
+        files: list[Path],
+        *,
+        infl_suffixes: list[str],
+        lemma_list: list[str],
+        tagger: Tagger,
+        cache: TokenCache | None,
+        catalog: Catalog,
+) -> None:
+    """
+    Run --pattern once and write all hits to --output as --export (see export.py), without prompts.
+
+    With --stream, hits are written while the files are being read; otherwise the files
+    are loaded into a corpus first (using the cache).
+    """
+    from midkrregextool.export import export_hits, export_row_hits
+
+    # No prompt here: warn as the batch mode does (see batch.run_batch).
+    if args.output.exists():
+        print(f"[WARN] Overwriting existing file: {args.output}")
+
+    if args.stream:
+        from midkrregextool.pipeline import stream_file
+        from midkrregextool.search import iter_search_tokens
+
+        def hits():
+            for file_path in files:
+                tokens = stream_file(file_path, encoding=args.encoding, displaycontext=args.displaycontext, infl_suffixes=infl_suffixes, lemma_list=lemma_list, tagger=tagger)
+                yield from iter_search_tokens(tokens, args.pattern)
+
+        # Streamed lines are not numbered, so their context ids are left out.
+        n = export_hits(args.output, hits(), fmt=args.export, context_ids=False)
+    else:
+        from midkrregextool.pipeline import load_corpus
+        from midkrregextool.search import search_corpus
 
-            tokens = attach_yale(parse_file(file_path,encoding=encoding,displaycontext=displaycontext))
+        corpus = load_corpus(files, encoding=args.encoding, displaycontext=args.displaycontext, infl_suffixes=infl_suffixes, lemma_list=lemma_list, jobs=args.jobs, cache=cache, tagger=tagger)
+        record_token_counts(catalog, corpus)
 
-            tokens = tag_tokens(tokens, infl_suffixes, lemma_list, debug_suffixes = debug.suffix_proposals)
+        row_hits = search_corpus(corpus, args.pattern)
+        if args.kwic is not None:
+            from midkrregextool.kwic import Concordance, export_concordance
+
+            # Concordance order, with the left and right context as extra columns
+            concordance = Concordance(corpus, row_hits, width=args.kwic_width)
+            concordance.sort(parse_sort_keys(args.kwic))
+            n = export_concordance(args.output, concordance, fmt=args.export)
+        else:
+            n = export_row_hits(args.output, corpus, row_hits, fmt=args.export)
 
-            if debug.suffix_proposals:
-                update_suffix_counter(c, tokens, infl_suffixes, max_len = 8, suffix_must_endwith=debug.suffix_must_endwith)
+    print(f"[INFO] pattern={args.pattern!r} hits={n} purposes={args.purpose!r}")
+    print(f"[INFO] Exported ({args.export}) to: {args.output}")
 
-            if debug.dump_lemma_seed:
-                for lem, cnt in dump_known_lemmas(tokens, infl_suffixes, lemma_list, top_k=50):
-                    lemma_counter[lem] += cnt
 
-        all_proposals = finalize_suffix_proposals(c, infl_suffixes, top_k=50, min_count = 1)
+def group_search(
+        args: CLIArgs,
+        files: list[Path],
+        *,
+        infl_suffixes: list[str],
+        lemma_list: list[str],
+        tagger: Tagger,
+        cache: TokenCache | None,
+        catalog: Catalog,
+) -> None:
+    """
+    Count the hits of --pattern per --group-by group and print the most frequent groups (see aggregate.py).
+
+    With --stream, hits are counted while the files are being read; otherwise the files
+    are loaded into a corpus first (using the cache). With --output, every group is also written out.
+    """
+    from midkrregextool.aggregate import count_corpus, count_tokens, export_counts, print_counts
+
+    if args.output is not None and args.output.exists():
+        print(f"[WARN] Overwriting existing file: {args.output}")
+
+    # Century of each file, for --group-by period
+    centuries = {str(path): entry.century for path, entry in zip(files, catalog.refresh(files, encoding=args.encoding))}
+
+    if args.stream:
+        from midkrregextool.pipeline import stream_file
+
+        def tokens():
+            for file_path in files:
+                yield from stream_file(file_path, encoding=args.encoding, displaycontext="n", infl_suffixes=infl_suffixes, lemma_list=lemma_list, tagger=tagger)
+
+        counts = count_tokens(tokens(), args.pattern, args.group_by, centuries=centuries)
+    else:
+        from midkrregextool.pipeline import load_corpus
+
+        corpus = load_corpus(files, encoding=args.encoding, displaycontext=args.displaycontext, infl_suffixes=infl_suffixes, lemma_list=lemma_list, jobs=args.jobs, cache=cache, tagger=tagger)
+        record_token_counts(catalog, corpus)
+
+        counts = count_corpus(corpus, args.pattern, args.group_by, centuries=centuries)
+
+    print(f"[INFO] pattern={args.pattern!r} purposes={args.purpose!r}")
+    print_counts(counts, top=args.top)
+
+    if args.output is not None:
+        n = export_counts(args.output, counts, fmt=args.export)
+        print(f"[INFO] Exported {n} groups ({args.export}) to: {args.output}")
+
+
+def stream_search(
+        args: CLIArgs,
+        files: list[Path],
+        *,
+        infl_suffixes: list[str],
+        lemma_list: list[str],
+        tagger: Tagger,
+) -> None:
+    """
+    One-shot search where parsing, conversion, tagging, search and report are chained generators.
+
+    Hits are printed as soon as they are found and nothing is kept afterwards,
+    so memory use does not grow with the size of the input.
+    """
+    from midkrregextool.pipeline import stream_file
+    from midkrregextool.report import report_hit_stream
+    from midkrregextool.search import is_ngram_pattern, iter_search_tokens
+
+    pattern = args.pattern
+    bigram_flag = is_ngram_pattern(pattern)
+    total = 0
+
+    for file_path in files:
+        print(f"[INFO] Searching in file: {file_path}")
+        print(f"[INFO] pattern={args.pattern!r} purposes={args.purpose!r}")
+        print("-" * 70)
+
+        # The stages are interleaved generators here, so the whole file is profiled as one stage.
+        with profiling.stage("stream", file=file_path) as st:
+            tokens = stream_file(file_path, encoding=args.encoding, displaycontext=args.displaycontext, infl_suffixes=infl_suffixes, lemma_list=lemma_list, tagger=tagger)
+            n = report_hit_stream(iter_search_tokens(tokens, pattern), bigram_flag)
+            st.count(matches=n)
+        total += n
+
+        print(f"[INFO] hits={n} in {file_path}")
+
+    if len(files) > 1:
+        print(f"[INFO] Total hits: {total}")
+
+
+def search_loop(
+        args: CLIArgs,
+        files: list[Path],
+        *,
+        infl_suffixes: list[str],
+        lemma_list: list[str],
+        tagger: Tagger,
+        cache: TokenCache | None,
+        catalog: Catalog,
+        debug: DebugOptions,
+        debug_mode: bool,
+) -> None:
+    from bisect import bisect_left
+
+    from midkrregextool.bitmap import Bitmap, HitSet
+    from midkrregextool.index import TrigramIndex
+    from midkrregextool.kwic import Concordance, print_concordance
+    from midkrregextool.pipeline import CorpusLoader, run_consumers
+    from midkrregextool.report import maybe_save_hits, report_row_hits
+    from midkrregextool.search import filter_row_hits, is_ngram_pattern, search_corpus
+    from midkrregextool.tagger import DiscoveryCounter, display_lemma_candidates, display_suffix_candidates, finalize_suffix_proposals
+
+    pattern = args.pattern
+    purpose = args.purpose
+
+    # Files are ingested once, in a single pass shared by every analysis of the session (see pipeline.run_consumers):
+    # lemma/suffix discovery in debug mode, and a columnar corpus with a trigram index,
+    # so that every search in this session only queries the index.
+    loader = CorpusLoader()
+    consumers = [loader]
+
+    # debug loop
+
+    if debug_mode == True:
+        discovery = DiscoveryCounter(
+            infl_suffixes, lemma_list, tagger=tagger,
+            suffix_proposals=debug.suffix_proposals, suffix_max_len=8, suffix_must_endwith=debug.suffix_must_endwith,
+            lemma_seed=debug.dump_lemma_seed, lemma_top_k=50,
+        )
+        consumers.append(discovery)
+
+    run_consumers(files, consumers, encoding=args.encoding, displaycontext=args.displaycontext, infl_suffixes=infl_suffixes, lemma_list=lemma_list, jobs=args.jobs, debug_suffixes=debug.suffix_proposals, cache=cache, tagger=tagger)
+
+    corpus = loader.corpus
+    record_token_counts(catalog, corpus)
+    index = TrigramIndex.from_corpus(corpus)
+
+    if debug_mode == True:
+
+        all_proposals = finalize_suffix_proposals(discovery.suffix_counter, infl_suffixes, top_k=50, min_count = 1)
 
         if debug.suffix_proposals:
             display_suffix_candidates(all_proposals)
 
         if debug.dump_lemma_seed:
-            display_lemma_candidates(lemma_counter)
+            display_lemma_candidates(discovery.lemma_counter)
     
     # Search loop
 
     within_result_search = "n"
 
+    # Current results as bitmaps over corpus rows, so that they can be combined with the next search
+    # without going back over the hits (see bitmap.py).
+    results: HitSet | None = None
+    boundaries: Bitmap | None = None
+
+    # Current results as a concordance (--kwic, or "sort ..." at the prompt); None: shown as usual
+    concordance: Concordance | None = None
+
+    def show_concordance(row_hits: list[tuple[int, ...]], keys: list[str]) -> Concordance:
+        conc = Concordance(corpus, row_hits, width=args.kwic_width)
+        conc.sort(keys)
+        print_concordance(conc)
+        return conc
+
+    another_prompt = "Do you want to run another search? Type Enter to continue, \"q\" to exit (or \"sort R1,L1\" to show the results as a sorted concordance): "
+
     while True:
 
         # Initial search or non-within-previous-results search
         if within_result_search == "n":
 
-            bigram_flag = " " in pattern
+            bigram_flag = is_ngram_pattern(pattern)
 
             all_hits = []
 
-            for file_path in files:
-                tokens = attach_yale(parse_file(file_path,encoding=encoding,displaycontext=displaycontext))
-
-                tokens = tag_tokens(tokens, infl_suffixes, lemma_list, debug_suffixes = debug.suffix_proposals)
+            row_hits = search_corpus(corpus, pattern, index=index)
+            results = HitSet.from_row_hits(row_hits)
+            concordance = None
 
+            # One concordance over all files
+            if args.kwic is not None:
+                print(f"[INFO] pattern={pattern!r} hits={len(row_hits)} purposes={purpose!r}")
+                print("-" * 70)
+                concordance = show_concordance(row_hits, parse_sort_keys(args.kwic))
+                all_hits = [corpus.views(rows) for rows in concordance.hits()]
 
-                hits = search_tokens(tokens, pattern)
+            # Hits come back in row order, i.e. grouped by file.
+            else:
+                for file_path, start, end in corpus.files:
+                    hits = row_hits[bisect_left(row_hits, (start,)):bisect_left(row_hits, (end,))]
 
-                print(f"[INFO] Searching in file: {file_path}")
-                print(f"[INFO] pattern={pattern!r} hits={len(hits)} purposes={purpose!r}")
-                print("-" * 70)
+                    print(f"[INFO] Searching in file: {file_path}")
+                    print(f"[INFO] pattern={pattern!r} hits={len(hits)} purposes={purpose!r}")
+                    print("-" * 70)
 
-                report_hits(hits, bigram_flag)
+                    report_row_hits(corpus, hits, bigram_flag)
 
-                all_hits.extend(hits)
+                    all_hits.extend(corpus.views(rows) for rows in hits)
         
-        # Search within previous results
-        elif within_result_search == "y":
-            original_hits = all_hits
-            all_hits = []
-            rx = re.compile(pattern)
-
-            for hit in original_hits:
-                joined = " ".join(tok.tagged_form for tok in hit)
-                if rx.search(joined):
-                    all_hits.append(hit)
-            print(f"[INFO] Searching within previous results")
+        # Search within / combine with previous results
+        elif within_result_search == "y" or within_result_search in COMBINE_OPS:
+
+            # Keep the previous hits whose tagged forms match the new pattern
+            if within_result_search == "y":
+                row_hits = filter_row_hits(corpus, row_hits, pattern)
+                results = HitSet.from_row_hits(row_hits)
+            else:
+                op = COMBINE_OPS[within_result_search]
+                other = HitSet.from_row_hits(search_corpus(corpus, pattern, index=index))
+
+                if op == "and":
+                    results = results & other
+                elif op == "or":
+                    results = results | other
+                elif op == "not":
+                    results = results - other
+                else:
+                    if boundaries is None:
+                        boundaries = Bitmap.from_rows(start for start, *_ in corpus.joined_segments())
+                    results = results.then(other, boundaries)
+                row_hits = results.row_hits()
+
+            all_hits = [corpus.views(rows) for rows in row_hits]
+            concordance = None
+
+            if within_result_search == "y":
+                print(f"[INFO] Searching within previous results")
+            else:
+                print(f"[INFO] Combining with previous results: {op.upper()}")
             print(f"[INFO] pattern={pattern!r} hits={len(all_hits)} purposes={purpose!r}")
-            report_hits(all_hits,bigram_flag)
+            if args.kwic is not None:
+                concordance = show_concordance(row_hits, parse_sort_keys(args.kwic))
+                all_hits = [corpus.views(rows) for rows in concordance.hits()]
+            else:
+                report_row_hits(corpus, row_hits)
 
         # Ask if another search is to be performed
-        another_search = input("Do you want to run another search? Type Enter to continue, \"q\" to exit: ").strip().lower()
+        another_search = input(another_prompt).strip().lower()
+
+        # "sort KEYS": show the current results as a concordance sorted by KEYS (see kwic.py); the sort keys are
+        # computed once per concordance, so re-sorting the same results again is immediate.
+        while another_search.startswith("sort"):
+            try:
+                keys = parse_sort_keys(another_search[len("sort"):])
+            except ValueError as e:
+                print(f"[WARN] {e}")
+            else:
+                if concordance is None:
+                    concordance = show_concordance(row_hits, keys)
+                else:
+                    concordance.sort(keys)
+                    print_concordance(concordance)
+                all_hits = [corpus.views(rows) for rows in concordance.hits()]
+            another_search = input(another_prompt).strip().lower()
 
         # Guard for valid input
         if another_search not in ("","q"):
@@ -243,21 +725,21 @@ def run(args: CLIArgs) -> None:
             save_before_next = input("Do you want to save the current results before the next search? Type \"y\" if you want, otherwise press any keys: ").strip().lower()
 
             if save_before_next == "y":
-                maybe_save_hits(all_hits, pattern=pattern, purpose=purpose)
+                maybe_save_hits(all_hits, pattern=pattern, purpose=purpose, lines=concordance.lines() if concordance is not None else None)
 
             # Ask if within-previous-results search is desired
-            within_result_search = input("Do you want to search within the previous results? Type \"y\" or \"n\": ").strip().lower()
+            within_result_search = input("Do you want to search within the previous results? Type \"y\" or \"n\" (or \"and\", \"or\", \"not\", \"then\" to combine with them): ").strip().lower()
 
             # Guard for valid input
-            if within_result_search not in ("y","n"):
-                within_result_search = input("Please type 'y' or 'n': ").strip().lower()
+            if within_result_search not in ("n", "y", *COMBINE_OPS):
+                within_result_search = input("Please type 'y', 'n', 'and', 'or', 'not' or 'then': ").strip().lower()
             pattern = input("Enter new regex pattern: ").strip("\"")
             purpose = input("Enter purpose for the new search (or press Enter if you wish to maintain the purpose of the previous search): ").strip()
 
 
     # After all searches are done, ask to save the results
 
-    maybe_save_hits(all_hits, pattern=pattern, purpose=purpose)
+    maybe_save_hits(all_hits, pattern=pattern, purpose=purpose, lines=concordance.lines() if concordance is not None else None)
 
 
 
@@ -0,0 +1,256 @@
+# corpus.py
+
+"""
+Columnar, interned token store.
+
+A `Token` object costs a few hundred bytes, and every token keeps its own
+references to the path, source id, note label and context of its line. For a
+whole corpus, `Corpus` stores the same information as parallel integer arrays
+(one entry per token) pointing into interned value tables, so that each
+distinct path, source id, form or context is stored only once:
+
+    row  path  source  token_index  note  pua  unicode  yale  tagged  context
+    0    0     0       1            0     0    0        0     0       0
+    1    0     0       2            0     1    1        1     1       0
+    ...
+
+Rows are global token ids. Code that needs a token-like object for a single
+row (e.g. to print a hit) can use `corpus.view(row)`, which reads the columns
+on demand instead of copying them.
+"""
+
+from __future__ import annotations
+
+from array import array
+from pathlib import Path
+from typing import Hashable, Iterable, Iterator
+
+from .model import ContextTable, Token
+
+
+class StringTable:
+    """Interned values: each distinct value is stored once and referred to by its id."""
+
+    def __init__(self) -> None:
+        self.values: list = []
+        self._ids: dict[Hashable, int] = {}
+
+    def intern(self, value: Hashable) -> int:
+        i = self._ids.get(value)
+        if i is None:
+            i = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+    def id_of(self, value: Hashable) -> int | None:
+        return self._ids.get(value)
+
+    def __getitem__(self, i: int):
+        return self.values[i]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class TokenView:
+    """Read-only, Token-like view of one corpus row."""
+
+    __slots__ = ("corpus", "row")
+
+    def __init__(self, corpus: Corpus, row: int) -> None:
+        self.corpus = corpus
+        self.row = row
+
+    def __repr__(self) -> str:
+        return f"TokenView(row={self.row}, source_id={self.source_id!r}, token_index={self.token_index}, tagged_form={self.tagged_form!r})"
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, TokenView) and other.corpus is self.corpus and other.row == self.row
+
+    def __hash__(self) -> int:
+        return hash((id(self.corpus), self.row))
+
+    @property
+    def path(self) -> str | Path:
+        c = self.corpus
+        return c.paths[c.path_ids[self.row]]
+
+    @property
+    def source_id(self) -> str:
+        c = self.corpus
+        return c.sources[c.source_ids[self.row]]
+
+    @property
+    def token_index(self) -> int:
+        return self.corpus.token_indices[self.row]
+
+    @property
+    def is_note(self) -> str:
+        c = self.corpus
+        return c.notes[c.note_ids[self.row]]
+
+    @property
+    def pua(self) -> str:
+        c = self.corpus
+        return c.puas[c.pua_ids[self.row]]
+
+    @property
+    def unicode_form(self) -> str | None:
+        c = self.corpus
+        return c.unicodes[c.unicode_ids[self.row]]
+
+    @property
+    def yale(self) -> str | None:
+        c = self.corpus
+        return c.yales[c.yale_ids[self.row]]
+
+    @property
+    def tagged_form(self) -> str | None:
+        c = self.corpus
+        return c.tagged[c.tagged_ids[self.row]]
+
+    @property
+    def context_id(self) -> int | None:
+        i = self.corpus.context_ids[self.row]
+        return None if i < 0 else i
+
+    @property
+    def contexts(self) -> ContextTable:
+        return self.corpus.contexts
+
+    @property
+    def context(self) -> str | None:
+        i = self.context_id
+        if i is None:
+            return None
+        from .yale import context_text
+        return context_text(self.corpus.contexts, i)
+
+
+class Corpus:
+    """
+    Parallel columns of interned ids, one entry per token.
+
+    Usage:
+
+        corpus = Corpus()
+        for path, tokens in ingest_files(...):
+            corpus.add_file(path, tokens)   # the Token objects can be dropped afterwards
+
+        tok = corpus.view(0)
+        print(tok.source_id, tok.tagged_form)
+    """
+
+    def __init__(self) -> None:
+        # Interned value tables
+        self.paths = StringTable()
+        self.sources = StringTable()
+        self.notes = StringTable()
+        self.puas = StringTable()
+        self.unicodes = StringTable()
+        self.yales = StringTable()
+        self.tagged = StringTable()
+        # Contexts of all files, appended per source table (ids are remapped; -1 = no context)
+        self.contexts = ContextTable()
+        self._context_offsets: dict[int, tuple[ContextTable, int]] = {}
+
+        # Columns (ids into the tables above, except token_indices)
+        self.path_ids = array("i")
+        self.source_ids = array("i")
+        self.token_indices = array("i")
+        self.note_ids = array("i")
+        self.pua_ids = array("i")
+        self.unicode_ids = array("i")
+        self.yale_ids = array("i")
+        self.tagged_ids = array("i")
+        self.context_ids = array("i")
+
+        # (path, first row, end row) for every file added
+        self.files: list[tuple[str | Path, int, int]] = []
+
+        # Built on demand by joined_segments(), together with the number of rows it covers
+        self._joined: tuple[int, list[tuple[int, int, str, array]]] | None = None
+
+    def __len__(self) -> int:
+        return len(self.token_indices)
+
+    def add_tokens(self, tokens: Iterable[Token]) -> None:
+        """Append tokens as new rows."""
+        for t in tokens:
+            self.path_ids.append(self.paths.intern(t.path))
+            self.source_ids.append(self.sources.intern(t.source_id))
+            self.token_indices.append(t.token_index)
+            self.note_ids.append(self.notes.intern(t.is_note))
+            self.pua_ids.append(self.puas.intern(t.pua))
+            self.unicode_ids.append(self.unicodes.intern(t.unicode_form))
+            self.yale_ids.append(self.yales.intern(t.yale))
+            self.tagged_ids.append(self.tagged.intern(t.tagged_form))
+            self.context_ids.append(-1 if t.context_id is None else self._context_offset(t.contexts) + t.context_id)
+
+    def _context_offset(self, table: ContextTable) -> int:
+        """Offset of `table`'s entries in the corpus-wide context table (copied on first use)."""
+        entry = self._context_offsets.get(id(table))
+        if entry is None:
+            # Keep a reference to the table so that its id() cannot be reused while we hold it.
+            entry = self._context_offsets[id(table)] = (table, len(self.contexts))
+            self.contexts.raw.extend(table.raw)
+            self.contexts.rendered.update({entry[1] + i: text for i, text in table.rendered.items()})
+        return entry[1]
+
+    def add_file(self, path: str | Path, tokens: Iterable[Token]) -> None:
+        """Append the tokens of one file and record its row range."""
+        start = len(self)
+        self.add_tokens(tokens)
+        self.files.append((path, start, len(self)))
+        # The file's context table has been copied; let it go along with its tokens.
+        self._context_offsets.clear()
+
+    def view(self, row: int) -> TokenView:
+        return TokenView(self, row)
+
+    def views(self, rows: Iterable[int]) -> tuple[TokenView, ...]:
+        return tuple(TokenView(self, r) for r in rows)
+
+    def iter_views(self) -> Iterator[TokenView]:
+        for row in range(len(self)):
+            yield TokenView(self, row)
+
+    def same_segment(self, a: int, b: int) -> bool:
+        """True if rows a and b are in the same file and have the same is_note value."""
+        return self.path_ids[a] == self.path_ids[b] and self.note_ids[a] == self.note_ids[b]
+
+    def segments(self) -> Iterator[tuple[int, int]]:
+        """(start, end) row ranges of consecutive tokens in the same file with the same is_note value."""
+        n = len(self)
+        start = 0
+        for row in range(1, n + 1):
+            if row == n or not self.same_segment(row - 1, row):
+                yield start, row
+                start = row
+
+    def joined_segments(self) -> list[tuple[int, int, str, array]]:
+        """
+        (start, end, text, offsets) for every segment, where `text` is the segment's tagged forms
+        joined by single spaces and offsets[k] is where row start+k begins in `text`.
+
+        Built once and reused until more tokens are added.
+        """
+        if self._joined is None or self._joined[0] != len(self):
+            forms = self.tagged.values
+            ids = self.tagged_ids
+            joined = []
+            for start, end in self.segments():
+                text, offsets = join_forms([f"{forms[i]}" for i in ids[start:end]])
+                joined.append((start, end, text, offsets))
+            self._joined = (len(self), joined)
+        return self._joined[1]
+
+
+def join_forms(forms: list[str]) -> tuple[str, array]:
+    """Join forms with single spaces; also return the offset at which each form starts."""
+    offsets = array("i")
+    pos = 0
+    for form in forms:
+        offsets.append(pos)
+        pos += len(form) + 1
+    return " ".join(forms), offsets
@@ -0,0 +1,229 @@
+# export.py
+
+"""
+Machine-readable exports of search hits: JSONL, TSV or CSV, one row per hit.
+
+Unlike the text reports of report.py, which are meant to be read, these are meant
+to be loaded into pandas, R or a spreadsheet as they are:
+
+    pandas.read_json("hits.jsonl", lines=True)
+    pandas.read_csv("hits.tsv", sep="\\t", keep_default_na=False)
+    read.csv("hits.csv", encoding = "UTF-8")
+
+Columns (for an n-gram hit, the token fields of its tokens are joined by spaces):
+
+    path, source_id, is_note                    of the first token
+    token_index, token_end, n_tokens            span of the hit: first and last token_index, number of tokens
+    pua, unicode_form, yale, tagged_form        forms (unicode_form in NFC, as in the text reports)
+    context_id, context                         line / sentence of the first token (empty without --displaycontext y;
+                                                context_id is also empty for streamed hits, whose lines are not numbered)
+
+Rows are written while the hits are produced, through a large write buffer, and the
+files are always UTF-8 (with a header line for TSV and CSV).
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from . import profiling
+from .corpus import Corpus
+from .model import Token
+from .yale import context_text
+
+EXPORT_FORMATS = ("jsonl", "tsv", "csv")
+
+COLUMNS = (
+    "path", "source_id", "token_index", "token_end", "n_tokens", "is_note",
+    "pua", "unicode_form", "yale", "tagged_form", "context_id", "context",
+)
+
+# Bytes buffered before each write to disk
+EXPORT_BUFFER_SIZE = 1 << 20
+
+# Characters that would break a TSV row (replaced by spaces)
+_TSV_SPECIAL = re.compile(r"[\t\r\n]")
+
+
+def format_from_path(path: Path) -> str | None:
+    """Export format implied by a file name (hits.jsonl -> "jsonl"), or None."""
+    fmt = path.suffix.lower().lstrip(".")
+    return fmt if fmt in EXPORT_FORMATS else None
+
+
+class _NFC:
+    """NFC normalization, once per distinct form (forms are Zipfian, so most lookups hit)."""
+
+    def __init__(self) -> None:
+        self._forms: dict[str, str] = {}
+
+    def __call__(self, s: str | None) -> str | None:
+        if s is None:
+            return None
+        out = self._forms.get(s)
+        if out is None:
+            out = self._forms[s] = unicodedata.normalize("NFC", s)
+        return out
+
+
+def hit_records(hits: Iterable[tuple[Token, ...]], *, context_ids: bool = True) -> Iterator[tuple]:
+    """
+    One record (values in COLUMNS order) per hit, for hits given as Token tuples.
+
+    Pass context_ids=False for tokens that do not share one context table (streamed tokens,
+    see parser.iter_parse_file), whose context_id is not an id within the run.
+    """
+    nfc = _NFC()
+    for hit in hits:
+        a, b = hit[0], hit[-1]
+        context = context_text(a.contexts, a.context_id) if a.context_id is not None else None
+        ctx_id = a.context_id if context_ids else None
+        if len(hit) == 1:
+            yield (
+                str(a.path), a.source_id, a.token_index, a.token_index, 1, a.is_note,
+                a.pua, nfc(a.unicode_form), a.yale, a.tagged_form, ctx_id, context,
+            )
+        else:
+            yield (
+                str(a.path), a.source_id, a.token_index, b.token_index, len(hit), a.is_note,
+                " ".join(t.pua for t in hit),
+                " ".join(f"{nfc(t.unicode_form)}" for t in hit),
+                " ".join(f"{t.yale}" for t in hit),
+                " ".join(f"{t.tagged_form}" for t in hit),
+                ctx_id, context,
+            )
+
+
+def row_hit_records(corpus: Corpus, row_hits: Iterable[tuple[int, ...]]) -> Iterator[tuple]:
+    """Same as hit_records, for hits given as corpus rows; reads the columns directly instead of creating views."""
+    c = corpus
+    paths, sources, notes = c.paths.values, c.sources.values, c.notes.values
+    puas, yales, tagged = c.puas.values, c.yales.values, c.tagged.values
+    path_ids, source_ids, note_ids, indices = c.path_ids, c.source_ids, c.note_ids, c.token_indices
+    pua_ids, unicode_ids, yale_ids, tagged_ids, context_ids = c.pua_ids, c.unicode_ids, c.yale_ids, c.tagged_ids, c.context_ids
+
+    # NFC of each distinct unicode form, by its id
+    nfc = _NFC()
+    unicodes = c.unicodes.values
+    normalized: dict[int, str | None] = {}
+
+    def uni(row: int) -> str | None:
+        i = unicode_ids[row]
+        try:
+            return normalized[i]
+        except KeyError:
+            out = normalized[i] = nfc(unicodes[i])
+            return out
+
+    contexts = c.contexts
+    for rows in row_hits:
+        r = rows[0]
+        ctx_id = context_ids[r]
+        if ctx_id < 0:
+            ctx_id = context = None
+        else:
+            context = context_text(contexts, ctx_id)
+        if len(rows) == 1:
+            yield (
+                str(paths[path_ids[r]]), sources[source_ids[r]], indices[r], indices[r], 1, notes[note_ids[r]],
+                puas[pua_ids[r]], uni(r), yales[yale_ids[r]], tagged[tagged_ids[r]], ctx_id, context,
+            )
+        else:
+            yield (
+                str(paths[path_ids[r]]), sources[source_ids[r]], indices[r], indices[rows[-1]], len(rows), notes[note_ids[r]],
+                " ".join(puas[pua_ids[x]] for x in rows),
+                " ".join(f"{uni(x)}" for x in rows),
+                " ".join(f"{yales[yale_ids[x]]}" for x in rows),
+                " ".join(f"{tagged[tagged_ids[x]]}" for x in rows),
+                ctx_id, context,
+            )
+
+
+# Writers: each writes its records to an open text file and returns how many it wrote.
+#
+# Hits repeat the same paths, source ids, forms and contexts over and over, so each
+# distinct value is escaped once and the result reused (see _memoized).
+
+# Distinct values remembered by a writer before its memo is cleared
+_MEMO_LIMIT = 1 << 20
+
+def _memoized(convert):
+    """Wrap a cell conversion so that each distinct value is converted only once."""
+    memo: dict = {}
+
+    def cell(v):
+        out = memo.get(v)
+        if out is None:
+            if len(memo) >= _MEMO_LIMIT:
+                memo.clear()
+            out = memo[v] = convert(v)
+        return out
+    return cell
+
+def _write_jsonl(f, records: Iterable[tuple], columns: tuple[str, ...]) -> int:
+    from json.encoder import encode_basestring     # JSON string literal, non-ASCII kept as is
+
+    # One object per line, keys in column order (the same as json.dumps(dict(zip(columns, rec)), ensure_ascii=False))
+    template = "{" + ", ".join(f'"{c}": %s' for c in columns) + "}\n"
+    cell = _memoized(lambda v: "null" if v is None else encode_basestring(v) if isinstance(v, str) else str(v))
+    write = f.write
+    n = 0
+    for rec in records:
+        write(template % tuple(map(cell, rec)))
+        n += 1
+    return n
+
+def _tsv_cell(v) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, str):
+        return _TSV_SPECIAL.sub(" ", v)
+    return str(v)
+
+def _write_tsv(f, records: Iterable[tuple], columns: tuple[str, ...]) -> int:
+    cell = _memoized(_tsv_cell)
+    write = f.write
+    write("\t".join(columns) + "\n")
+    n = 0
+    for rec in records:
+        write("\t".join(map(cell, rec)))
+        write("\n")
+        n += 1
+    return n
+
+def _write_csv(f, records: Iterable[tuple], columns: tuple[str, ...]) -> int:
+    import csv
+
+    writer = csv.writer(f, lineterminator="\n")     # None is written as an empty field
+    writer.writerow(columns)
+    n = 0
+    writerow = writer.writerow
+    for rec in records:
+        writerow(rec)
+        n += 1
+    return n
+
+_WRITERS = {"jsonl": _write_jsonl, "tsv": _write_tsv, "csv": _write_csv}
+
+
+def write_records(path: Path, records: Iterable[tuple], *, fmt: str, columns: tuple[str, ...] = COLUMNS) -> int:
+    """Write records (see hit_records; values in `columns` order) to `path` as `fmt`; return the number of hits written."""
+    writer = _WRITERS.get(fmt)
+    if writer is None:
+        raise ValueError(f"Unknown export format {fmt!r} (expected one of: {', '.join(EXPORT_FORMATS)})")
+
+    with profiling.stage("write", file=path) as st, open(path, "w", encoding="utf-8", newline="", buffering=EXPORT_BUFFER_SIZE) as f:
+        n = writer(f, records, columns)
+        st.count(matches=n)
+    return n
+
+def export_hits(path: Path, hits: Iterable[tuple[Token, ...]], *, fmt: str, context_ids: bool = True) -> int:
+    """Export hits given as Token tuples (e.g. streamed from search.iter_search_tokens)."""
+    return write_records(path, hit_records(hits, context_ids=context_ids), fmt=fmt)
+
+def export_row_hits(path: Path, corpus: Corpus, row_hits: Iterable[tuple[int, ...]], *, fmt: str) -> int:
+    """Export hits given as corpus rows (see search.search_corpus)."""
+    return write_records(path, row_hit_records(corpus, row_hits), fmt=fmt)
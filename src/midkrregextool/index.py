@@ -0,0 +1,489 @@
+# index.py
+
+"""
+Trigram index over tagged forms, with a regex -> trigram query planner.
+
+This follows the approach of Google Code Search (Russ Cox, "Regular Expression
+Matching with a Trigram Index"):
+
+1. `plan_query(pattern)` walks the parsed regex and derives a boolean query
+   over trigrams that every matching string must satisfy, e.g.
+
+       "sini/INFL"       ->  "sin" AND "ini" AND "ni/" AND ...
+       "(ho|hy)si"       ->  ("hos" AND "osi") OR ("hys" AND "ysi")
+
+2. `TrigramIndex` maps each trigram to the distinct tagged forms containing it,
+   so the query selects a small set of candidate forms.
+
+3. Only the candidates are checked with the real regex (see search.py).
+
+The query is always a necessary condition, never a sufficient one: candidates
+are a superset of the true matches. Patterns that cannot be decomposed (e.g. "."
+or case-insensitive patterns) produce the ALL query, i.e. a full scan.
+"""
+
+from __future__ import annotations
+
+from array import array
+from dataclasses import dataclass, field
+from itertools import chain
+from typing import Iterable
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse   # Python 3.11+
+except ImportError:     # pragma: no cover
+    import sre_constants, sre_parse     # type: ignore[no-redef]
+
+from . import profiling
+from .corpus import Corpus
+from .model import Token
+
+# Limits that keep the analysis small; exceeding them only makes the query less selective.
+MAX_EXACT = 64      # exact strings tracked for a sub-pattern
+MAX_SET = 32        # prefix / suffix strings tracked for a sub-pattern
+MAX_CLASS = 8       # characters of a [...] class expanded into alternatives
+
+
+# ----------------------------------------------------------------------
+# Trigram queries
+# ----------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class Query:
+    """
+    Boolean query over trigrams.
+
+    op:
+        "ALL"   matches everything
+        "NONE"  matches nothing
+        "AND"   all `trigrams` present and all `subs` true
+        "OR"    any of `trigrams` present or any of `subs` true
+    """
+    op: str
+    trigrams: frozenset[str] = frozenset()
+    subs: tuple[Query, ...] = ()
+
+    def __str__(self) -> str:
+        if self.op in ("ALL", "NONE"):
+            return self.op
+        parts = [repr(t) for t in sorted(self.trigrams)] + [f"({s})" for s in self.subs]
+        return f" {self.op} ".join(parts)
+
+ALL = Query("ALL")
+NONE = Query("NONE")
+
+def q_and(a: Query, b: Query) -> Query:
+    if a.op == "NONE" or b.op == "NONE":
+        return NONE
+    if a.op == "ALL":
+        return b
+    if b.op == "ALL" or a == b:
+        return a
+    trigrams: set[str] = set()
+    subs: list[Query] = []
+    for q in (a, b):
+        if q.op == "AND":
+            trigrams |= q.trigrams
+            subs.extend(q.subs)
+        elif not q.subs and len(q.trigrams) == 1:
+            trigrams |= q.trigrams
+        else:
+            subs.append(q)
+    return Query("AND", frozenset(trigrams), tuple(dict.fromkeys(subs)))
+
+def q_or(a: Query, b: Query) -> Query:
+    if a.op == "ALL" or b.op == "ALL":
+        return ALL
+    if a.op == "NONE":
+        return b
+    if b.op == "NONE" or a == b:
+        return a
+    trigrams: set[str] = set()
+    subs: list[Query] = []
+    for q in (a, b):
+        if q.op == "OR":
+            trigrams |= q.trigrams
+            subs.extend(q.subs)
+        elif not q.subs and len(q.trigrams) == 1:
+            trigrams |= q.trigrams
+        else:
+            subs.append(q)
+    return Query("OR", frozenset(trigrams), tuple(dict.fromkeys(subs)))
+
+def trigrams_of(s: str) -> set[str]:
+    """
+    Trigrams of `s` that can be looked up in the index.
+
+    Trigrams containing whitespace are skipped: tagged forms never contain whitespace,
+    so a multi-word pattern only requires the trigrams inside each word.
+    """
+    return {s[i:i + 3] for i in range(len(s) - 2) if not any(ch.isspace() for ch in s[i:i + 3])}
+
+def strings_query(strings: Iterable[str]) -> Query:
+    """Query satisfied by any string that contains one of `strings`."""
+    q = NONE
+    for s in strings:
+        tri = trigrams_of(s)
+        if not tri:
+            return ALL      # a string without usable trigrams constrains nothing
+        q = q_or(q, Query("AND", frozenset(tri)) if len(tri) > 1 else Query("OR", frozenset(tri)))
+    return q
+
+
+# ----------------------------------------------------------------------
+# Regex analysis
+# ----------------------------------------------------------------------
+
+@dataclass
+class _Info:
+    """
+    What is known about the strings matched by a sub-pattern.
+
+    emptyable:  the sub-pattern can match ""
+    exact:      the complete set of matched strings, or None if unknown/too large
+    prefix:     every match starts with one of these (used when exact is None)
+    suffix:     every match ends with one of these (used when exact is None)
+    match:      a query every match satisfies
+    """
+    emptyable: bool
+    exact: set[str] | None
+    prefix: set[str] = field(default_factory=set)
+    suffix: set[str] = field(default_factory=set)
+    match: Query = ALL
+
+    def prefixes(self) -> set[str]:
+        return self.exact if self.exact is not None else self.prefix
+
+    def suffixes(self) -> set[str]:
+        return self.exact if self.exact is not None else self.suffix
+
+    def exact_query(self) -> Query:
+        """`match` strengthened with the exact strings, if any."""
+        if self.exact is None:
+            return self.match
+        return q_and(self.match, strings_query(self.exact))
+
+def _empty() -> _Info:
+    return _Info(True, {""})
+
+def _anything() -> _Info:
+    return _Info(True, None, {""}, {""})
+
+def _any_char() -> _Info:
+    return _Info(False, None, {""}, {""})
+
+def _cross(xs: set[str], ys: set[str]) -> set[str]:
+    return {x + y for x in xs for y in ys}
+
+def _shrink(strings: set[str], keep: slice) -> tuple[set[str], Query]:
+    """
+    Bound a prefix/suffix set: record its trigrams in a query and cut the strings down.
+
+    Shorter prefixes (suffixes) of valid prefixes (suffixes) are still valid.
+    """
+    if len(strings) <= MAX_SET:
+        return strings, ALL
+    q = strings_query(strings)
+    strings = {s[keep] for s in strings}
+    if len(strings) > MAX_SET:
+        strings = {""}
+    return strings, q
+
+def _concat(x: _Info, y: _Info) -> _Info:
+    match = q_and(x.match, y.match)
+
+    if x.exact is not None and y.exact is not None and len(x.exact) * len(y.exact) <= MAX_EXACT:
+        return _Info(x.emptyable and y.emptyable, _cross(x.exact, y.exact), match=match)
+
+    match = q_and(match, q_and(x.exact_query(), y.exact_query()))
+
+    # Strings spanning the boundary between x and y
+    xs, yp = x.suffixes(), y.prefixes()
+    if len(xs) * len(yp) <= MAX_SET:
+        match = q_and(match, strings_query(_cross(xs, yp)))
+
+    if x.exact is not None:
+        prefix = _cross(x.exact, yp) if len(x.exact) * len(yp) <= MAX_EXACT else set(x.exact)
+    else:
+        prefix = x.prefix | (yp if x.emptyable else set())
+
+    if y.exact is not None:
+        suffix = _cross(xs, y.exact) if len(xs) * len(y.exact) <= MAX_EXACT else set(y.exact)
+    else:
+        suffix = y.suffix | (xs if y.emptyable else set())
+
+    prefix, q1 = _shrink(prefix, slice(None, 2))
+    suffix, q2 = _shrink(suffix, slice(-2, None))
+    return _Info(x.emptyable and y.emptyable, None, prefix, suffix, q_and(match, q_and(q1, q2)))
+
+def _alternate(x: _Info, y: _Info) -> _Info:
+    if x.exact is not None and y.exact is not None and len(x.exact | y.exact) <= MAX_EXACT:
+        return _Info(x.emptyable or y.emptyable, x.exact | y.exact, match=q_or(x.match, y.match))
+
+    prefix, q1 = _shrink(x.prefixes() | y.prefixes(), slice(None, 2))
+    suffix, q2 = _shrink(x.suffixes() | y.suffixes(), slice(-2, None))
+    match = q_and(q_or(x.exact_query(), y.exact_query()), q_and(q1, q2))
+    return _Info(x.emptyable or y.emptyable, None, prefix, suffix, match)
+
+def _repeat(x: _Info, lo: int, hi: int) -> _Info:
+    if lo == 0 and hi == 1:
+        return _alternate(x, _empty())      # x?
+    if lo == 0:
+        return _anything()                  # x*: nothing is required
+    # x+ / x{m,n} with m >= 1: at least one copy, starting and ending the match
+    return _Info(x.emptyable, None, set(x.prefixes()), set(x.suffixes()), x.exact_query())
+
+def _char_class(items: list) -> _Info:
+    chars: set[str] = set()
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            chars.add(chr(av))
+        elif op is sre_constants.RANGE and av[1] - av[0] < MAX_CLASS:
+            chars.update(chr(c) for c in range(av[0], av[1] + 1))
+        else:
+            return _any_char()      # NEGATE, CATEGORY or a wide range
+        if len(chars) > MAX_CLASS:
+            return _any_char()
+    return _Info(False, chars)
+
+_REPEATS = tuple(
+    op for op in (
+        sre_constants.MAX_REPEAT,
+        sre_constants.MIN_REPEAT,
+        getattr(sre_constants, "POSSESSIVE_REPEAT", None),
+    ) if op is not None
+)
+
+def _analyze(subpattern) -> _Info:
+    info = _empty()
+    for op, av in subpattern:
+        info = _concat(info, _analyze_node(op, av))
+    return info
+
+def _analyze_node(op, av) -> _Info:
+    if op is sre_constants.LITERAL:
+        return _Info(False, {chr(av)})
+    if op is sre_constants.IN:
+        return _char_class(av)
+    if op in (sre_constants.ANY, sre_constants.NOT_LITERAL):
+        return _any_char()
+    if op is sre_constants.BRANCH:
+        alternatives = [_analyze(p) for p in av[1]]
+        info = alternatives[0]
+        for alt in alternatives[1:]:
+            info = _alternate(info, alt)
+        return info
+    if op is sre_constants.SUBPATTERN:
+        _, add_flags, _, p = av
+        if add_flags & sre_constants.SRE_FLAG_IGNORECASE:
+            return _anything()
+        return _analyze(p)
+    if op in _REPEATS:
+        lo, hi, p = av
+        return _repeat(_analyze(p), lo, hi)
+    if op is getattr(sre_constants, "ATOMIC_GROUP", None):
+        return _analyze(av)
+    if op in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+        return _empty()     # zero-width: constrains position, not content
+    # GROUPREF, GROUPREF_EXISTS, ...: could be anything
+    return _anything()
+
+def plan_query(pattern: str, flags: int = 0) -> Query:
+    """
+    Return a trigram query that every string matched by `pattern` satisfies.
+
+    ALL means that the pattern cannot be narrowed down and all forms must be scanned.
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except Exception:
+        return ALL
+    if parsed.state.flags & sre_constants.SRE_FLAG_IGNORECASE:
+        return ALL
+
+    info = _analyze(parsed)
+    if info.exact is not None:
+        return info.exact_query()
+    return q_and(info.match, q_and(strings_query(info.prefix), strings_query(info.suffix)))
+
+def literal_spaces(pattern: str, flags: int = 0) -> int:
+    """
+    Number of literal spaces a match of `pattern` goes through, outside character classes
+    (a space inside [^ ] or matched by \\s does not count).
+
+    Alternatives count as their branch with the most spaces, and repeated parts as many
+    times as their minimum repeat count. Raises re.error for an invalid pattern.
+    """
+    return _spaces(sre_parse.parse(pattern, flags))
+
+def _spaces(subpattern) -> int:
+    n = 0
+    for op, av in subpattern:
+        if op is sre_constants.LITERAL:
+            n += av == 0x20
+        elif op is sre_constants.SUBPATTERN:
+            n += _spaces(av[-1])
+        elif op is sre_constants.BRANCH:
+            n += max(_spaces(branch) for branch in av[1])
+        elif op in _REPEATS:
+            n += av[0] * _spaces(av[2])
+        elif op is getattr(sre_constants, "ATOMIC_GROUP", None):
+            n += _spaces(av)
+    return n
+
+
+# ----------------------------------------------------------------------
+# Index
+# ----------------------------------------------------------------------
+
+class TrigramIndex:
+    """
+    Trigram index over tagged forms.
+
+    Each distinct tagged form is indexed once; `positions[f]` lists the token positions
+    (list indices or corpus rows) that carry form `f`.
+
+    Build it with `TrigramIndex.from_tokens(tokens)` or `TrigramIndex.from_corpus(corpus)`.
+    """
+
+    def __init__(self, forms: list[str], positions: list[array], n_tokens: int) -> None:
+        self.forms = forms
+        self.positions = positions
+        self.n_tokens = n_tokens
+        self._tri_counts: dict[str, int] = {}
+
+        self.postings: dict[str, set[int]] = {}
+        for f, form in enumerate(self.forms):
+            for tri in trigrams_of(form):
+                self.postings.setdefault(tri, set()).add(f)
+
+    @classmethod
+    def from_tokens(cls, tokens: list[Token]) -> TrigramIndex:
+        form_ids: dict[str, int] = {}
+        forms: list[str] = []
+        positions: list[array] = []
+
+        for i, tok in enumerate(tokens):
+            form = tok.tagged_form or ""
+            f = form_ids.get(form)
+            if f is None:
+                f = form_ids[form] = len(forms)
+                forms.append(form)
+                positions.append(array("i"))
+            positions[f].append(i)
+
+        return cls(forms, positions, len(tokens))
+
+    @classmethod
+    def from_corpus(cls, corpus: Corpus) -> TrigramIndex:
+        with profiling.stage("index") as st:
+            # Tagged forms are already interned, so form ids are the corpus' tagged ids.
+            forms = [form or "" for form in corpus.tagged.values]
+            positions = [array("i") for _ in forms]
+            for row, f in enumerate(corpus.tagged_ids):
+                positions[f].append(row)
+            index = cls(forms, positions, len(corpus))
+            st.count(tokens=len(corpus), forms=len(forms))
+        return index
+
+    def candidate_forms(self, q: Query) -> set[int] | None:
+        """Ids of the forms that may satisfy `q`, or None for all forms."""
+        if q.op == "ALL":
+            return None
+        if q.op == "NONE":
+            return set()
+
+        postings = self.postings
+        empty: set[int] = set()
+
+        if q.op == "AND":
+            result: set[int] | None = None
+            for tri in sorted(q.trigrams, key=lambda t: len(postings.get(t, empty))):
+                s = postings.get(tri, empty)
+                result = set(s) if result is None else result & s
+                if not result:
+                    return set()
+            for sub in q.subs:
+                s = self.candidate_forms(sub)
+                if s is None:
+                    continue
+                result = s if result is None else result & s
+                if not result:
+                    return set()
+            return result
+
+        # OR
+        result = set()
+        for tri in q.trigrams:
+            result |= postings.get(tri, empty)
+        for sub in q.subs:
+            s = self.candidate_forms(sub)
+            if s is None:
+                return None
+            result |= s
+        return result
+
+    def token_positions(self, forms: Iterable[int]) -> list[int]:
+        """Sorted positions of all tokens carrying one of `forms`."""
+        return sorted(chain.from_iterable(self.positions[f] for f in forms))
+
+    def _trigram_token_count(self, tri: str) -> int:
+        counts = self._tri_counts
+        n = counts.get(tri)
+        if n is None:
+            n = counts[tri] = sum(len(self.positions[f]) for f in self.postings.get(tri, ()))
+        return n
+
+    def _token_estimate(self, q: Query) -> int:
+        """Rough upper bound on the number of tokens that can take part in a match of `q`."""
+        if q.op == "ALL":
+            return self.n_tokens
+        if q.op == "NONE":
+            return 0
+        estimates = [self._trigram_token_count(t) for t in q.trigrams] + [self._token_estimate(s) for s in q.subs]
+        if q.op == "AND":
+            return min(estimates, default=self.n_tokens)
+        return min(sum(estimates), self.n_tokens)
+
+    def candidate_windows(self, q: Query, size: int, *, max_fraction: float = 0.5) -> list[int] | None:
+        """
+        Start positions i of the windows of `size` tokens (i, ..., i+size-1) that may satisfy `q`,
+        or None for all windows.
+
+        A window satisfies a trigram if any of its tokens does (trigrams never span the space
+        between two tokens). For an AND, only the most selective part is used; the regex check
+        that follows is exact anyway. If the query would keep more than `max_fraction` of the
+        windows, None is returned and the caller simply checks every window.
+        """
+        if self._token_estimate(q) * size > self.n_tokens * max_fraction:
+            return None
+        windows = self._window_set(q, size)
+        if windows is None:
+            return None
+        return sorted(i for i in windows if 0 <= i <= self.n_tokens - size)
+
+    def _window_set(self, q: Query, size: int) -> set[int] | None:
+        if q.op == "ALL":
+            return None
+        if q.op == "NONE":
+            return set()
+
+        def trigram_windows(tri: str) -> set[int]:
+            positions = self.token_positions(self.postings.get(tri, ()))
+            return {p - k for p in positions for k in range(size)}
+
+        if q.op == "AND":
+            parts = [(self._trigram_token_count(t), t) for t in q.trigrams]
+            parts += [(self._token_estimate(sub), sub) for sub in q.subs]
+            _, best = min(parts, key=lambda x: x[0])
+            return trigram_windows(best) if isinstance(best, str) else self._window_set(best, size)
+
+        result: set[int] = set()
+        for tri in q.trigrams:
+            result |= trigram_windows(tri)
+        for sub in q.subs:
+            s = self._window_set(sub, size)
+            if s is None:
+                return None
+            result |= s
+        return result
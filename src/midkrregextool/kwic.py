@@ -0,0 +1,301 @@
+# kwic.py
+
+"""
+Keyword-in-context (KWIC) concordance of search hits.
+
+Each hit is printed on one line with up to `width` tokens of context on either side,
+the left context right-aligned so that the hits line up in one column:
+
+    釋詳3:1a   ...  pwuthye  nilGosya  <<nila>>  hosikwo  ...
+
+Context tokens are taken from the hit's segment (the same file, and main text or note,
+as in n-gram search), and shown in their Unicode form, as in the other reports.
+
+Concordances can be sorted by one or more keys (e.g. "R1,L1"):
+
+    L1, L2, ...     1st, 2nd, ... token to the left of the hit
+    R1, R2, ...     1st, 2nd, ... token to the right of the hit
+    hit             the hit (its first token)
+    lemma, infl     lemma / INFL suffix of the hit's first token (see tagger.parse_tagged_form)
+
+Tokens are compared by their Yale form; a missing neighbour (at the edge of a segment)
+sorts first, and ties keep corpus order.
+
+Sorting never compares strings: each distinct form gets its rank in sorted order
+once per corpus, and each key is an array holding one rank per hit, built the first
+time the key is used. A sort is then a few stable integer sorts, so even a large
+concordance can be re-sorted right away in the interactive loop.
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+import weakref
+from array import array
+from pathlib import Path
+from typing import Iterator, Sequence
+
+from . import profiling
+from .corpus import Corpus
+from .export import COLUMNS, row_hit_records, write_records
+
+# Context tokens shown on either side of a hit
+DEFAULT_WIDTH = 5
+
+SORT_KEYS = ("L<n>", "R<n>", "hit", "lemma", "infl")
+
+# Export columns of a concordance: the usual hit columns, then the context on either side
+KWIC_COLUMNS = COLUMNS + ("left", "right")
+
+_NEIGHBOUR_KEY_RE = re.compile(r"([LR])([1-9][0-9]*)")
+
+
+def parse_sort_keys(spec: str) -> list[str]:
+    """
+    Parse comma-separated sort keys ("R1,L1", "lemma, infl"; case-insensitive).
+
+    Raises ValueError for an unknown key. An empty spec gives no keys (corpus order).
+    """
+    keys = []
+    for key in spec.replace(" ", ",").split(","):
+        if not key:
+            continue
+        m = _NEIGHBOUR_KEY_RE.fullmatch(key.upper())
+        if m:
+            keys.append(m.group(0))
+        elif key.lower() in ("hit", "lemma", "infl"):
+            keys.append(key.lower())
+        else:
+            raise ValueError(f"Unknown sort key {key!r} (expected: {', '.join(SORT_KEYS)}, separated by commas)")
+    return keys
+
+
+def text_width(text: str) -> int:
+    """
+    Display width of `text` in a terminal.
+
+    Wide (CJK) characters take two columns, and combining characters none; this includes
+    the vowel and final jamo of Old Hangul syllables, which are drawn into the initial's block.
+    """
+    width = 0
+    for ch in text:
+        cp = ord(ch)
+        if 0x1160 <= cp <= 0x11FF or 0xD7B0 <= cp <= 0xD7FF or unicodedata.category(ch) in ("Mn", "Me", "Mc", "Cf"):
+            continue
+        width += 2 if unicodedata.east_asian_width(ch) in "WF" else 1
+    return width
+
+
+def _ranks(keys: list[str]) -> array:
+    """Rank of each key in sorted order (equal keys get equal ranks)."""
+    rank = {k: i for i, k in enumerate(sorted(set(keys)))}
+    return array("i", [rank[k] for k in keys])
+
+
+# Rank tables of each corpus, with the number of rows they were built for (see form_ranks)
+_RANK_TABLES: weakref.WeakKeyDictionary[Corpus, tuple[int, dict[str, array]]] = weakref.WeakKeyDictionary()
+
+def form_ranks(corpus: Corpus, name: str) -> array:
+    """
+    Sort rank of every interned form of `corpus`, built once per corpus.
+
+    name = "yale":  rank of each yale id, by Yale form
+    name = "lemma": rank of each tagged id, by the lemma of the tagged form
+    name = "infl":  rank of each tagged id, by the INFL suffix of the tagged form
+    """
+    size, tables = _RANK_TABLES.get(corpus, (-1, {}))
+    if size != len(corpus):
+        tables = {}
+        _RANK_TABLES[corpus] = (len(corpus), tables)
+
+    ranks = tables.get(name)
+    if ranks is None:
+        if name == "yale":
+            ranks = _ranks([v or "" for v in corpus.yales.values])
+        else:
+            from .tagger import parse_tagged_form
+            part = 0 if name == "lemma" else 1
+            ranks = _ranks([parse_tagged_form(v)[part] for v in corpus.tagged.values])
+        tables[name] = ranks
+    return ranks
+
+
+class Concordance:
+    """
+    KWIC view of hits given as corpus rows (see search.search_corpus).
+
+    Usage:
+
+        conc = Concordance(corpus, row_hits)
+        conc.sort(parse_sort_keys("R1,L1"))
+        for line in conc.lines():
+            print(line)
+    """
+
+    def __init__(self, corpus: Corpus, row_hits: list[tuple[int, ...]], *, width: int = DEFAULT_WIDTH) -> None:
+        self.corpus = corpus
+        self.row_hits = row_hits
+        self.width = width
+        self.order: list[int] = list(range(len(row_hits)))     # hit numbers in display order
+        self.sort_keys: list[str] = []
+
+        self._columns: dict[str, array] = {}
+        self._parts: list[tuple[str, int, str, int, str]] | None = None    # see _layout()
+        self._display: dict[int, tuple[str, int]] = {}                      # unicode id -> (display form, width)
+
+    def __len__(self) -> int:
+        return len(self.row_hits)
+
+    def hits(self) -> list[tuple[int, ...]]:
+        """The hits, in display order."""
+        row_hits = self.row_hits
+        return [row_hits[i] for i in self.order]
+
+    def sort(self, keys: Sequence[str]) -> None:
+        """Sort by `keys` (see parse_sort_keys), the first key first; no keys restores corpus order."""
+        order = list(range(len(self.row_hits)))
+        for key in reversed(keys):
+            order.sort(key=self._column(key).__getitem__)     # stable, so earlier keys take precedence
+        self.order = order
+        self.sort_keys = list(keys)
+
+    # Sort key columns
+
+    def _neighbour(self, rows: tuple[int, ...], side: str, k: int) -> int:
+        """Row of the k-th token to the left / right of a hit within its segment, or -1."""
+        c = self.corpus
+        same = c.same_segment
+        if side == "L":
+            r = rows[0]
+            for _ in range(k):
+                if r == 0 or not same(r - 1, r):
+                    return -1
+                r -= 1
+        else:
+            r = rows[-1]
+            last = len(c) - 1
+            for _ in range(k):
+                if r == last or not same(r, r + 1):
+                    return -1
+                r += 1
+        return r
+
+    def _column(self, key: str) -> array:
+        """One sort rank per hit for `key`, built on first use."""
+        column = self._columns.get(key)
+        if column is not None:
+            return column
+
+        c = self.corpus
+        with profiling.stage("kwic_keys") as st:
+            if key == "hit":
+                ranks, ids = form_ranks(c, "yale"), c.yale_ids
+                column = array("i", [ranks[ids[rows[0]]] for rows in self.row_hits])
+            elif key in ("lemma", "infl"):
+                ranks, ids = form_ranks(c, key), c.tagged_ids
+                column = array("i", [ranks[ids[rows[0]]] for rows in self.row_hits])
+            else:
+                side, k = key[0], int(key[1:])
+                ranks, ids = form_ranks(c, "yale"), c.yale_ids
+                neighbour = self._neighbour
+                column = array("i")
+                for rows in self.row_hits:
+                    r = neighbour(rows, side, k)
+                    column.append(-1 if r < 0 else ranks[ids[r]])     # missing neighbours first
+            st.count(matches=len(column))
+        self._columns[key] = column
+        return column
+
+    # Display
+
+    def _form(self, row: int) -> tuple[str, int]:
+        """Display form (Unicode, NFC) of one row, and its width."""
+        i = self.corpus.unicode_ids[row]
+        form = self._display.get(i)
+        if form is None:
+            text = unicodedata.normalize("NFC", self.corpus.unicodes[i] or "")
+            form = self._display[i] = (text, text_width(text))
+        return form
+
+    def _context_rows(self, rows: tuple[int, ...], side: str) -> list[int]:
+        """Up to `width` rows of context on one side of a hit, in corpus order."""
+        c = self.corpus
+        same = c.same_segment
+        context = []
+        if side == "L":
+            r = rows[0]
+            while len(context) < self.width and r > 0 and same(r - 1, r):
+                r -= 1
+                context.append(r)
+            context.reverse()
+        else:
+            r = rows[-1]
+            last = len(c) - 1
+            while len(context) < self.width and r < last and same(r, r + 1):
+                r += 1
+                context.append(r)
+        return context
+
+    def _join(self, rows: Sequence[int]) -> tuple[str, int]:
+        """Display forms of `rows` joined by spaces, and the width of the result."""
+        forms = [self._form(r) for r in rows]
+        return " ".join(text for text, _ in forms), sum(w for _, w in forms) + max(len(forms) - 1, 0)
+
+    def _layout(self) -> list[tuple[str, int, str, int, str]]:
+        """(left, left width, hit, hit width, right) of every hit, in corpus order; built once."""
+        if self._parts is None:
+            join, context_rows = self._join, self._context_rows
+            parts = []
+            for rows in self.row_hits:
+                left = join(context_rows(rows, "L"))
+                hit = join(rows)
+                parts.append((*left, *hit, join(context_rows(rows, "R"))[0]))
+            self._parts = parts
+        return self._parts
+
+    def lines(self) -> list[str]:
+        """The concordance lines, in display order, with aligned columns."""
+        layout = self._layout()
+        c = self.corpus
+        sources, source_ids = c.sources.values, c.source_ids
+        source_widths = [text_width(s) for s in sources]
+
+        first = [rows[0] for rows in self.row_hits]
+        source_w = max((source_widths[source_ids[r]] for r in first), default=0)
+        left_w = max((part[1] for part in layout), default=0)
+        hit_w = max((part[3] for part in layout), default=0)
+
+        lines = []
+        for i in self.order:
+            left, lw, hit, hw, right = layout[i]
+            s = source_ids[first[i]]
+            lines.append(
+                f"{sources[s]}{' ' * (source_w - source_widths[s])}  "
+                f"{' ' * (left_w - lw)}{left} "
+                f"<<{hit}>>{' ' * (hit_w - hw)} "
+                f"{right}".rstrip()
+            )
+        return lines
+
+    def records(self) -> Iterator[tuple]:
+        """Export records (KWIC_COLUMNS) of the hits, in display order."""
+        layout = self._layout()
+        for i, record in zip(self.order, row_hit_records(self.corpus, self.hits())):
+            left, _, _, _, right = layout[i]
+            yield record + (left, right)
+
+
+def print_concordance(conc: Concordance) -> None:
+    """Print a concordance, with its sort keys."""
+    with profiling.stage("report") as st:
+        keys = ",".join(conc.sort_keys) or "corpus order"
+        print(f"[INFO] Concordance: {len(conc)} hits, sorted by {keys}")
+        for line in conc.lines():
+            print(line)
+        st.count(matches=len(conc))
+
+
+def export_concordance(path: Path, conc: Concordance, *, fmt: str) -> int:
+    """Export a concordance in its display order, with `left` and `right` context columns (see export.py)."""
+    return write_records(path, conc.records(), fmt=fmt, columns=KWIC_COLUMNS)
@@ -1,8 +1,28 @@
 # model.py
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Optional
 
-@dataclass
+class ContextTable:
+    """
+    Side table of contexts, one entry per TXT line / XML sentence.
+
+    Tokens refer to their context by `context_id` instead of carrying the line themselves.
+    `raw` holds the original (PUA) text; `rendered` caches the display form of each entry,
+    which is produced once, on first use (see yale.context_text).
+    """
+
+    def __init__(self, raw: Optional[list[str]] = None) -> None:
+        self.raw: list[str] = list(raw) if raw is not None else []
+        self.rendered: dict[int, str] = {}
+
+    def add(self, text: str) -> int:
+        self.raw.append(text)
+        return len(self.raw) - 1
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+@dataclass(slots=True)
 class Token:
     path: str
     source_id: str
@@ -12,5 +32,13 @@ class Token:
     yale: Optional[str] = None
     is_note: str = "MAIN"
     tagged_form: Optional[str] = None
-    context: Optional[str] = None
+    context_id: Optional[int] = None
+    contexts: Optional[ContextTable] = field(default=None, repr=False, compare=False)
 
+    @property
+    def context(self) -> Optional[str]:
+        """Display form of the token's context line (read-only; see yale.context_text), or None without contexts."""
+        if self.contexts is None or self.context_id is None:
+            return None
+        from .yale import context_text
+        return context_text(self.contexts, self.context_id)
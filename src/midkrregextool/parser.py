@@ -1,11 +1,11 @@
 # parser.py
-from multiprocessing import context
 import re
 from pathlib import Path
-from typing import List, TextIO
+from typing import Iterable, Iterator, List, TextIO
 import xml.etree.ElementTree as ET
 
-from .model import Token
+from . import profiling
+from .model import ContextTable, Token
 
 
 # Source marker at the *beginning* of a line, e.g.: 
@@ -24,15 +24,34 @@ HEAD_CLOSE_RE = re.compile(r"\[/head\]")
 ADD_OPEN_RE = re.compile(r"\[add\]")
 ADD_CLOSE_RE = re.compile(r"\[/add\]")
 
-def parse_file(path: str | Path, *, encoding: str = "utf-16", displaycontext: str = "n") -> List[Token]:
+def parse_file(path: str | Path, *, encoding: str = "utf-16", displaycontext: str = "n", contexts: ContextTable | None = None) -> List[Token]:
+    """
+    Parse a whole file and return its tokens as a list (see iter_parse_file).
+
+    Contexts are stored once per line in a side table; tokens only keep the line's id.
+    All lines of the file go into one table (or into `contexts`, to share one table between several files).
+    """
+    if contexts is None and displaycontext.strip().lower() == "y":
+        contexts = ContextTable()
+    with profiling.stage("parse", file=path) as st:
+        tokens = list(iter_parse_file(path, encoding=encoding, displaycontext=displaycontext, contexts=contexts))
+        st.count(tokens=len(tokens))
+    return tokens
+
+def iter_parse_file(path: str | Path, *, encoding: str = "utf-16", displaycontext: str = "n", contexts: ContextTable | None = None) -> Iterator[Token]:
     # Guard: XML inputs are collected by the CLI, but XML parsing/extraction is not implemented yet.
-    if path.suffix.lower() == ".xml":
-        return parse_xml_file(path,encoding=encoding,displaycontext=displaycontext)
+    if Path(path).suffix.lower() == ".xml":
+        yield from iter_parse_xml_file(path,encoding=encoding,displaycontext=displaycontext,contexts=contexts)
+        return
     
     # Flag for displaying context
     want_ctx = (displaycontext.strip().lower() == "y")
+
+    # Without a shared `contexts` table, every line gets a one-entry table of its own,
+    # which is dropped together with the line's tokens (so streaming stays flat in memory).
+    shared_contexts = contexts
     """
-    Parse a Middle Korean text file encoded in Hanyang PUA and return a list of tokens.
+    Parse a Middle Korean text file encoded in Hanyang PUA and yield its tokens one by one, in file order.
     
     This parser:
 
@@ -50,15 +69,6 @@ def parse_file(path: str | Path, *, encoding: str = "utf-16", displaycontext: st
     4. Creates Token objects with source_id, token_index, and PUA lexical form. 
     """
 
-    tokens: List[Token] = []
-
-    # Tracks which source block the parser is currently in (e.g., "釋詳3:1a")
-    current_source_id: str | None = None
-    token_index: int = 0
-
-    # Tracks whether we are currently inside a [note]...[/note] block.
-    inside_note = False
-
     # Open the file for reading.
 
     f = open(path, encoding=encoding)
@@ -71,174 +81,333 @@ def parse_file(path: str | Path, *, encoding: str = "utf-16", displaycontext: st
     #     f = open(path, encoding="utf-8")
     
     with f:
-        for raw_line in f:
-            # Remove surrounding whitespace, but keep internal spacing.
-            line = raw_line.strip()
+        yield from _iter_line_tokens(f, path, want_ctx, shared_contexts)
 
-            # Skip empty lines; they do not contribute tokens.
-            if not line:
-                continue
+def _iter_line_tokens(lines: Iterable[str], path: str | Path, want_ctx: bool, shared_contexts: ContextTable | None) -> Iterator[Token]:
+    """
+    Tokens of the lines of a TXT file (see iter_parse_file).
+
+    Lines before the first source tag are skipped. The chunked parser (see iter_parse_chunk)
+    calls this on each chunk, which always starts with a source tag line.
+    """
+    contexts = shared_contexts
+
+    # Tracks which source block the parser is currently in (e.g., "釋詳3:1a")
+    current_source_id: str | None = None
+    token_index: int = 0
 
-            # --------------------------------------------------------------
-            # 1. Detect source markers such as <釋詳3:1a>
-            # --------------------------------------------------------------
-            m = SOURCE_TAG_RE.match(line)
-            if m:
-                # Update the current source context
-                current_source_id = m.group(1) # the strings wrapped with ()
+    # Tracks whether we are currently inside a [note]...[/note] block.
+    inside_note = False
 
-                
+    for raw_line in lines:
+        # Remove surrounding whitespace, but keep internal spacing.
+        line = raw_line.strip()
 
-                # Remove the source tag prefix from the line and continue
-                # processing the remainder as normal text.
-                line = line[m.end():].lstrip() 
+        # Skip empty lines; they do not contribute tokens.
+        if not line:
+            continue
+
+        # --------------------------------------------------------------
+        # 1. Detect source markers such as <釋詳3:1a>
+        # --------------------------------------------------------------
+        m = SOURCE_TAG_RE.match(line)
+        if m:
+            # Update the current source context
+            current_source_id = m.group(1) # the strings wrapped with ()
+
+            
 
-                # If nothing remains on this line, move on to the next line.
-                if not line:
-                    continue
+            # Remove the source tag prefix from the line and continue
+            # processing the remainder as normal text.
+            line = line[m.end():].lstrip() 
 
-            # If we still don't have a source_id (no source tag seen yet),
-            # we might choose to skip tokens or raise an error.
-            # For now, we skip lines without an established source.
-            if current_source_id is None:
+            # If nothing remains on this line, move on to the next line.
+            if not line:
                 continue
 
-            # ----------------------------------------------------------
-            # 2. Remove [head] / [/head] and [add] / [/add] tags.
-            #    Their contents are treated as normal text.
-            # ----------------------------------------------------------
-            line = HEAD_OPEN_RE.sub("", line)
-            line = HEAD_CLOSE_RE.sub("", line)
-            line = ADD_OPEN_RE.sub("", line)
-            line = ADD_CLOSE_RE.sub("", line)
-
-            # ----------------------------------------------------------
-            # 3. Process [note] and [/note] markers with segment-level control
-            #
-            # We split the line into a sequence of:
-            #   - text segments
-            #   - "[note]" markers
-            #   - "[/note]" markers
-            #
-            # Example:
-            #   "foo [note] bar baz [/note] qux"
-            # becomes:
-            #   ["foo ", "[note]", " bar baz ", "[/note]", " qux"]
-            #
-            # We then iterate through this list and:
-            #   - toggle inside_note when we see [note]/[/note]
-            #   - tokenize text segments according to the current inside_note
-            # ----------------------------------------------------------
-
-            parts = NOTE_TAG_SPLIT_RE.split(line) 
-            '''
-            e.g., 
-            parts = [
-                "무상천으로 가리니 ", 
-                "[note]",
-                " 그저긔 阿私陁이 ",
-                "[/note]",
-                " 몯 미처"
-                ]
-            '''
-
-            context = None
-
-            if want_ctx:
-                context = " ".join(p for p in parts if p and p not in NOTE_TAGS)
+        # If we still don't have a source_id (no source tag seen yet),
+        # we might choose to skip tokens or raise an error.
+        # For now, we skip lines without an established source.
+        if current_source_id is None:
+            continue
+
+        # ----------------------------------------------------------
+        # 2. Remove [head] / [/head] and [add] / [/add] tags.
+        #    Their contents are treated as normal text.
+        # ----------------------------------------------------------
+        line = HEAD_OPEN_RE.sub("", line)
+        line = HEAD_CLOSE_RE.sub("", line)
+        line = ADD_OPEN_RE.sub("", line)
+        line = ADD_CLOSE_RE.sub("", line)
+
+        # ----------------------------------------------------------
+        # 3. Process [note] and [/note] markers with segment-level control
+        #
+        # We split the line into a sequence of:
+        #   - text segments
+        #   - "[note]" markers
+        #   - "[/note]" markers
+        #
+        # Example:
+        #   "foo [note] bar baz [/note] qux"
+        # becomes:
+        #   ["foo ", "[note]", " bar baz ", "[/note]", " qux"]
+        #
+        # We then iterate through this list and:
+        #   - toggle inside_note when we see [note]/[/note]
+        #   - tokenize text segments according to the current inside_note
+        # ----------------------------------------------------------
+
+        parts = NOTE_TAG_SPLIT_RE.split(line) 
+        '''
+        e.g., 
+        parts = [
+            "무상천으로 가리니 ", 
+            "[note]",
+            " 그저긔 阿私陁이 ",
+            "[/note]",
+            " 몯 미처"
+            ]
+        '''
+
+        context_id = None
+
+        if want_ctx:
+            contexts = shared_contexts if shared_contexts is not None else ContextTable()
+            context_id = contexts.add(" ".join(p for p in parts if p and p not in NOTE_TAGS))
+        
+        inside_note = "MAIN"    # The beginning is always the main body text, so set the flag as "MAIN" 
+
+        for part in parts:
             
-            inside_note = "MAIN"    # The beginning is always the main body text, so set the flag as "MAIN" 
+            # Reset token numbering within this part section.
 
-            for part in parts:
-                
-                # Reset token numbering within this part section.
+            if not part: 
+                continue # Skip the remaining processes and go on to the next cycle.
 
-                if not part: 
-                    continue # Skip the remaining processes and go on to the next cycle.
+            token_index = 0
 
-                token_index = 0
+            if part == "[note]":
+                # Enter note mode: subsequent tokens will have is_note=True.
+                inside_note = "NOTE"
+                continue
 
-                if part == "[note]":
-                    # Enter note mode: subsequent tokens will have is_note=True.
-                    inside_note = "NOTE"
-                    continue
+            if part == "[/note]":
+                # Exit note mode: subsequent tokens will have is_note=False.
+                inside_note = "MAIN"
+                continue
 
-                if part == "[/note]":
-                    # Exit note mode: subsequent tokens will have is_note=False.
-                    inside_note = "MAIN"
-                    continue
+            # This is a normal text segment (either inside or outside a note).
+            # We split it into words on whitespace.
 
-                # This is a normal text segment (either inside or outside a note).
-                # We split it into words on whitespace.
+        
 
-            
+            words = part.split() # e.g., words = ["무상천으로", "가리니"]
+            if not words: 
+                continue
 
-                words = part.split() # e.g., words = ["무상천으로", "가리니"]
-                if not words: 
-                    continue
-
-                for w in words: # e.g., as for "무상천으로" in ["무상천으로", "가리니"]
-                    token_index += 1
-                    tokens.append(
-                        Token(
-                            path=path,
-                            source_id=current_source_id,
-                            token_index=token_index,
-                            pua=w,
-                            is_note=inside_note,
-                            context=context
-                        )
-                    )
-                
+            for w in words: # e.g., as for "무상천으로" in ["무상천으로", "가리니"]
+                token_index += 1
+                yield Token(
+                    path=path,
+                    source_id=current_source_id,
+                    token_index=token_index,
+                    pua=w,
+                    is_note=inside_note,
+                    context_id=context_id,
+                    contexts=contexts if want_ctx else None,
+                )
 
-    return tokens
 
-def parse_xml_file(path: str | Path, *, encoding: str = "utf-8", displaycontext: str = "n") -> List[Token]:
+# ----------------------------------------------------------------------
+# Chunked parsing of large TXT files
+#
+# The file is memory-mapped and cut into byte ranges that each start at a
+# source tag line ("\n<釋詳3:1a> ..."). The only state the line parser carries
+# from one line to the next is the current source_id ([note] is reset at every
+# line), and a chunk sets it on its first line, so every chunk can be parsed on
+# its own, in any process. Chunk i's tokens are exactly the serial parser's
+# tokens for those lines, and its context entries follow those of chunk i-1
+# (see pipeline.ingest_files, which parses, converts and tags the chunks in
+# worker processes and stitches them back together).
+# ----------------------------------------------------------------------
+
+# Files smaller than this are not split (starting workers would cost more than it saves).
+CHUNKED_MIN_BYTES = 4 * 1024 * 1024
+
+# Longest source tag line start that is looked at when checking a chunk boundary.
+_BOUNDARY_WINDOW = 512
+
+def _chunk_codec(head: bytes, encoding: str) -> tuple[str, int, int] | None:
     """
-    Parse NIKL-style XML file where sentences are stored as <sent ...>TEXT</sent>.
+    (codec, code unit width, offset of the text) for decoding chunks of a file in `encoding`,
+    decoding the same way as open(path, encoding=encoding) does, or None if unsupported.
+    """
+    import codecs
+
+    name = codecs.lookup(encoding).name
+    if name == "utf-8":
+        return "utf-8", 1, 0
+    if name == "utf-8-sig":
+        return "utf-8", 1, 3 if head.startswith(codecs.BOM_UTF8) else 0
+    if name in ("utf-16-le", "utf-16-be"):
+        return name, 2, 0
+    if name == "utf-16":
+        # The BOM sets the byte order (without one, reading the file fails, so leave that to the serial parser).
+        if head.startswith(codecs.BOM_UTF16_LE):
+            return "utf-16-le", 2, 2
+        if head.startswith(codecs.BOM_UTF16_BE):
+            return "utf-16-be", 2, 2
+    return None
+
+def _find_boundary(data, pos: int, end: int, codec: str, width: int, text_start: int) -> int | None:
+    """Byte offset of the first source tag line starting at or after `pos`, or None."""
+    needle = "\n<".encode(codec)
+    while True:
+        i = data.find(needle, pos, end)
+        if i < 0:
+            return None
+        if (i - text_start) % width:
+            pos = i + 1         # not on a character boundary
+            continue
+        start = i + width       # the "<"
+        window = data[start:min(start + _BOUNDARY_WINDOW, end)]
+        line = window[:len(window) - len(window) % width].decode(codec, errors="replace").replace("\r", "\n").split("\n", 1)[0]
+        if SOURCE_TAG_RE.match(line):
+            return start
+        pos = start
+
+def plan_chunks(path: str | Path, *, encoding: str, n_chunks: int) -> tuple[str, list[tuple[int, int]]] | None:
+    """
+    Split a TXT file into about `n_chunks` byte ranges, each after the first starting at a source tag line.
 
-    We create a fresh source_id per <sent>, so token_index resets for each sentence.    
+    Returns (codec, ranges) for iter_parse_chunk, or None if the file should be parsed whole:
+    it is an XML file or smaller than CHUNKED_MIN_BYTES, its encoding is not UTF-8/UTF-16,
+    or it has no source tag lines to split it at.
     """
-    path = Path(path)
-    root = ET.parse(path).getroot()
+    import mmap
+
+    if n_chunks < 2 or Path(path).suffix.lower() == ".xml":
+        return None
+
+    with open(path, "rb") as f:
+        size = f.seek(0, 2)
+        if size < CHUNKED_MIN_BYTES:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            spec = _chunk_codec(data[:4], encoding)
+            if spec is None:
+                return None
+            codec, width, text_start = spec
+
+            step = max((size - text_start) // n_chunks, 1)
+            bounds = [text_start]
+            for k in range(1, n_chunks):
+                target = max(text_start + k * step, bounds[-1] + 1)
+                b = _find_boundary(data, target - width, size, codec, width, text_start)
+                if b is None:
+                    break
+                if b > bounds[-1]:
+                    bounds.append(b)
+            bounds.append(size)
+
+    if len(bounds) < 3:
+        return None
+    return codec, list(zip(bounds, bounds[1:]))
+
+def iter_parse_chunk(path: str | Path, start: int, end: int, *, codec: str, displaycontext: str = "n", contexts: ContextTable | None = None) -> Iterator[Token]:
+    """Parse bytes [start, end) of a TXT file, as planned by plan_chunks (see iter_parse_file)."""
+    import mmap
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[start:end].decode(codec)
+
+    # Same line splitting as reading the file in text mode (universal newlines).
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
 
-    tokens: list[Token] = []
+    want_ctx = (displaycontext.strip().lower() == "y")
+    yield from _iter_line_tokens(lines, path, want_ctx, contexts)
 
-    # Iterate over all <sent> elements anywhere in the document.
+def parse_xml_file(path: str | Path, *, encoding: str = "utf-8", displaycontext: str = "n", contexts: ContextTable | None = None) -> List[Token]:
+    """Parse a whole XML file and return its tokens as a list (see iter_parse_xml_file)."""
+    if contexts is None and displaycontext.strip().lower() == "y":
+        contexts = ContextTable()
+    return list(iter_parse_xml_file(path, encoding=encoding, displaycontext=displaycontext, contexts=contexts))
 
-    doc_name = (root.findtext(".//title") or "").strip()
+def iter_parse_xml_file(path: str | Path, *, encoding: str = "utf-8", displaycontext: str = "n", contexts: ContextTable | None = None) -> Iterator[Token]:
+    """
+    Parse NIKL-style XML file where sentences are stored as <sent ...>TEXT</sent>.
 
-    for sent in root.iterfind(".//sent"):
-        text = (sent.text or "").strip()
-        if not text:
-            continue
+    We create a fresh source_id per <sent>, so token_index resets for each sentence.
 
-        if displaycontext.lower().strip() == "y":
-            context = text
-            
-        # Build a stable source_id from attributes if available.
-        page = sent.get("page")
-        n = sent.get("n")
-        lang = sent.get("lang")
-        stype = sent.get("type")
-
-        source_id = f"{doc_name}:{page}:{n}:{lang}"
-
-        token_index = 0
-
-        for word in text.split():
-            token_index += 1
-            tokens.append(
-                Token(
-                    path = path,
-                    source_id = source_id,
-                    token_index = token_index,
-                    pua = word,
-                    is_note = stype,
-                    context = context if displaycontext.lower().strip() == "y" else None
-                )
-            )
+    The file is read with iterparse: the tokens of a <sent> are yielded as soon as it closes,
+    and every element is dropped from the tree once it has been read, so memory use does not
+    grow with the size of the file. The document title (source_id prefix) is picked up on the way,
+    so it has to come before the sentences, as in the NIKL header.
+    (The encoding comes from the XML declaration; `encoding` is ignored, as with ET.parse.)
+    """
+    path = Path(path)
 
-    return tokens
+    # One context entry per <sent> (see iter_parse_file)
+    want_ctx = displaycontext.lower().strip() == "y"
+    shared_contexts = contexts
+
+    doc_name: str | None = None
 
+    # Elements that are open at the moment. Each element is removed from its parent when it
+    # closes, so the tree never holds more than the path from the root to the current element.
+    open_elems: list[ET.Element] = []
 
+    with open(path, "rb") as f:
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                open_elems.append(elem)
+                continue
+            open_elems.pop()
+
+            # First <title> of the document (same as root.findtext(".//title"))
+            if elem.tag == "title" and doc_name is None:
+                doc_name = (elem.text or "").strip()
+
+            elif elem.tag == "sent":
+                yield from _sent_tokens(path, elem, doc_name or "", want_ctx, shared_contexts)
+
+            # Drop the element. Its earlier siblings were removed when they closed, but iterparse
+            # reads ahead, so the parent may already hold the next sibling after it: remove it by identity.
+            elem.clear()
+            if open_elems:
+                open_elems[-1].remove(elem)
+
+def _sent_tokens(path: Path, sent: ET.Element, doc_name: str, want_ctx: bool, shared_contexts: ContextTable | None) -> Iterator[Token]:
+    """Tokens of one <sent> element."""
+    text = (sent.text or "").strip()
+    if not text:
+        return
+
+    contexts = None
+    context_id = None
+    if want_ctx:
+        contexts = shared_contexts if shared_contexts is not None else ContextTable()
+        context_id = contexts.add(text)
+
+    # Build a stable source_id from attributes if available.
+    page = sent.get("page")
+    n = sent.get("n")
+    lang = sent.get("lang")
+    stype = sent.get("type")
+
+    source_id = f"{doc_name}:{page}:{n}:{lang}"
+
+    token_index = 0
+
+    for word in text.split():
+        token_index += 1
+        yield Token(
+            path = path,
+            source_id = source_id,
+            token_index = token_index,
+            pua = word,
+            is_note = stype,
+            context_id = context_id,
+            contexts = contexts,
+        )
@@ -0,0 +1,295 @@
+# pipeline.py
+
+"""
+File ingestion: parse -> Yale conversion -> tagging, with optional caching.
+
+Primary entry points:
+    process_file(path, *, encoding, displaycontext, infl_suffixes, lemma_list, cache=None)
+    ingest_files(files, *, encoding, displaycontext, infl_suffixes, lemma_list, jobs=1, cache=None)
+    stream_file(path, *, encoding, displaycontext, infl_suffixes, lemma_list)
+    run_consumers(files, consumers, *, encoding, displaycontext, infl_suffixes, lemma_list, ...)
+    load_corpus(files, *, encoding, displaycontext, infl_suffixes, lemma_list, ...)
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Iterator, Protocol
+
+from . import profiling
+from .cache import TokenCache, rows_to_tokens, tokens_contexts, tokens_to_rows
+from .model import ContextTable, Token
+from .parser import iter_parse_chunk, iter_parse_file, parse_file, plan_chunks
+from .tagger import Tagger, iter_tag_tokens, tag_tokens
+from .yale import attach_yale, get_backend, iter_attach_yale, set_backend
+
+if TYPE_CHECKING:
+    from .corpus import Corpus
+
+
+def process_file(
+        path: Path,
+        *,
+        encoding: str,
+        displaycontext: str,
+        infl_suffixes: list[str],
+        lemma_list: list[str],
+        debug_suffixes: bool = False,
+        cache: TokenCache | None = None,
+        tagger: Tagger | None = None,
+) -> list[Token]:
+    """
+    Return the tagged tokens of a single input file.
+
+    If a cache is given, a valid cache entry is used instead of reprocessing the file,
+    and freshly processed files are written back to the cache.
+    """
+
+    # Suffix proposals are printed while tagging, so debug runs always take the full path.
+    if cache is not None and not debug_suffixes:
+        with profiling.stage("cache_load", file=path) as st:
+            tokens = cache.load(path, encoding=encoding, displaycontext=displaycontext)
+            if tokens is not None:
+                st.count(tokens=len(tokens), cache_hits=1, cache_misses=0)
+            else:
+                st.count(cache_hits=0, cache_misses=1)
+        if tokens is not None:
+            return tokens
+
+    tokens = attach_yale(parse_file(path, encoding=encoding, displaycontext=displaycontext))
+    tokens = tag_tokens(tokens, infl_suffixes, lemma_list, debug_suffixes=debug_suffixes, tagger=tagger)
+
+    if cache is not None:
+        try:
+            cache.store(path, tokens, encoding=encoding, displaycontext=displaycontext)
+        except OSError as e:
+            # A read-only or full cache directory should never stop a search.
+            print(f"[WARN] Could not write cache entry for {path}: {e}")
+
+    return tokens
+
+
+def stream_file(
+        path: Path,
+        *,
+        encoding: str,
+        displaycontext: str,
+        infl_suffixes: list[str],
+        lemma_list: list[str],
+        tagger: Tagger | None = None,
+) -> Iterator[Token]:
+    """
+    Yield the tagged tokens of a file one at a time, while the file is being read.
+
+    Parsing, conversion and tagging are chained generators, so no list of tokens is built.
+    The cache is not used: its entries hold whole files.
+    """
+    tokens = iter_parse_file(path, encoding=encoding, displaycontext=displaycontext)
+    tokens = iter_attach_yale(tokens)
+    return iter_tag_tokens(tokens, infl_suffixes, lemma_list, tagger=tagger)
+
+
+# ----------------------------------------------------------------------
+# Process-pool ingestion
+#
+# Each worker builds its own Tagger once (in the initializer) and sends back
+# plain row tuples (and the file's context lines) rather than pickled Token objects; the parent rebuilds the
+# Tokens, in the original file order.
+#
+# Large TXT files are split into chunks at source tag lines (see parser.plan_chunks),
+# and each chunk is parsed, converted and tagged by a worker of its own, so that
+# a single huge file also keeps every worker busy. The parent stitches the chunks'
+# rows back together, renumbering their context ids.
+# ----------------------------------------------------------------------
+
+# Chunks per worker, so that uneven chunks still keep every worker busy.
+CHUNKS_PER_JOB = 4
+
+_worker_tagger: Tagger | None = None
+
+def _init_worker(infl_suffixes: list[str], lemma_list: list[str], backend: str) -> None:
+    global _worker_tagger
+    set_backend(backend)
+    _worker_tagger = Tagger(infl_suffixes, lemma_list)
+
+def _ingest_worker(path: Path, encoding: str, displaycontext: str) -> tuple[list[tuple], list[str]]:
+    tagger = _worker_tagger
+    tokens = attach_yale(parse_file(path, encoding=encoding, displaycontext=displaycontext))
+    tokens = tag_tokens(tokens, tagger.infl_suffixes, tagger.lemmas, tagger=tagger)
+    return tokens_to_rows(tokens), tokens_contexts(tokens)
+
+def _ingest_chunk_worker(path: Path, start: int, end: int, codec: str, displaycontext: str) -> tuple[list[tuple], list[str]]:
+    tagger = _worker_tagger
+    # Every context line of the chunk is sent back (even lines without tokens), so the ids of the next chunks line up.
+    contexts = ContextTable() if displaycontext.strip().lower() == "y" else None
+    tokens = attach_yale(iter_parse_chunk(path, start, end, codec=codec, displaycontext=displaycontext, contexts=contexts))
+    tokens = tag_tokens(tokens, tagger.infl_suffixes, tagger.lemmas, tagger=tagger)
+    return tokens_to_rows(tokens), (contexts.raw if contexts is not None else [])
+
+def _merge_chunks(results: list[tuple[list[tuple], list[str]]]) -> tuple[list[tuple], list[str]]:
+    """Join the (rows, context lines) of consecutive chunks of a file, shifting each chunk's context ids."""
+    if len(results) == 1:
+        return results[0]
+
+    rows: list[tuple] = []
+    contexts: list[str] = []
+    for chunk_rows, chunk_contexts in results:
+        offset = len(contexts)
+        if offset:
+            # context_id is the last field of a row (see cache.tokens_to_rows)
+            chunk_rows = [row if row[-1] is None else (*row[:-1], row[-1] + offset) for row in chunk_rows]
+        rows.extend(chunk_rows)
+        contexts.extend(chunk_contexts)
+    return rows, contexts
+
+def ingest_files(
+        files: list[Path],
+        *,
+        encoding: str,
+        displaycontext: str,
+        infl_suffixes: list[str],
+        lemma_list: list[str],
+        jobs: int = 1,
+        debug_suffixes: bool = False,
+        cache: TokenCache | None = None,
+        tagger: Tagger | None = None,
+) -> Iterator[tuple[Path, list[Token]]]:
+    """
+    Yield (path, tokens) for every file, in the order of `files`.
+
+    With jobs > 1, files that are not already cached are processed in a pool of worker processes,
+    large TXT files in several chunks. The tokens are the same as those of a serial run.
+    """
+    options = dict(encoding=encoding, displaycontext=displaycontext)
+
+    # Debug output is printed while tagging, so keep it in this process (and in order).
+    if jobs > 1 and not debug_suffixes:
+        pending = [path for path in files if cache is None or not cache.is_fresh(path, **options)]
+        chunks = {path: plan_chunks(path, encoding=encoding, n_chunks=jobs * CHUNKS_PER_JOB) for path in pending}
+        n_tasks = sum(len(plan[1]) if plan is not None else 1 for plan in chunks.values())
+    else:
+        n_tasks = 0
+
+    # Nothing to run in parallel
+    if n_tasks <= 1:
+        for path in files:
+            yield path, process_file(
+                path, infl_suffixes=infl_suffixes, lemma_list=lemma_list,
+                debug_suffixes=debug_suffixes, cache=cache, tagger=tagger, **options,
+            )
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=min(jobs, n_tasks),
+        initializer=_init_worker,
+        initargs=(infl_suffixes, lemma_list, get_backend()),
+    ) as pool:
+        futures: dict[Path, list[Future]] = {}
+        for path, plan in chunks.items():
+            if plan is None:
+                futures[path] = [pool.submit(_ingest_worker, path, encoding, displaycontext)]
+            else:
+                codec, ranges = plan
+                futures[path] = [pool.submit(_ingest_chunk_worker, path, start, end, codec, displaycontext) for start, end in ranges]
+
+        try:
+            yield from _collect_in_order(files, futures, cache=cache, infl_suffixes=infl_suffixes, lemma_list=lemma_list, tagger=tagger, **options)
+        finally:
+            # If the caller stops early, do not start the remaining files.
+            pool.shutdown(cancel_futures=True)
+
+def _collect_in_order(
+        files: list[Path],
+        futures: dict[Path, list[Future]],
+        *,
+        encoding: str,
+        displaycontext: str,
+        infl_suffixes: list[str],
+        lemma_list: list[str],
+        cache: TokenCache | None,
+        tagger: Tagger | None,
+) -> Iterator[tuple[Path, list[Token]]]:
+    options = dict(encoding=encoding, displaycontext=displaycontext)
+
+    for path in files:
+        file_futures = futures.get(path)
+        if file_futures is None:
+            # Fresh in the cache: load it here.
+            yield path, process_file(path, infl_suffixes=infl_suffixes, lemma_list=lemma_list, cache=cache, tagger=tagger, **options)
+            continue
+
+        # Parsing, conversion and tagging ran in a worker: only the wait is seen here.
+        with profiling.stage("ingest_wait", file=path) as st:
+            rows, contexts = _merge_chunks([future.result() for future in file_futures])
+            tokens = rows_to_tokens(path, rows, contexts)
+            st.count(tokens=len(tokens))
+        if cache is not None:
+            try:
+                cache.store_rows(path, rows, contexts, **options)
+            except OSError as e:
+                print(f"[WARN] Could not write cache entry for {path}: {e}")
+        yield path, tokens
+
+
+# ----------------------------------------------------------------------
+# Consumers
+#
+# Several analyses often need the same files: lemma/suffix discovery (debug mode)
+# and the corpus that searches, concordances, counts and exports run on. Instead of
+# each ingesting the files on its own, they subscribe to a single ingest pass:
+# every file is parsed, converted and tagged exactly once (or loaded once from the
+# cache), and its tokens are handed to each consumer in turn, in file order.
+# ----------------------------------------------------------------------
+
+class Consumer(Protocol):
+    def consume(self, path: Path, tokens: list[Token]) -> None:
+        """Receive the tagged tokens of one file (files arrive in order)."""
+
+    def finish(self) -> None:
+        """Called once after the last file."""
+
+
+class CorpusLoader:
+    """Consumer that collects the files into a columnar Corpus (see corpus.py)."""
+
+    def __init__(self) -> None:
+        from .corpus import Corpus
+        self.corpus = Corpus()
+
+    def consume(self, path: Path, tokens: list[Token]) -> None:
+        self.corpus.add_file(path, tokens)
+
+    def finish(self) -> None:
+        pass
+
+
+def run_consumers(
+        files: list[Path],
+        consumers: Iterable[Consumer],
+        *,
+        encoding: str,
+        displaycontext: str,
+        infl_suffixes: list[str],
+        lemma_list: list[str],
+        jobs: int = 1,
+        debug_suffixes: bool = False,
+        cache: TokenCache | None = None,
+        tagger: Tagger | None = None,
+) -> None:
+    """Ingest `files` once (see ingest_files) and hand every file's tokens to each of `consumers`."""
+    consumers = list(consumers)
+    for path, tokens in ingest_files(
+        files, encoding=encoding, displaycontext=displaycontext, infl_suffixes=infl_suffixes, lemma_list=lemma_list,
+        jobs=jobs, debug_suffixes=debug_suffixes, cache=cache, tagger=tagger,
+    ):
+        for consumer in consumers:
+            consumer.consume(path, tokens)
+    for consumer in consumers:
+        consumer.finish()
+
+def load_corpus(files: list[Path], **options) -> Corpus:
+    """Ingest `files` into a Corpus (options: see run_consumers)."""
+    loader = CorpusLoader()
+    run_consumers(files, [loader], **options)
+    return loader.corpus
@@ -0,0 +1,271 @@
+# profiling.py
+
+"""
+Per-stage profiling (enabled with --profile).
+
+Library code marks its stages like this:
+
+    with profiling.stage("parse", file=path) as st:
+        tokens = ...
+        st.count(tokens=len(tokens))
+
+When profiling is off (the default), stage() returns one shared no-op object, so an
+instrumented call costs a global lookup and a function call. Stages are per file or
+per search, never per token, which keeps this overhead out of the hot loops.
+
+When profiling is on, every stage records:
+
+    - its wall time,
+    - its counters (tokens, matches, cache_hits/cache_misses, ...),
+    - the net change in allocated memory blocks (sys.getallocatedblocks),
+    - the peak of traced memory during the stage, if tracemalloc is tracing
+      (start Python with PYTHONTRACEMALLOC=1 to get it; tracing slows everything down).
+
+Results:
+    format_summary()   one table row per stage, then one row per (file, stage)
+    write_trace(path)  Chrome trace-event JSON, for chrome://tracing or https://ui.perfetto.dev
+
+Stages that run in worker processes (--jobs > 1) are not recorded; the time spent waiting
+for them shows up as "ingest_wait".
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+from pathlib import Path
+
+# json, threading and tracemalloc are only imported once profiling is enabled:
+# every module imports this one, so it has to stay cheap to import.
+
+
+class StageEvent:
+    """One finished stage. (A plain class rather than a dataclass: creating dataclasses costs start-up time.)"""
+
+    __slots__ = ("name", "file", "start", "seconds", "counters", "blocks", "peak_bytes", "thread")
+
+    def __init__(self, name: str, file: str | None, start: float, seconds: float, counters: dict[str, int] | None = None,
+                 blocks: int = 0, peak_bytes: int | None = None, thread: int = 0) -> None:
+        self.name = name
+        self.file = file
+        self.start = start                  # seconds since the profiler was enabled
+        self.seconds = seconds
+        self.counters = counters if counters is not None else {}
+        self.blocks = blocks                # net change in allocated memory blocks
+        self.peak_bytes = peak_bytes        # peak traced memory above the start of the stage (tracemalloc only)
+        self.thread = thread
+
+
+class _NullStage:
+    """What stage() returns when profiling is off: does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> _NullStage:
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+    def count(self, **counters: int) -> None:
+        pass
+
+    def set_file(self, file) -> None:
+        pass
+
+NULL_STAGE = _NullStage()
+
+
+class Stage:
+    """One running stage; records a StageEvent on its profiler when the `with` block ends."""
+
+    __slots__ = ("profiler", "name", "file", "counters", "_start", "_blocks", "_base", "_peak")
+
+    def __init__(self, profiler: Profiler, name: str, file) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.file = None if file is None else str(file)
+        self.counters: dict[str, int] = {}
+
+    def count(self, **counters: int) -> None:
+        """Add to this stage's counters."""
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_file(self, file) -> None:
+        """Attribute the stage to a file, when it is only known once the stage has run."""
+        self.file = None if file is None else str(file)
+
+    def __enter__(self) -> Stage:
+        import tracemalloc
+        stack = self.profiler._stack()
+        self._base = self._peak = None
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            # reset_peak() below would lose the peak of the enclosing stage so far, so hand it over first.
+            if stack:
+                parent = stack[-1]
+                parent._peak = max(parent._peak or 0, peak)
+            tracemalloc.reset_peak()
+            self._base = self._peak = current
+        stack.append(self)
+        self._blocks = sys.getallocatedblocks()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        import threading, tracemalloc
+        seconds = time.perf_counter() - self._start
+        blocks = sys.getallocatedblocks() - self._blocks
+
+        peak_bytes = None
+        peak = None
+        if self._base is not None and tracemalloc.is_tracing():
+            peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            peak_bytes = peak - self._base
+
+        stack = self.profiler._stack()
+        stack.pop()
+        if stack and peak is not None:
+            parent = stack[-1]
+            parent._peak = max(parent._peak or 0, peak)
+
+        p = self.profiler
+        p.events.append(StageEvent(
+            name=self.name,
+            file=self.file,
+            start=self._start - p.origin,
+            seconds=seconds,
+            counters=self.counters,
+            blocks=blocks,
+            peak_bytes=peak_bytes,
+            thread=threading.get_ident(),
+        ))
+        return False
+
+
+class Profiler:
+    """Collects the StageEvents of one run."""
+
+    def __init__(self) -> None:
+        import threading
+        self.events: list[StageEvent] = []
+        self.origin = time.perf_counter()
+        self._local = threading.local()
+
+    def _stack(self) -> list[Stage]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def stage(self, name: str, *, file=None) -> Stage:
+        return Stage(self, name, file)
+
+    # ------------------------------------------------------------------
+    # Reports
+    # ------------------------------------------------------------------
+
+    def _aggregate(self, key) -> dict:
+        totals: dict = {}
+        for e in self.events:
+            t = totals.setdefault(key(e), {"calls": 0, "seconds": 0.0, "counters": {}, "blocks": 0, "peak_bytes": None})
+            t["calls"] += 1
+            t["seconds"] += e.seconds
+            t["blocks"] += e.blocks
+            for k, v in e.counters.items():
+                t["counters"][k] = t["counters"].get(k, 0) + v
+            if e.peak_bytes is not None:
+                t["peak_bytes"] = max(t["peak_bytes"] or 0, e.peak_bytes)
+        return totals
+
+    def summary_rows(self) -> list[list[str]]:
+        """Table rows: header, one row per stage (in order of first use), then one per (file, stage)."""
+        rows = [["stage", "file", "calls", "seconds", "tokens", "tokens/s", "alloc blocks", "peak KiB", "counters"]]
+
+        def row(stage: str, file: str, t: dict) -> list[str]:
+            counters = dict(t["counters"])
+            tokens = counters.pop("tokens", None)
+            rate = f"{tokens / t['seconds']:,.0f}" if tokens and t["seconds"] > 0 else ""
+            hits, misses = counters.get("cache_hits"), counters.get("cache_misses")
+            extra = [f"{k}={v}" for k, v in counters.items()]
+            if hits is not None and misses is not None and hits + misses:
+                extra.append(f"hit_rate={hits / (hits + misses):.1%}")
+            peak = "" if t["peak_bytes"] is None else f"{t['peak_bytes'] / 1024:,.0f}"
+            return [stage, file, str(t["calls"]), f"{t['seconds']:.4f}", "" if tokens is None else str(tokens),
+                    rate, f"{t['blocks']:+d}", peak, " ".join(extra)]
+
+        for name, t in self._aggregate(lambda e: e.name).items():
+            rows.append(row(name, "(all)", t))
+        if len({e.file for e in self.events if e.file is not None}) > 1:
+            for (name, file), t in self._aggregate(lambda e: (e.name, e.file)).items():
+                if file is not None:
+                    rows.append(row(name, Path(file).name, t))
+        return rows
+
+    def format_summary(self) -> str:
+        rows = self.summary_rows()
+        if len(rows) == 1:
+            return "[INFO] Profile: no stages were recorded."
+        widths = [max(len(r[i]) for r in rows) for i in range(len(rows[0]))]
+        lines = ["[INFO] Profile by stage:"]
+        for n, r in enumerate(rows):
+            lines.append("  ".join(cell.ljust(w) if i in (0, 1, 8) else cell.rjust(w) for i, (cell, w) in enumerate(zip(r, widths))).rstrip())
+            if n == 0:
+                lines.append("-" * (sum(widths) + 2 * (len(widths) - 1)))
+        return "\n".join(lines)
+
+    def trace_events(self) -> list[dict]:
+        """The events in Chrome trace-event format ("X" complete events, times in microseconds)."""
+        pid = os.getpid()
+        events: list[dict] = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "midkrregextool"}}]
+        for e in self.events:
+            args: dict = dict(e.counters)
+            if e.file is not None:
+                args["file"] = e.file
+            args["alloc_blocks"] = e.blocks
+            if e.peak_bytes is not None:
+                args["peak_bytes"] = e.peak_bytes
+            events.append({
+                "name": e.name,
+                "cat": "stage",
+                "ph": "X",
+                "ts": round(e.start * 1e6, 3),
+                "dur": round(e.seconds * 1e6, 3),
+                "pid": pid,
+                "tid": e.thread,
+                "args": args,
+            })
+        return events
+
+    def write_trace(self, path: str | Path) -> None:
+        import json
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+
+# The active profiler; None when profiling is off.
+_active: Profiler | None = None
+
+def enable() -> Profiler:
+    """Start recording stages (in a fresh Profiler) and return the profiler."""
+    global _active
+    _active = Profiler()
+    return _active
+
+def disable() -> Profiler | None:
+    """Stop recording; return the profiler that was active, if any."""
+    global _active
+    p, _active = _active, None
+    return p
+
+def get_profiler() -> Profiler | None:
+    return _active
+
+def stage(name: str, *, file=None) -> Stage | _NullStage:
+    """Context manager timing one stage (see module docstring); a no-op when profiling is off."""
+    p = _active
+    if p is None:
+        return NULL_STAGE
+    return Stage(p, name, file)
@@ -0,0 +1,205 @@
+# query.py
+
+"""
+Structured queries over the lemma and INFL suffix of tagged forms.
+
+Instead of a regex over the whole tagged form ("^pwuthye/LEM", "-si[^/]*/INFL$"),
+a search pattern can be written as one or more field conditions, separated by spaces,
+that a token must all satisfy:
+
+    lem=pwuthye             lemma is exactly "pwuthye"
+    infl=sini               INFL suffix is exactly "sini"
+    infl=                   no INFL suffix
+    lem~^pwu                lemma matches the regex "^pwu" (here: starts with "pwu")
+    infl~la$                INFL suffix ends with "la"
+    lem=ho infl~^si         both
+
+A pattern is a structured query only if every space-separated part is such a condition;
+anything else is searched as a regex, as before. Structured queries always find single
+tokens (the spaces separate conditions, not tokens).
+
+Conditions are answered from indexes over the distinct lemmas and INFL suffixes of a
+corpus (see FieldIndex), never by running over the tokens:
+
+    =            hash lookup
+    ~^abc        prefix: range of the sorted values (bisect)
+    ~abc$        suffix: range of the sorted reversed values
+    ~^abc$       hash lookup
+    ~<other>     the regex is run once per distinct value of the field
+
+Each lookup gives a set of tagged form ids, the sets of all conditions are intersected,
+and the rows come from the per-form postings of the trigram index (see index.py).
+"""
+
+from __future__ import annotations
+
+import re
+import weakref
+from bisect import bisect_left
+from dataclasses import dataclass
+from itertools import chain
+from typing import Sequence
+
+from . import profiling
+
+FIELDS = ("lem", "infl")
+
+_CONDITION_RE = re.compile(r"(lem|infl)(=|~)(\S*)")
+
+# "^abc", "abc$", "^abc$" with a literal abc: answered from the sorted indexes
+_ANCHORED_RE = re.compile(r"(\^?)([^.^$*+?{}\[\]\\|()]*)(\$?)")
+
+
+@dataclass(frozen=True)
+class Condition:
+    field: str      # "lem" or "infl"
+    op: str         # "=" (exact) or "~" (regex)
+    value: str
+
+    def probe(self, flags: int = 0) -> tuple[str, str]:
+        """
+        How to answer the condition: ("exact" | "prefix" | "suffix" | "regex", key).
+
+        Case-insensitive searches compare through the regex, since the indexes are case-sensitive.
+        """
+        if self.op == "=":
+            if flags & re.IGNORECASE:
+                return "regex", f"^{re.escape(self.value)}$"
+            return "exact", self.value
+        m = _ANCHORED_RE.fullmatch(self.value)
+        if m is None or flags & re.IGNORECASE:
+            return "regex", self.value
+        start, literal, end = m.groups()
+        if start and end:
+            return "exact", literal
+        if start:
+            return "prefix", literal
+        if end:
+            return "suffix", literal
+        return "regex", self.value
+
+
+def parse_query(pattern: str, flags: int = 0) -> list[Condition] | None:
+    """
+    The conditions of a structured query, or None if `pattern` is a plain regex.
+
+    Raises re.error for an invalid regex condition (e.g. "infl~(si").
+    """
+    parts = pattern.split()
+    if not parts:
+        return None
+
+    conditions = []
+    for part in parts:
+        m = _CONDITION_RE.fullmatch(part)
+        if m is None:
+            return None
+        conditions.append(Condition(*m.groups()))
+
+    for cond in conditions:
+        if cond.op == "~":
+            re.compile(cond.value, flags)
+    return conditions
+
+def is_structured(pattern: str) -> bool:
+    return parse_query(pattern) is not None
+
+
+def form_matcher(conditions: Sequence[Condition], flags: int = 0):
+    """Function telling whether one tagged form satisfies every condition (for token streams, without an index)."""
+    from .tagger import parse_tagged_form
+
+    tests = []
+    for cond in conditions:
+        part = FIELDS.index(cond.field)
+        if cond.op == "=" and not flags & re.IGNORECASE:
+            tests.append(lambda fields, part=part, value=cond.value: fields[part] == value)
+        else:
+            rx = re.compile(cond.probe(flags)[1] if cond.op == "=" else cond.value, flags)
+            tests.append(lambda fields, part=part, search=rx.search: search(fields[part]) is not None)
+
+    def matches(tagged_form: str | None) -> bool:
+        if tagged_form is None:
+            return False
+        fields = parse_tagged_form(tagged_form)
+        return all(test(fields) for test in tests)
+
+    return matches
+
+
+# ----------------------------------------------------------------------
+# Indexes
+# ----------------------------------------------------------------------
+
+class FieldIndex:
+    """
+    Lemma and INFL indexes over a list of distinct tagged forms (e.g. a corpus' tagged ids).
+
+    For each field:
+        ids[field]          value -> ids of the forms with that value (hash index)
+        sorted[field]       the distinct values, sorted (prefix ranges)
+        reversed[field]     the distinct values spelled backwards, sorted (suffix ranges)
+    """
+
+    def __init__(self, forms: Sequence[str | None]) -> None:
+        from .tagger import parse_tagged_form
+
+        self.ids: dict[str, dict[str, list[int]]] = {field: {} for field in FIELDS}
+        for f, form in enumerate(forms):
+            if form is None:
+                continue
+            for field, value in zip(FIELDS, parse_tagged_form(form)):
+                self.ids[field].setdefault(value, []).append(f)
+
+        self.sorted = {field: sorted(ids) for field, ids in self.ids.items()}
+        self.reversed = {field: sorted(value[::-1] for value in ids) for field, ids in self.ids.items()}
+
+    def values(self, cond: Condition, flags: int = 0) -> list[str]:
+        """The distinct values of `cond.field` that satisfy `cond`."""
+        kind, key = cond.probe(flags)
+        field = cond.field
+        if kind == "exact":
+            return [key] if key in self.ids[field] else []
+        if kind == "prefix":
+            return _with_prefix(self.sorted[field], key)
+        if kind == "suffix":
+            return [value[::-1] for value in _with_prefix(self.reversed[field], key[::-1])]
+        search = re.compile(key, flags).search
+        return [value for value in self.sorted[field] if search(value)]
+
+    def form_ids(self, conditions: Sequence[Condition], flags: int = 0) -> set[int]:
+        """Ids of the forms that satisfy every condition."""
+        matched: set[int] | None = None
+        for cond in conditions:
+            ids = self.ids[cond.field]
+            found = set(chain.from_iterable(ids[value] for value in self.values(cond, flags)))
+            matched = found if matched is None else matched & found
+            if not matched:
+                break
+        return matched or set()
+
+def _with_prefix(values: list[str], prefix: str) -> list[str]:
+    """The values of a sorted list that start with `prefix`."""
+    found = []
+    for i in range(bisect_left(values, prefix), len(values)):
+        if not values[i].startswith(prefix):
+            break
+        found.append(values[i])
+    return found
+
+
+# Field indexes of each corpus (or trigram index), with the number of forms they were built for
+_INDEXES: weakref.WeakKeyDictionary[object, tuple[int, FieldIndex]] = weakref.WeakKeyDictionary()
+
+def field_index(owner: object, forms: Sequence[str | None]) -> FieldIndex:
+    """
+    FieldIndex over `forms`, built once per `owner` (a Corpus with its tagged values,
+    or a TrigramIndex with its forms) and rebuilt when forms have been added.
+    """
+    size, index = _INDEXES.get(owner, (-1, None))
+    if size != len(forms):
+        with profiling.stage("field_index") as st:
+            index = FieldIndex(forms)
+            st.count(forms=len(forms))
+        _INDEXES[owner] = (len(forms), index)
+    return index
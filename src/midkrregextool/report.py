@@ -1,8 +1,12 @@
 # midkrregextool/report.py
 
 from __future__ import annotations      # Interpret type hints later
+from . import profiling
 from .model import Token
+from .corpus import Corpus
+from .yale import context_text
 from pathlib import Path
+from typing import Iterable
 import unicodedata
 
 DEFAULT_OUTPUT_ENCODING = "utf-16"
@@ -15,8 +19,8 @@ def format_hit(tok: Token) -> str:
     normalized_unicode = normalize_modern_only(tok.unicode_form)
     # Comment the following out if you need PUA forms.
     # return f"{tok.source_id} {tok.token_index} {tok.is_note} {tok.pua} {tok.unicode_form} {tok.yale}"
-    if tok.context is not None:
-        context = normalize_modern_only(tok.context)
+    if tok.context_id is not None:
+        context = context_text(tok.contexts, tok.context_id)
         # Highlighting the matched part in the context by enclosing it in <<...>>
         contextwords = context.split()
         contextwords[tok.token_index-1] = f"<<{contextwords[tok.token_index-1]}>>"
@@ -26,31 +30,59 @@ def format_hit(tok: Token) -> str:
         return f"{tok.source_id} {tok.token_index} {tok.is_note} [{tok.path}]\n\t[TOKEN]\t\t{normalized_unicode}\n\t[TAGGED-FORM]\t{tok.tagged_form}"
 
 def format_bigram(a: Token, b: Token) -> str:
-    normalized_unicode = normalize_modern_only(a.unicode_form) + " " + normalize_modern_only(b.unicode_form)
-    if a.context is not None:
-        context = normalize_modern_only(a.context)
+    return format_ngram((a, b))
+
+def format_ngram(toks: tuple[Token, ...]) -> str:
+    a, b = toks[0], toks[-1]
+    normalized_unicode = " ".join(normalize_modern_only(t.unicode_form) for t in toks)
+    tagged_forms = " ".join(f"{t.tagged_form}" for t in toks)
+    if a.context_id is not None:
+        context = context_text(a.contexts, a.context_id)
         # Highlighting the matched part in the context by enclosing it in <<...>>
         contextwords = context.split()
         contextwords[a.token_index-1] = f"<<{contextwords[a.token_index-1]}"
         contextwords[b.token_index-1] = f"{contextwords[b.token_index-1]}>>"
         context = " ".join(contextwords)
-        return f"{a.source_id} {a.token_index}-{b.token_index} {a.is_note} [{a.path}] \n\t[TOKEN]\t\t{normalized_unicode}\n\t[TAGGED-FORM]\t{a.tagged_form} {b.tagged_form} \n\t[CONTEXT]\t{context}"
+        return f"{a.source_id} {a.token_index}-{b.token_index} {a.is_note} [{a.path}] \n\t[TOKEN]\t\t{normalized_unicode}\n\t[TAGGED-FORM]\t{tagged_forms} \n\t[CONTEXT]\t{context}"
     else:
-        return f"{a.source_id} {a.token_index}-{b.token_index} {a.is_note} [{a.path}]\n\t[TOKEN]\t\t{normalized_unicode}\n\t[TAGGED-FORM]\t{a.tagged_form} {b.tagged_form}"
+        return f"{a.source_id} {a.token_index}-{b.token_index} {a.is_note} [{a.path}]\n\t[TOKEN]\t\t{normalized_unicode}\n\t[TAGGED-FORM]\t{tagged_forms}"
     # Comment the following out if you need PUA forms.
     # return f"{a.source_id} {a.token_index}-{b.token_index} {a.is_note} {a.pua} {b.pua} {a.unicode_form} {b.unicode_form} {a.yale} {b.yale}"
 
+# One hit of any length (1 token: format_hit, 2 or more: format_ngram)
+def format_tokens(hit: tuple[Token, ...]) -> str:
+    return format_hit(hit[0]) if len(hit) == 1 else format_ngram(hit)
+
 # Report on the command line
 
+# (bigram_flag is no longer needed: n-gram hits are printed according to their length.)
+
 def report_hits(hits: list[tuple[Token, ...]], bigram_flag: bool = False) -> None:
-    
-    # For bigram searches
-    if bigram_flag:
-        for (a,b) in hits:
-            print(format_bigram(a, b))
-    else:
-        for (tok,) in hits:
-            print(format_hit(tok))
+    with profiling.stage("report") as st:
+        for hit in hits:
+            print(format_tokens(hit))
+        st.count(matches=len(hits))
+        if hits:
+            st.set_file(hits[0][0].path)
+
+# Report hits as they are found (see search.iter_search_tokens); returns the number of hits printed.
+
+def report_hit_stream(hits: Iterable[tuple[Token, ...]], bigram_flag: bool = False) -> int:
+    count = 0
+    for hit in hits:
+        print(format_tokens(hit), flush=True)
+        count += 1
+    return count
+
+# Report hits given as corpus rows (see corpus.py); views are created only for the printed tokens.
+
+def report_row_hits(corpus: Corpus, hits: list[tuple[int, ...]], bigram_flag: bool = False) -> None:
+    with profiling.stage("report") as st:
+        for rows in hits:
+            print(format_tokens(corpus.views(rows)))
+        st.count(matches=len(hits))
+        if hits:
+            st.set_file(corpus.view(hits[0][0]).path)
 
 # def report_bigram_hits(hits: list[tuple[Token, ...]], *, pattern: str, comment: str | None = None) -> None:
 #     print(f"[INFO] pattern={pattern!r} hits={len(hits)} comments={comment!r}")
@@ -93,15 +125,17 @@ def confirm_overwrite(path: Path) -> bool:
     return ask_yes_no(f"[WARN] '{path}' already exists. Overwrite?")
 
 # Save the results file.
-def write_hits(path: Path, hits: list[tuple[Token, ...]], *, pattern: str, purpose: str | None = None, note: str | None = None) -> None:
-    with open(path, "w", encoding=DEFAULT_OUTPUT_ENCODING, newline="\n") as f:
+# `lines`, if given, are written instead of the formatted hits (e.g. the lines of a concordance, see kwic.py).
+def write_hits(path: Path, hits: list[tuple[Token, ...]], *, pattern: str, purpose: str | None = None, note: str | None = None, lines: list[str] | None = None) -> None:
+    with profiling.stage("write", file=path) as st, open(path, "w", encoding=DEFAULT_OUTPUT_ENCODING, newline="\n") as f:
         f.write(f"# pattern={pattern!r} hits={len(hits)} purpose={purpose!r} note={note!r}\n")
-        if " " in pattern:
-            for a, b in hits:
-                f.write(format_bigram(a,b) + "\n")
+        if lines is not None:
+            for line in lines:
+                f.write(line + "\n")
         else:
-            for (tok,) in hits:
-                f.write(format_hit(tok) + "\n")
+            for hit in hits:
+                f.write(format_tokens(hit) + "\n")
+        st.count(matches=len(hits))
 
 # def write_bigram_hits(path: Path, hits: list[tuple[Token, ...]], *, pattern: str, comment: str | None = None) -> None:
 #     with open(path, "w", encoding=DEFAULT_OUTPUT_ENCODING, newline="\n") as f:
@@ -109,7 +143,7 @@ def write_hits(path: Path, hits: list[tuple[Token, ...]], *, pattern: str, purpo
 #         for a, b in hits:
 #             f.write(format_bigram(a,b) + "\n")
 
-def maybe_save_hits(hits: list[tuple[Token, ...]], *, pattern: str, purpose: str | None = None) -> None:
+def maybe_save_hits(hits: list[tuple[Token, ...]], *, pattern: str, purpose: str | None = None, lines: list[str] | None = None) -> None:
     if not hits:
         print("[INFO] No hits to save.")
         return
@@ -124,5 +158,5 @@ def maybe_save_hits(hits: list[tuple[Token, ...]], *, pattern: str, purpose: str
     
     note = input("Enter note for the current search (or press Enter to skip): ").strip()
     
-    write_hits(path, hits, pattern=pattern, purpose=purpose, note=note)
+    write_hits(path, hits, pattern=pattern, purpose=purpose, note=note, lines=lines)
     print(f"[INFO] Saved to: {path}")
\ No newline at end of file
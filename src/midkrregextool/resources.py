@@ -0,0 +1,107 @@
+# resources.py
+
+"""
+Precompiled tagger resources.
+
+The tagger needs the inflectional suffixes (infl_suffixes.txt) and the lemma whitelist
+(lemma_whitelist.txt) sorted longest first, and a trie over each of them. Instead of
+reading, sorting and building these on every run, they are stored once, marshalled, in
+`resources.bin` next to the text files:
+
+    MAGIC | format version | marshal((checksums, infl_suffixes, lemma_list, lemma_trie, suffix_trie))
+
+`checksums` are the CRC-32s of the text files the tables were built from. If a text file
+was edited (or the binary file is missing, corrupt or from another format version),
+load_resources() falls back to the text files, so the results never depend on a stale table.
+Rebuild the binary file after editing the resources with:
+
+    python -m midkrregextool.resources
+"""
+
+from __future__ import annotations
+
+import marshal
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+
+RESOURCE_FORMAT_VERSION = 1
+MAGIC = b"MKRT"
+
+_HERE = Path(__file__).parent
+SOURCE_FILES = ("infl_suffixes.txt", "lemma_whitelist.txt")
+COMPILED_PATH = _HERE / "resources.bin"
+
+
+@dataclass(frozen=True)
+class TaggerResources:
+    infl_suffixes: list[str]        # longest first
+    lemma_list: list[str]           # longest first
+    lemma_trie: dict
+    suffix_trie: dict               # over the reversed suffixes
+
+
+def source_checksums(directory: Path = _HERE) -> tuple[int, ...]:
+    """CRC-32 of each resource text file (cheap: the files are a few KB)."""
+    return tuple(zlib.crc32((directory / name).read_bytes()) for name in SOURCE_FILES)
+
+
+def compile_resources() -> TaggerResources:
+    """Build the tables from the text files."""
+    from .tagger import _build_trie, load_infl_suffixes, load_lemma_whitelist
+
+    infl_suffixes = load_infl_suffixes()
+    # Sorted by name first, so that the table does not depend on set order.
+    lemma_list = sorted(sorted(load_lemma_whitelist()), key=len, reverse=True)
+    return TaggerResources(
+        infl_suffixes=infl_suffixes,
+        lemma_list=lemma_list,
+        lemma_trie=_build_trie(lemma_list),
+        suffix_trie=_build_trie(suf[::-1] for suf in infl_suffixes),
+    )
+
+
+def write_compiled(path: Path = COMPILED_PATH) -> TaggerResources:
+    """Compile the text files into `path`; return the tables."""
+    res = compile_resources()
+    payload = (source_checksums(), res.infl_suffixes, res.lemma_list, res.lemma_trie, res.suffix_trie)
+    with open(path, "wb") as f:
+        f.write(MAGIC + RESOURCE_FORMAT_VERSION.to_bytes(2, "little") + marshal.dumps(payload))
+    return res
+
+
+def load_compiled(path: Path = COMPILED_PATH) -> TaggerResources | None:
+    """Load the binary tables, or return None if they are missing, invalid or out of date."""
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+
+    header = MAGIC + RESOURCE_FORMAT_VERSION.to_bytes(2, "little")
+    if not data.startswith(header):
+        return None
+    try:
+        checksums, infl_suffixes, lemma_list, lemma_trie, suffix_trie = marshal.loads(data[len(header):])
+    except (EOFError, ValueError, TypeError):
+        return None
+
+    try:
+        if tuple(checksums) != source_checksums(path.parent):
+            return None
+    except OSError:
+        return None
+
+    return TaggerResources(infl_suffixes, lemma_list, lemma_trie, suffix_trie)
+
+
+def load_resources() -> TaggerResources:
+    """The tagger tables: precompiled if up to date, otherwise built from the text files."""
+    res = load_compiled()
+    if res is None:
+        res = compile_resources()
+    return res
+
+
+if __name__ == "__main__":
+    write_compiled()
+    print(f"[INFO] Wrote {COMPILED_PATH}")
@@ -3,52 +3,329 @@
 """
 Regex-based search tool over token representations (default: Yale).
 
-Primary entry point:
-    search_tokens(tokens, patterns, *, flags=0)
+Primary entry points:
+    search_tokens(tokens, patterns, *, flags=0, index=None)     -> hits as Token tuples
+    search_corpus(corpus, pattern, *, flags=0, index=None)      -> hits as row tuples
+    matching_form_ids(corpus, pattern, flags=0)                 -> tagged form ids matched by a monogram pattern
+    is_ngram_pattern(pattern)                                   -> whether a pattern finds n-grams
+    ngram_size(pattern)                                         -> tokens per hit of an n-gram pattern
+    iter_ngram_spans(corpus, pattern, flags=0, *, index=None)   -> (first, last) rows of n-gram hits
+    iter_search_tokens(tokens, pattern, *, flags=0)             -> hits as Token tuples, streamed
+    filter_row_hits(corpus, row_hits, pattern, flags=0)         -> previous hits that the pattern matches
+
+If a TrigramIndex over the same tokens is given, the pattern is first turned into a
+trigram query (see index.py) and only the candidate tokens are checked with the regex.
+
+N-gram search (any pattern containing a literal space):
+    A pattern with k literal spaces outside character classes (at least one: a space only
+    inside e.g. [^ ] still makes a pair search) is checked against every window of k+1 consecutive
+    tokens of one segment (tokens of one file with the same is_note value): the tagged
+    forms of the window are joined by single spaces and the regex is searched in that
+    string, exactly as the original pair search did for bigrams. Every hit is therefore
+    k+1 tokens long, overlapping windows are all reported, and `^` / `$` match at the
+    start / end of the window. All search paths (token lists, corpus, stream) share this
+    rule (see ngram_size and _window_starts).
+
+    On a corpus, the forms of each segment are joined once (see Corpus.joined_segments)
+    and a window is a slice of that string, so no string is built per token.
+
+Structured queries (e.g. "lem=pwuthye infl~^si", see query.py):
+    Patterns made only of lemma / INFL conditions are answered from hash and sorted
+    indexes over the distinct lemmas and INFL suffixes instead of a regex. Their
+    spaces separate conditions, so they always find single tokens.
 """
 
 from __future__ import annotations
 
 import re
-from typing import Iterable, TypeAlias
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from typing import Iterable, Iterator, TypeAlias
 
+from . import profiling
+from .corpus import Corpus, join_forms
+from .index import TrigramIndex, literal_spaces, plan_query
 from .model import Token
+from .query import field_index, form_matcher, parse_query
 
 Hits: TypeAlias = list[tuple[Token, ...]]
+RowHits: TypeAlias = list[tuple[int, ...]]
+
+def is_ngram_pattern(pattern: str) -> bool:
+    """Whether `pattern` is searched over several tokens (a regex with a literal space, not a structured query)."""
+    return " " in pattern and parse_query(pattern) is None
 
-def search_tokens(tokens: list[Token], pattern: str, flags=0) -> Hits:
+def ngram_size(pattern: str) -> int:
+    """
+    Number of tokens of each hit of an n-gram pattern: one more than the literal spaces it matches
+    outside character classes (see index.literal_spaces), and at least 2, since any pattern with a
+    space in it is searched over pairs of tokens, as the original bigram search did.
+    """
+    return max(literal_spaces(pattern), 1) + 1
+
+def _window_starts(rx: re.Pattern, text: str, offsets: array, size: int, candidates: Iterable[int] | None = None) -> list[int]:
+    """
+    Positions (within one joined segment) of the first token of every window of `size` tokens
+    whose joined forms `rx` matches, in order. `candidates` limits the windows checked.
+    """
+    n = len(offsets)
+    if n < size:
+        return []
+    search = rx.search
+    # Where each token starts, and where a token after the last one would start
+    bounds = offsets.tolist()
+    bounds.append(len(text) + 1)
+    if candidates is None:
+        candidates = range(n - size + 1)
+    # A window is its forms, without the separator that follows them.
+    return [first for first in candidates if search(text[bounds[first]:bounds[first + size] - 1])]
+
+# Checking a window is cheap (a slice of the joined segment), so the index is only
+# consulted for n-grams when it rules out most windows.
+NGRAM_INDEX_FRACTION = 1 / 8
+
+def _segment_windows(segments: list[tuple], size: int, starts: list[int] | None) -> Iterator[tuple[tuple, list[int] | None]]:
+    """
+    (segment, candidate window starts relative to the segment's start) for the (start, end, ...)
+    segments to check: all of them (candidates None) without `starts` from the index,
+    otherwise only those holding a candidate window.
+    """
+    if starts is None:
+        for seg in segments:
+            yield seg, None
+        return
+
+    seg_starts = [seg[0] for seg in segments]
+    i = 0
+    while i < len(starts):
+        seg = segments[bisect_right(seg_starts, starts[i]) - 1]
+        start, end = seg[0], seg[1]
+        j = bisect_left(starts, end, i)
+        candidates = [row - start for row in starts[i:j] if row + size <= end]
+        if candidates:
+            yield seg, candidates
+        i = j
+
+def search_tokens(tokens: list[Token], pattern: str, flags=0, *, index: TrigramIndex | None = None) -> Hits:
     """
     Input:
 
     Output:
     
     """
-    rx = re.compile(pattern, flags)
     toks = list(tokens)
+    with profiling.stage("search") as st:
+        hits = _search_tokens(toks, pattern, flags, index=index)
+        st.count(tokens=len(toks), matches=len(hits))
+    return hits
 
-    # Bigram search
+def _search_tokens(toks: list[Token], pattern: str, flags: int, *, index: TrigramIndex | None) -> Hits:
+    # Structured query: lemma / INFL indexes over the index's forms, or one check per distinct form
+    conditions = parse_query(pattern, flags)
+    if conditions is not None:
+        if index is not None:
+            matched = field_index(index, index.forms).form_ids(conditions, flags)
+            return [(toks[i],) for i in index.token_positions(matched)]
+        matches = _memoized_matcher(form_matcher(conditions, flags))
+        return [(tok,) for tok in toks if matches(tok.tagged_form)]
+
+    rx = re.compile(pattern, flags)
+
+    query = plan_query(pattern, flags) if index is not None else None
+
+    # N-gram search over the windows of each segment
     if " " in pattern:
         hits: Hits = []
-        for i in range(len(toks) - 1):
-            a, b = toks[i], toks[i + 1]
+        size = ngram_size(pattern)
 
-            joined = f"{a.tagged_form} {b.tagged_form}"
-            # print(joined)
+        # Windows never span two files, or tokens that differ in their is_note value.
+        segments = []
+        start = 0
+        for i in range(1, len(toks) + 1):
+            if i == len(toks) or toks[i].is_note != toks[i - 1].is_note or toks[i].path != toks[i - 1].path:
+                segments.append((start, i))
+                start = i
 
-            # Exclude the matching result if the two tokens differ in their is_note value.
-            if a.is_note != b.is_note:
-                continue
-
-            if rx.search(joined):
-                hits.append((a,b))
+        starts = index.candidate_windows(query, size, max_fraction=NGRAM_INDEX_FRACTION) if query is not None else None
+        for (start, end), candidates in _segment_windows(segments, size, starts):
+            text, offsets = join_forms([f"{t.tagged_form}" for t in toks[start:end]])
+            for first in _window_starts(rx, text, offsets, size, candidates):
+                hits.append(tuple(toks[start + first:start + first + size]))
 
         return hits
     else:
         # Monogram search
         hits: Hits = []
+
+        if query is not None:
+            # Check each candidate form once, then collect the tokens that carry a matching form.
+            candidates = index.candidate_forms(query)
+            if candidates is None:
+                candidates = range(len(index.forms))
+            matched = [f for f in candidates if rx.search(index.forms[f])]
+            return [(toks[i],) for i in index.token_positions(matched)]
+
         for tok in toks:
 
             if rx.search(tok.tagged_form):
                 hits.append((tok,))
 
-        return hits
\ No newline at end of file
+        return hits
+
+
+def _memoized_matcher(matches):
+    """`matches` with its result remembered per tagged form (the vocabulary is much smaller than the text)."""
+    seen: dict[str | None, bool] = {}
+
+    def memoized(form: str | None) -> bool:
+        result = seen.get(form)
+        if result is None:
+            result = seen[form] = matches(form)
+        return result
+
+    return memoized
+
+
+def iter_search_tokens(tokens: Iterable[Token], pattern: str, flags=0) -> Iterator[tuple[Token, ...]]:
+    """
+    Streaming version of `search_tokens`: yield each hit as soon as its token(s) arrive.
+
+    A pattern with k literal spaces is checked against each window of k+1 consecutive tokens
+    (of the same file and is_note value), so only the last k tokens are kept around and
+    `tokens` can be a generator over a file of any size. For bigrams this is the same as
+    `search_tokens`; longer patterns are limited to their window here.
+    """
+    # Structured query: each distinct form is checked once
+    conditions = parse_query(pattern, flags)
+    if conditions is not None:
+        matches = _memoized_matcher(form_matcher(conditions, flags))
+        for tok in tokens:
+            if matches(tok.tagged_form):
+                yield (tok,)
+        return
+
+    rx = re.compile(pattern, flags)
+
+    # Monogram search
+    if " " not in pattern:
+        for tok in tokens:
+            if rx.search(tok.tagged_form):
+                yield (tok,)
+        return
+
+    # N-gram search over a sliding window (a one-token lookbehind for bigrams)
+    window: deque[Token] = deque(maxlen=ngram_size(pattern))
+    for tok in tokens:
+        # Windows never span two files, or tokens that differ in their is_note value.
+        if window and (window[-1].path != tok.path or window[-1].is_note != tok.is_note):
+            window.clear()
+        window.append(tok)
+        if len(window) < window.maxlen:
+            continue
+
+        if rx.search(" ".join(f"{t.tagged_form}" for t in window)):
+            yield tuple(window)
+
+
+def search_corpus(corpus: Corpus, pattern: str, flags=0, *, index: TrigramIndex | None = None) -> RowHits:
+    """
+    Same search as `search_tokens`, over a columnar Corpus.
+
+    Hits are tuples of corpus rows. The regex runs once per distinct tagged form
+    for monograms, and once over each joined segment for n-grams.
+    """
+    with profiling.stage("search") as st:
+        hits = _search_corpus(corpus, pattern, flags, index=index)
+        st.count(tokens=len(corpus), matches=len(hits))
+    return hits
+
+def _search_corpus(corpus: Corpus, pattern: str, flags: int, *, index: TrigramIndex | None) -> RowHits:
+    # Structured query: index probes, then the postings of the matched forms
+    conditions = parse_query(pattern, flags)
+    if conditions is not None:
+        matched = field_index(corpus, corpus.tagged.values).form_ids(conditions, flags)
+        if index is not None:
+            return [(row,) for row in index.token_positions(matched)]
+        return [(row,) for row, f in enumerate(corpus.tagged_ids) if f in matched]
+
+    # N-gram search over the windows of the corpus' joined segments (built once per corpus)
+    if " " in pattern:
+        size = ngram_size(pattern)
+        starts = _ngram_starts(corpus, pattern, flags, index=index)
+        if size == 2:
+            return [(first, first + 1) for first in starts]
+        return [tuple(range(first, first + size)) for first in starts]
+
+    # Monogram search
+    if index is not None:
+        rx = re.compile(pattern, flags)
+        candidates = index.candidate_forms(plan_query(pattern, flags))
+        if candidates is None:
+            candidates = range(len(index.forms))
+        matched = [f for f in candidates if rx.search(index.forms[f])]
+        return [(row,) for row in index.token_positions(matched)]
+
+    matched_ids = matching_form_ids(corpus, pattern, flags)
+    return [(row,) for row, f in enumerate(corpus.tagged_ids) if f in matched_ids]
+
+def matching_form_ids(corpus: Corpus, pattern: str, flags=0) -> set[int]:
+    """
+    Ids of the distinct tagged forms of `corpus` that a monogram pattern matches (the regex runs once per form).
+
+    Structured queries are looked up in the corpus' lemma / INFL indexes instead.
+    """
+    conditions = parse_query(pattern, flags)
+    if conditions is not None:
+        return field_index(corpus, corpus.tagged.values).form_ids(conditions, flags)
+
+    rx = re.compile(pattern, flags)
+    return {f for f, form in enumerate(corpus.tagged.values) if form is not None and rx.search(form)}
+
+def filter_row_hits(corpus: Corpus, row_hits: RowHits, pattern: str, flags=0) -> RowHits:
+    """
+    The hits of `row_hits` whose tagged forms, joined by single spaces, `pattern` matches
+    (searching within previous results: the hits themselves are re-checked, nothing is searched anew).
+
+    A structured query keeps the hits with a token that satisfies it.
+    """
+    forms = corpus.tagged.values
+    ids = corpus.tagged_ids
+
+    conditions = parse_query(pattern, flags)
+    if conditions is not None:
+        matches = _memoized_matcher(form_matcher(conditions, flags))
+        return [rows for rows in row_hits if any(matches(forms[ids[row]]) for row in rows)]
+
+    search = re.compile(pattern, flags).search
+    seen: dict[int, bool] = {}      # single-token hits: the regex runs once per distinct form
+    kept = []
+    for rows in row_hits:
+        if len(rows) == 1:
+            f = ids[rows[0]]
+            found = seen.get(f)
+            if found is None:
+                found = seen[f] = forms[f] is not None and search(forms[f]) is not None
+        else:
+            found = search(" ".join(forms[ids[row]] or "" for row in rows)) is not None
+        if found:
+            kept.append(rows)
+    return kept
+
+def iter_ngram_spans(corpus: Corpus, pattern: str, flags=0, *, index: TrigramIndex | None = None) -> Iterator[tuple[int, int]]:
+    """(first row, last row) of every hit of an n-gram pattern, in row order, without building the row tuples."""
+    last = ngram_size(pattern) - 1
+    for first in _ngram_starts(corpus, pattern, flags, index=index):
+        yield first, first + last
+
+def _ngram_starts(corpus: Corpus, pattern: str, flags: int, *, index: TrigramIndex | None) -> list[int]:
+    """First row of every hit of an n-gram pattern, in row order."""
+    rx = re.compile(pattern, flags)
+    size = ngram_size(pattern)
+
+    starts = index.candidate_windows(plan_query(pattern, flags), size, max_fraction=NGRAM_INDEX_FRACTION) if index is not None else None
+    rows: list[int] = []
+    for (start, end, text, offsets), candidates in _segment_windows(corpus.joined_segments(), size, starts):
+        found = _window_starts(rx, text, offsets, size, candidates)
+        rows.extend([start + first for first in found] if start else found)
+    return rows
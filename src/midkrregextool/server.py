@@ -0,0 +1,248 @@
+# server.py
+
+"""
+Local query server: load a corpus once, answer searches over HTTP.
+
+Started with `midkrregextool serve --path ...` (see cli.py). The server listens on
+localhost (or on a Unix socket) and keeps the Corpus and its TrigramIndex in memory,
+so a search only costs the search itself.
+
+Endpoints:
+
+    GET  /info      {"files": [...], "tokens": N}
+    POST /search    JSON request, streamed response
+
+Search request (only "pattern" is required):
+
+    {
+        "pattern": "LEM-i/INFL \\\\S+/LEM",
+        "ignore_case": false,
+        "filters": {"path": "*.txt", "source": "^釋詳3", "is_note": "MAIN"},
+        "format": "jsonl",          # or "text" (the CLI's report format)
+        "limit": 100                # at most this many hits (default: all)
+    }
+
+With "jsonl", every hit is sent as one JSON object per line as soon as it is formatted,
+followed by a final {"done": true, "hits": N, "elapsed_ms": ...} line. Errors are
+returned as {"error": "..."} with status 400.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import socketserver
+import stat
+import time
+from fnmatch import fnmatch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator
+
+from .corpus import Corpus
+from .index import TrigramIndex
+from .query import parse_query
+from .report import format_tokens
+from .search import RowHits, search_corpus
+from .yale import context_text
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+FORMATS = ("jsonl", "text")
+
+
+class QueryError(ValueError):
+    """A request that cannot be answered (reported to the client as a 400)."""
+
+
+class QueryService:
+    """Searches over one preloaded corpus; shared by all request threads (read-only)."""
+
+    def __init__(self, corpus: Corpus, index: TrigramIndex | None = None) -> None:
+        self.corpus = corpus
+        self.index = index if index is not None else TrigramIndex.from_corpus(corpus)
+        # Built lazily by the first n-gram search otherwise; build it before threads share the corpus.
+        corpus.joined_segments()
+
+    def info(self) -> dict:
+        return {
+            "files": [{"path": str(p), "tokens": end - start} for p, start, end in self.corpus.files],
+            "tokens": len(self.corpus),
+        }
+
+    def search(self, request: dict) -> tuple[str, Iterator[str]]:
+        """Validate a search request; return (format, generator of output lines)."""
+        pattern = request.get("pattern")
+        if not isinstance(pattern, str) or not pattern:
+            raise QueryError("'pattern' must be a non-empty string")
+
+        fmt = request.get("format", "jsonl")
+        if fmt not in FORMATS:
+            raise QueryError(f"'format' must be one of {', '.join(FORMATS)}")
+
+        limit = request.get("limit")
+        if limit is not None and (not isinstance(limit, int) or limit < 0):
+            raise QueryError("'limit' must be a non-negative integer")
+
+        flags = re.IGNORECASE if request.get("ignore_case") else 0
+        try:
+            re.compile(pattern, flags)
+            parse_query(pattern, flags)     # regex conditions of a structured query
+        except re.error as e:
+            raise QueryError(f"invalid pattern: {e}")
+
+        keep = self._row_filter(request.get("filters") or {})
+
+        started = time.perf_counter()
+        hits = search_corpus(self.corpus, pattern, flags, index=self.index)
+        if keep is not None:
+            hits = [h for h in hits if keep(h[0])]
+        if limit is not None:
+            hits = hits[:limit]
+
+        return fmt, self._lines(fmt, hits, started)
+
+    def _row_filter(self, filters: dict):
+        """Turn request filters into a predicate on the first row of a hit (None = no filter)."""
+        if not isinstance(filters, dict):
+            raise QueryError("'filters' must be an object")
+        c = self.corpus
+        checks = []
+
+        if "path" in filters:
+            glob = str(filters["path"])
+            ids = {i for i, p in enumerate(c.paths.values) if fnmatch(str(p), glob) or fnmatch(Path(p).name, glob)}
+            checks.append(lambda row: c.path_ids[row] in ids)
+
+        if "source" in filters:
+            try:
+                rx = re.compile(str(filters["source"]))
+            except re.error as e:
+                raise QueryError(f"invalid source filter: {e}")
+            ids = {i for i, s in enumerate(c.sources.values) if s is not None and rx.search(s)}
+            checks.append(lambda row: c.source_ids[row] in ids)
+
+        if "is_note" in filters:
+            note_id = c.notes.id_of(filters["is_note"])
+            checks.append(lambda row: c.note_ids[row] == note_id)
+
+        unknown = set(filters) - {"path", "source", "is_note"}
+        if unknown:
+            raise QueryError(f"unknown filter(s): {', '.join(sorted(unknown))}")
+
+        if not checks:
+            return None
+        return lambda row: all(check(row) for check in checks)
+
+    def _lines(self, fmt: str, hits: RowHits, started: float) -> Iterator[str]:
+        c = self.corpus
+        for rows in hits:
+            toks = c.views(rows)
+            if fmt == "text":
+                yield format_tokens(toks) + "\n"
+                continue
+            first = toks[0]
+            record = {
+                "path": str(first.path),
+                "source_id": first.source_id,
+                "token_index": [t.token_index for t in toks],
+                "is_note": first.is_note,
+                "unicode": " ".join(f"{t.unicode_form}" for t in toks),
+                "tagged_form": " ".join(f"{t.tagged_form}" for t in toks),
+            }
+            if first.context_id is not None:
+                record["context"] = context_text(first.contexts, first.context_id)
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+        summary = {"done": True, "hits": len(hits), "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)}
+        yield (json.dumps(summary) if fmt == "jsonl" else f"# {json.dumps(summary)}") + "\n"
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "midkrregextool"
+
+    # The QueryService is reached through self.server.service (set by make_server()).
+
+    def log_message(self, format: str, *args) -> None:
+        # Unix-socket clients have no address, so log the request line only.
+        print(f"[INFO] {format % args}")
+
+    def _send_json(self, status: int, body: dict) -> None:
+        data = (json.dumps(body, ensure_ascii=False) + "\n").encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") == "/info":
+            self._send_json(200, self.server.service.info())
+        else:
+            self._send_json(404, {"error": f"unknown endpoint {self.path}"})
+
+    def do_POST(self) -> None:
+        if self.path.rstrip("/") != "/search":
+            self._send_json(404, {"error": f"unknown endpoint {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(request, dict):
+                raise QueryError("request body must be a JSON object")
+            fmt, lines = self.server.service.search(request)
+        except (QueryError, ValueError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        # Stream the hits with chunked transfer encoding as they are formatted.
+        self.send_response(200)
+        content_type = "application/x-ndjson" if fmt == "jsonl" else "text/plain"
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        buffer: list[bytes] = []
+        size = 0
+        for line in lines:
+            data = line.encode("utf-8")
+            buffer.append(data)
+            size += len(data)
+            if size >= 1 << 16:
+                self._write_chunk(b"".join(buffer))
+                buffer, size = [], 0
+        if buffer:
+            self._write_chunk(b"".join(buffer))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        # BaseHTTPRequestHandler expects a (host, port) client address.
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+def make_server(service: QueryService, *, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, socket_path: Path | None = None):
+    """Create (but do not start) an HTTP server for `service`, on TCP or on a Unix socket."""
+    if socket_path is not None:
+        # Only a stale socket is removed; any other file at that path is left alone.
+        if socket_path.exists():
+            if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+                raise SystemExit(f"[Error] {socket_path} exists and is not a socket; choose another --socket path.")
+            os.unlink(socket_path)
+        server = _ThreadingUnixHTTPServer(str(socket_path), RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.service = service
+    return server
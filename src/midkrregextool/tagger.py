@@ -1,11 +1,17 @@
 # tagger.py
 
 from __future__ import annotations
+from . import profiling
 from .model import Token
 from pathlib import Path
 from collections import Counter
+from functools import lru_cache
+from typing import TYPE_CHECKING, Iterable, Iterator
 import unicodedata, re
 
+if TYPE_CHECKING:
+    from .resources import TaggerResources
+
 def load_infl_suffixes() -> list[str]:
     path = Path(__file__).with_name("infl_suffixes.txt")
     with open(path, encoding="utf-8") as f:
@@ -35,95 +41,224 @@ def load_lemma_whitelist() -> set[str]:
 
     return lemmas
 
+# Han characters are looked up by Unicode name ("CJK UNIFIED IDEOGRAPH..."), as before.
+# The compiled class below only pre-selects characters from the blocks that can carry such a name,
+# so pure-Yale strings never reach unicodedata at all.
+_HAN_CANDIDATE_RE = re.compile("[\u3400-\u9FFF\U0001F200-\U0001F2FF\U00020000-\U000323AF]")
+
+@lru_cache(maxsize=None)
+def _is_han_char(ch: str) -> bool:
+    return "CJK UNIFIED IDEOGRAPH" in unicodedata.name(ch, "")
+
 def contains_han(s: str) -> bool:
-    for ch in s:
-        if "CJK UNIFIED IDEOGRAPH" in unicodedata.name(ch, ""):
+    if s.isascii():
+        return False
+    for m in _HAN_CANDIDATE_RE.finditer(s):
+        if _is_han_char(m.group()):
             return True
     return False
 
-def analyze_yale(
-        yale: str, 
-        infl_suffixes: list[str],
-        lemmas: list[str]) -> str:
-    
-    if not yale:
-        return ""   # guard against missing yale
-    
-    # Check if yale starts with an item in the whitelist.
+# Precompiled patterns used by the tagger
+HAN_VERB_RE = re.compile(r"^([\u4E00-\u9FFF]+ho)(.+)$")               # verb with a Sino-Korean root
+HAN_LEMMA_RE = re.compile(r"^([\u4E00-\u9FFF]+)([^\u4E00-\u9FFF]+)$")  # yale containing a non-Chinese character
+VOWEL_RE = re.compile(r"[aeiou]")
+
+# Marks the end of a key in a trie node. Never a character, so it cannot clash with a child.
+_END = ""
 
-    for lem in lemmas:
-        if yale.startswith(lem):
+def _build_trie(keys: Iterable[str]) -> dict:
+    """
+    Build a character trie (nested dicts) over `keys`.
+
+    Each terminal node stores the position of the key in `keys` under _END,
+    so that matches can be returned in the same order as a linear scan would find them.
+    """
+    root: dict = {}
+    for pos, key in enumerate(keys):
+        node = root
+        for ch in key:
+            node = node.setdefault(ch, {})
+        node.setdefault(_END, pos)   # keep the first occurrence of duplicated keys
+    return root
+
+def _trie_matches(trie: dict, s: str) -> list[tuple[int, int]]:
+    """Return (position, length) for every key in `trie` that is a prefix of `s`."""
+    matches = []
+    node = trie
+    for i, ch in enumerate(s):
+        node = node.get(ch)
+        if node is None:
+            break
+        pos = node.get(_END)
+        if pos is not None:
+            matches.append((pos, i + 1))
+    matches.sort()
+    return matches
+
+
+class Tagger:
+    """
+    Compiled lemma/inflection analyzer.
+
+    - lemmas are matched with a prefix trie,
+    - inflectional suffixes are matched with a trie over the reversed suffixes,
+    - results are memoized per distinct Yale form.
+
+    Matches are tried in the order of the given lists, so the results are identical to
+    scanning `lemmas` with startswith() and `infl_suffixes` with endswith().
+    """
+
+    def __init__(self, infl_suffixes: list[str], lemmas: Iterable[str]) -> None:
+        self.infl_suffixes = list(infl_suffixes)
+        self.lemmas = list(lemmas)
+        self._lemma_trie = _build_trie(self.lemmas)
+        self._suffix_trie = _build_trie(suf[::-1] for suf in self.infl_suffixes)
+        self._analyses: dict[str, str] = {}
+        self._splits: dict[str, tuple[str, str] | None] = {}
+
+    @classmethod
+    def from_resources(cls, res: TaggerResources) -> Tagger:
+        """Build a Tagger from precompiled tables (see resources.py), without rebuilding the tries."""
+        tagger = cls.__new__(cls)
+        tagger.infl_suffixes = list(res.infl_suffixes)
+        tagger.lemmas = list(res.lemma_list)
+        tagger._lemma_trie = res.lemma_trie
+        tagger._suffix_trie = res.suffix_trie
+        tagger._analyses = {}
+        tagger._splits = {}
+        return tagger
+
+    def match_lemma(self, yale: str) -> str | None:
+        """Return the first whitelisted lemma that `yale` starts with, or None."""
+        matches = _trie_matches(self._lemma_trie, yale)
+        if not matches:
+            return None
+        _, length = matches[0]
+        return yale[:length]
+
+    def _suffix_lengths(self, yale: str) -> list[int]:
+        """Lengths of the inflectional suffixes `yale` ends with, in list order."""
+        return [length for _, length in _trie_matches(self._suffix_trie, yale[::-1])]
+
+    def analyze(self, yale: str) -> str:
+        """Return the tagged form of `yale` (e.g. "hon/LEM-sini/INFL")."""
+        if not yale:
+            return ""   # guard against missing yale
+
+        tagged = self._analyses.get(yale)
+        if tagged is None:
+            tagged = self._analyze(yale)
+            self._analyses[yale] = tagged
+        return tagged
+
+    def _analyze(self, yale: str) -> str:
+
+        # Check if yale starts with an item in the whitelist.
+        lem = self.match_lemma(yale)
+        if lem is not None:
             suffix = yale[len(lem):]
             if not suffix:
                 return f"{lem}/LEM"
             else:
                 return f"{lem}/LEM-{suffix}/INFL"
 
-    # If not, 
+        # 1. check if yale contains Chinese character
+        if contains_han(yale):
+            m1 = HAN_VERB_RE.match(yale)
+            m2 = HAN_LEMMA_RE.match(yale)
 
-    has_han = contains_han(yale)
+            # 1-1. If yale contains a verbalizer, CH+ho/LEM.../INFL
+            if m1:
+                return f"{m1.group(1)}/LEM-{m1.group(2)}/INFL"
 
-    # 1. check if yale contains Chinese character
-    if has_han:
+            # 1-2. If yale contains any non-Chinese characters, parse a boundary between CH/LEM-...
+            elif m2:
+                return f"{m2.group(1)}/LEM-{m2.group(2)}/INFL"
 
-        # compiling regex pattern for Chinse characters
-        m1 = re.match(r"^([\u4E00-\u9FFF]+ho)(.+)$",yale)    # verb with a Sino-Korean root
-        m2 = re.match(r"^([\u4E00-\u9FFF]+)([^\u4E00-\u9FFF]+)$",yale)  # yale containing a non-Chinese character
-
-        # 1-1. If yale contains a verbalizer, CH+ho/LEM.../INFL
-        if m1:
-            lem = m1.group(1)
-            suf = m1.group(2)
-            return f"{lem}/LEM-{suf}/INFL"
+            # 1-3. else, yale is lemma.
+            else:
+                return f"{yale}/LEM"
 
-        # 1-2. If yale contains any non-Chinese characters, parse a boundary between CH/LEM-...
-        elif m2:
-            lem = m2.group(1)
-            suf = m2.group(2)
-            return f"{lem}/LEM-{suf}/INFL"
+        # 2. Check if yale ends with an item in the inflection list
+        for length in self._suffix_lengths(yale):
+            lem = yale[:-length]
+            if not lem:
+                return f"{yale}/LEM"
+            if not VOWEL_RE.search(lem):
+                continue
+            return f"{lem}/LEM-{yale[-length:]}/INFL"
 
-        # 1-3. else, yale is lemma.
-        else:
-            return f"{yale}/LEM"
+        # 3. the whole yale is lemma.
+        return f"{yale}/LEM"
 
-    
-    for suf in infl_suffixes:
-    # 2. Check if yale ends with an item in the inflection list
+    def split(self, yale: str) -> tuple[str, str] | None:
+        """Return (lem, infl) if a suffix matches; otherwise return None."""
+        if not yale:
+            return None # guard against missing yale
 
-        # Inspect longer suffixes first
+        try:
+            return self._splits[yale]
+        except KeyError:
+            pass
 
-        if yale.endswith(suf):
-            lem = yale[:-len(suf)]
-            if not lem:
-                return f"{yale}/LEM"
-            if not re.search(r"[aeiou]", lem):
+        result = None
+        for length in self._suffix_lengths(yale):
+            if length == len(yale):
                 continue
-            else:
-                return f"{lem}/LEM-{suf}/INFL"
-        else:
-            continue
-        
-    # 3. the whole yale is lemma.
+            # If lem does not contain any vowels, it is not lem.
+            lem = yale[:-length]
+            if VOWEL_RE.search(lem):
+                result = (lem, yale[-length:])
+                break
+
+        self._splits[yale] = result
+        return result
+
+
+@lru_cache(maxsize=8)
+def _cached_tagger(infl_suffixes: tuple[str, ...], lemmas: tuple[str, ...]) -> Tagger:
+    return Tagger(list(infl_suffixes), lemmas)
+
+def get_tagger(infl_suffixes: Iterable[str], lemmas: Iterable[str] = ()) -> Tagger:
+    """Return a compiled Tagger for the given resources, reusing one built earlier if possible."""
+    return _cached_tagger(tuple(infl_suffixes), tuple(lemmas))
+
+def analyze_yale(
+        yale: str, 
+        infl_suffixes: list[str],
+        lemmas: list[str]) -> str:
+    """Tag a single Yale form. See Tagger.analyze()."""
+    return get_tagger(infl_suffixes, lemmas).analyze(yale)
 
-    return f"{yale}/LEM"
+
+def parse_tagged_form(tagged_form: str | None) -> tuple[str, str]:
+    """
+    Return (lem, infl) of a tagged form: "hon/LEM-sini/INFL" -> ("hon", "sini"), "hon/LEM" -> ("hon", "").
+
+    Untagged forms (None or "") give ("", "").
+    """
+    if not tagged_form:
+        return "", ""
+    lem, _, rest = tagged_form.partition("/LEM")
+    if rest.startswith("-") and rest.endswith("/INFL"):
+        return lem, rest[1:-len("/INFL")]
+    return lem, ""
 
 
 def split_lem_infl(yale: str, infl_suffixes: list[str]) -> tuple[str, str] | None:
     """
     Return (lem, infl) if a suffix matches; otherwise return None.
     """
+    return get_tagger(infl_suffixes).split(yale)
 
-    if not yale:
-        return None # guard against missing yale
-    for suf in infl_suffixes:
-        if yale.endswith(suf) and len(yale) > len(suf):
-            # If lem does not contain any vowels, it is not lem.
-            if not re.search(r"[aeiou]", yale[:-len(suf)]):
-                continue
-            else:
-                lem = yale[:-len(suf)]
-                return (lem, suf)
-    return None
+def yale_frequencies(tokens: Iterable[Token]) -> Counter[str]:
+    """
+    Distinct Yale forms of `tokens` and how often each occurs.
+
+    Lemma and suffix discovery work on this table, so each distinct form is analyzed once
+    however often it occurs; since forms are Zipfian, the table is much smaller than the text.
+    """
+    return Counter(t.yale for t in tokens if t.yale)
 
 def dump_known_lemmas(
         tokens: list[Token],
@@ -131,26 +266,41 @@ def dump_known_lemmas(
         lemmas: set[str],
         *,
         min_count: int = 5,
-        top_k: int | None = None
+        top_k: int | None = None,
+        tagger: Tagger | None = None,
+) -> list[tuple[str, int]]:
+    return lemma_candidates(yale_frequencies(tokens), infl_suffixes, lemmas, min_count=min_count, top_k=top_k, tagger=tagger)
+
+def lemma_candidates(
+        freq: dict[str, int],
+        infl_suffixes: list[str],
+        lemmas: set[str],
+        *,
+        min_count: int = 5,
+        top_k: int | None = None,
+        tagger: Tagger | None = None,
 ) -> list[tuple[str, int]]:
+    """Same as dump_known_lemmas(), from a Yale form frequency table (see yale_frequencies)."""
+    if tagger is None:
+        tagger = get_tagger(infl_suffixes, lemmas)
+
     c = Counter()
-    for t in tokens:
-        yale = t.yale
+    for yale, n in freq.items():
 
         if not yale: # guard clause
             continue
 
-        if any(yale.startswith(L) for L in lemmas):
+        if tagger.match_lemma(yale) is not None:
             continue
 
         else:
             
-            r = split_lem_infl(yale, infl_suffixes)
+            r = tagger.split(yale)
             
             # If any inflectional suffix is not detected, suggest yale as a potential lemma.
             if r is None:
                 if not contains_han(yale):
-                    c[yale] += 1
+                    c[yale] += n
 
             else:
             
@@ -170,17 +320,17 @@ def dump_known_lemmas(
                 else:
 
                     # Filter if the candidate does not have any vowel
-                    if re.search(r"[aeiou]", lem) is None:
+                    if VOWEL_RE.search(lem) is None:
                         continue
                     else:
 
                         # If the lemma starts with a consonantal cluster, lemma must be longer than two characters. 
                         if lem.startswith("."):
                             if len(lem) > 2:
-                                c[lem] += 1
+                                c[lem] += n
 
                         elif len(lem) > 1:
-                            c[lem] += 1
+                            c[lem] += n
 
         
     
@@ -229,6 +379,56 @@ def ask_yes_no(msg: str) -> bool:
         print("Please type 'y' or 'n'.")
 
 
+def count_word_endings(freq: dict[str, int], *, max_len: int, proper: bool = False) -> Counter[str]:
+    """
+    Frequency-weighted counts of the endings of the words in `freq`, up to `max_len` characters:
+
+        counts[s] = sum of freq[w] over the words w that end with s
+                    (and are longer than s, if `proper`)
+
+    Instead of slicing every ending out of every word, the reversed words are sorted,
+    so that words sharing an ending are adjacent, like the suffixes of a suffix array;
+    the longest common prefix (LCP) of neighbours tells which endings a word shares with the
+    previous one. The endings of the current word are kept on a stack, shortest first, and
+    when an ending is no longer shared it is popped and its count (the words ending exactly
+    there plus those with longer endings) passed on to the next shorter one. Each distinct
+    ending is counted once, in time proportional to the vocabulary.
+    """
+    counts: Counter[str] = Counter()
+    stack: list[int] = []       # stack[L - 1]: count of the current word's ending of length L
+    prev = ""
+
+    def pop() -> None:
+        n = stack.pop()
+        if n:
+            counts[prev[len(stack)::-1]] = n     # prev[:L] reversed
+            if stack:
+                stack[-1] += n
+
+    for rev, n in sorted((w[::-1], n) for w, n in freq.items() if w):
+        # Length of the ending shared with the previous word
+        h, m = 0, min(len(prev), len(rev), max_len)
+        while h < m and prev[h] == rev[h]:
+            h += 1
+
+        while len(stack) > h:
+            pop()
+        stack.extend([0] * (min(len(rev), max_len) - len(stack)))
+
+        longest = min(len(rev) - 1 if proper else len(rev), max_len)
+        if longest >= 1:
+            stack[longest - 1] += n
+        prev = rev
+
+    while stack:
+        pop()
+    return counts
+
+def _unsplit_frequencies(freq: dict[str, int], tagger: Tagger) -> dict[str, int]:
+    """The forms of `freq` for which no known INFL suffix is found."""
+    split = tagger.split
+    return {yale: n for yale, n in freq.items() if yale and split(yale) is None}
+
 def propose_infl_suffixes(
         tokens: list[Token],
         infl_suffixes: list[str],
@@ -236,27 +436,16 @@ def propose_infl_suffixes(
         max_len: int = 10,
         min_count: int = 20,
         top_k: int = 50,
+        tagger: Tagger | None = None,
 ) -> list[tuple[str, int]]:
     """
     Look at tokens where split_lem_infl() fails, and propose frequent suffix strings (up to max_len) from the end of yale.    
     """
-    c = Counter()
-
-    # Counting suffix candidates
-
-    for t in tokens:
-        yale = t.yale
-        if not yale:
-            continue
-
-        # If the given suffix is already in the suffix list, skip.
-        if split_lem_infl(yale, infl_suffixes) is not None:
-            continue
+    if tagger is None:
+        tagger = get_tagger(infl_suffixes)
 
-        # collect suffix candidates of length 1..max_len from the end of the given yale string.
-        for L in range(1, min(max_len, len(yale))+1):
-            cand = yale[-L:]
-            c[cand] += 1
+    # Counting suffix candidates (every ending of length 1..max_len of the forms with no known suffix)
+    c = count_word_endings(_unsplit_frequencies(yale_frequencies(tokens), tagger), max_len=max_len)
 
     # Keep only frequent suffix candidates above the minimum count threshold (min_k)
     # sort by suffix length (desc), frequency (desc), then alphabetically
@@ -271,26 +460,76 @@ def update_suffix_counter(
         infl_suffixes: list[str],
         *,
         max_len: int = 6,
-        suffix_must_endwith: str | None = None
+        suffix_must_endwith: str | None = None,
+        tagger: Tagger | None = None,
 ) -> None:
-    for t in tokens:
-        yale = t.yale
-        if not yale:
-            continue
-        if split_lem_infl(yale, infl_suffixes) is not None:
-            continue
+    update_suffix_counter_from_frequencies(counter, yale_frequencies(tokens), infl_suffixes, max_len=max_len, suffix_must_endwith=suffix_must_endwith, tagger=tagger)
 
-        for L in range(1, min(len(yale), max_len) + 1):
-            if L < len(yale):
-                if suffix_must_endwith is not None:
-                    if len(suffix_must_endwith) >= len(yale):
-                        continue
+def update_suffix_counter_from_frequencies(
+        counter: Counter,
+        freq: dict[str, int],
+        infl_suffixes: list[str],
+        *,
+        max_len: int = 6,
+        suffix_must_endwith: str | None = None,
+        tagger: Tagger | None = None,
+) -> None:
+    """Same as update_suffix_counter(), from a Yale form frequency table (see yale_frequencies)."""
+    if tagger is None:
+        tagger = get_tagger(infl_suffixes)
 
-                    if yale.endswith(suffix_must_endwith) == False:
-                        continue
-                    counter[yale[-L:]] += 1
-                else:
-                    counter[yale[-L:]] += 1
+    words = _unsplit_frequencies(freq, tagger)
+    if suffix_must_endwith is not None:
+        words = {yale: n for yale, n in words.items() if len(suffix_must_endwith) < len(yale) and yale.endswith(suffix_must_endwith)}
+
+    # Proper endings only: a whole form is not a suffix candidate.
+    counter.update(count_word_endings(words, max_len=max_len, proper=True))
+
+class DiscoveryCounter:
+    """
+    Lemma and INFL suffix discovery as an ingest consumer (see pipeline.run_consumers).
+
+    Each file is collapsed into its Yale form frequency table, which feeds the suffix
+    counter (update_suffix_counter_from_frequencies) and/or the lemma counter
+    (the top `lemma_top_k` candidates of each file, see lemma_candidates).
+    """
+
+    def __init__(
+            self,
+            infl_suffixes: list[str],
+            lemma_list: list[str],
+            *,
+            tagger: Tagger | None = None,
+            suffix_proposals: bool = False,
+            suffix_max_len: int = 8,
+            suffix_must_endwith: str | None = None,
+            lemma_seed: bool = False,
+            lemma_top_k: int | None = 50,
+    ) -> None:
+        self.infl_suffixes = infl_suffixes
+        self.lemma_list = lemma_list
+        self.tagger = tagger if tagger is not None else get_tagger(infl_suffixes, lemma_list)
+        self.suffix_proposals = suffix_proposals
+        self.suffix_max_len = suffix_max_len
+        self.suffix_must_endwith = suffix_must_endwith
+        self.lemma_seed = lemma_seed
+        self.lemma_top_k = lemma_top_k
+
+        self.suffix_counter: Counter[str] = Counter()
+        self.lemma_counter: Counter[str] = Counter()
+
+    def consume(self, path: Path, tokens: list[Token]) -> None:
+        freq = yale_frequencies(tokens)
+
+        if self.suffix_proposals:
+            update_suffix_counter_from_frequencies(self.suffix_counter, freq, self.infl_suffixes, max_len=self.suffix_max_len, suffix_must_endwith=self.suffix_must_endwith, tagger=self.tagger)
+
+        if self.lemma_seed:
+            for lem, cnt in lemma_candidates(freq, self.infl_suffixes, self.lemma_list, top_k=self.lemma_top_k, tagger=self.tagger):
+                self.lemma_counter[lem] += cnt
+
+    def finish(self) -> None:
+        pass
 
 def finalize_suffix_proposals(
         counter: Counter,
@@ -326,15 +565,37 @@ def display_suffix_candidates(proposed_suffixes: list[tuple[str,int]]) -> None:
     for (suf, cnt) in proposed_suffixes:
         print(f"\t{suf}\t{cnt}")
 
-def tag_tokens(tokens: list[Token], infl_suffixes: list[str], lemma_list: list[str], *, debug_suffixes: bool = False) -> list[Token]:
+def tag_tokens(tokens: list[Token], infl_suffixes: list[str], lemma_list: list[str], *, debug_suffixes: bool = False, tagger: Tagger | None = None) -> list[Token]:
     """Enrich tokens with morphological tagging for downstream processing."""
 
+    if tagger is None:
+        tagger = get_tagger(infl_suffixes, lemma_list)
+
     if debug_suffixes:
-        proposals = propose_infl_suffixes(tokens, infl_suffixes)
+        proposals = propose_infl_suffixes(tokens, infl_suffixes, tagger=tagger)
         print("[DEBUG] Proposed INFL suffixes (candidate, count):")
         for suf, cnt in proposals:
             print(f"    {suf}\t{cnt}")
 
-    for token in tokens:
-        token.tagged_form = analyze_yale(token.yale, infl_suffixes, lemma_list)
+    with profiling.stage("tag") as st:
+        known = len(tagger._analyses)
+        analyze = tagger.analyze
+        for token in tokens:
+            token.tagged_form = analyze(token.yale)
+        # Each form is analyzed once; later occurrences come from the tagger's memo.
+        misses = len(tagger._analyses) - known
+        st.count(tokens=len(tokens), cache_hits=len(tokens) - misses, cache_misses=misses)
+        if tokens:
+            st.set_file(tokens[0].path)
     return tokens
+
+def iter_tag_tokens(tokens: Iterable[Token], infl_suffixes: list[str], lemma_list: list[str], *, tagger: Tagger | None = None) -> Iterator[Token]:
+    """Streaming version of tag_tokens() (without suffix proposals, which need every token first)."""
+
+    if tagger is None:
+        tagger = get_tagger(infl_suffixes, lemma_list)
+
+    analyze = tagger.analyze
+    for token in tokens:
+        token.tagged_form = analyze(token.yale)
+        yield token
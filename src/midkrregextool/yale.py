@@ -8,62 +8,309 @@ This module uses the external `YaleKorean` package to:
 Pipeline for each token (conceptually):
     token.pua               --(PUAtoUni)-->     token.unicode_form
     token.unicode_form      --(YaleMid)-->      token.yale
+
+A built-in "native" backend performs the same conversions with precomputed
+`str.translate` tables; YaleKorean remains the reference implementation.
+
+Conversions are memoized per distinct PUA form (`ConversionCache`),
+since a small vocabulary of forms makes up most tokens of a text.
 """
 
 from __future__ import annotations  # Prevent type errors
 
-from typing import Iterable
+import pickle
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Iterator
 
-from .model import Token
+from . import profiling
+from .model import ContextTable, Token
 
-try:
-    import YaleKorean   # type: ignore[import]
-except ImportError:     # pragma: no cover
-    YaleKorean = None
+# YaleKorean is imported on first use, so that runs that convert nothing (--help, cached files) never load it.
+YaleKorean = None
 
 class YaleKoreanNotInstalledError(ImportError):
     """Raised when the YaleKorean package is required but not installed."""
 
+def _import_yalekorean():
+    """Import YaleKorean on first use; return the module, or None if it is not installed."""
+    global YaleKorean
+    if YaleKorean is None:
+        try:
+            import YaleKorean as module   # type: ignore[import]
+        except ImportError:     # pragma: no cover
+            return None
+        YaleKorean = module
+    return YaleKorean
+
 def _require_yalekorean() -> None:
     """Ensure that the external YaleKorean package is available."""
-    if YaleKorean is None:
+    if _import_yalekorean() is None:
         raise YaleKoreanNotInstalledError(
             "The 'YaleKorean' package is not installed.\n"
             "Install it with: \n\n"
             "   pip install YaleKorean\n"
         )
     
-def pua_to_unicode(text: str) -> str:
+# ----------------------------------------------------------------------
+# Conversion backends
+#
+#   "yalekorean": YaleKorean.PUAtoUni() / YaleMid(), one character at a time.
+#                 This is the reference implementation.
+#   "native":     the same mappings precomputed once into str.translate()
+#                 tables, so a token, a line or a whole file is converted
+#                 in a single pass.
+# ----------------------------------------------------------------------
+
+BACKENDS = ("yalekorean", "native")
+DEFAULT_BACKEND = "yalekorean"
+
+_backend = DEFAULT_BACKEND
+
+# (PUA -> Unicode table, Unicode -> Yale table), built on first use of the native backend.
+_native_tables: tuple[dict[int, str], dict[int, str]] | None = None
+
+def set_backend(name: str) -> None:
+    """Select the conversion backend used when no `backend` argument is given."""
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown conversion backend {name!r} (expected one of: {', '.join(BACKENDS)})")
+    _backend = name
+
+def get_backend() -> str:
+    return _backend
+
+_converter_version: str | None = None
+
+def converter_version() -> str | None:
+    """
+    Installed version of YaleKorean (None if it is not installed), without importing it.
+
+    Both backends take their mappings from YaleKorean, so saved conversions depend on it.
+    The version is read from the package's dist-info directory next to it, and from the
+    package metadata otherwise (slower to import).
+    """
+    global _converter_version
+    if _converter_version is None:
+        import importlib.util
+        spec = importlib.util.find_spec("YaleKorean")
+        if spec is None or not spec.submodule_search_locations:
+            return None
+        version = None
+        site = Path(next(iter(spec.submodule_search_locations))).parent
+        for dist in site.glob("[Yy]ale[Kk]orean-*.dist-info"):
+            version = dist.name[len("YaleKorean-"):-len(".dist-info")]
+            break
+        if version is None:
+            from importlib import metadata
+            try:
+                version = metadata.version("YaleKorean")
+            except metadata.PackageNotFoundError:
+                version = ""
+        _converter_version = version
+    return _converter_version
+
+def _build_native_tables() -> tuple[dict[int, str], dict[int, str]]:
+    """
+    Precompute translation tables equivalent to YaleKorean.PUAtoUni() and YaleMid().
+
+    The mapping data itself still comes from YaleKorean, so both backends always agree.
+    """
+    _require_yalekorean()
+    from YaleKorean.dict_total import dict_0_TOTAL   # type: ignore[import]
+    from YaleKorean.dict_yale import dict_0_YALE     # type: ignore[import]
+
+    # Hanyang PUA -> jamo sequence (only the ranges PUAtoUni() looks up)
+    to_uni: dict[int, str] = {
+        cp: seq for cp, seq in dict_0_TOTAL.items()
+        if 0xE0BC <= cp <= 0xEFFF or 0xF100 <= cp <= 0xF66E
+    }
+
+    # Precomposed syllables -> onset + peak (+ coda), over the same range as PUAtoUni()
+    for cp in range(0xAC00, 0xD7A0):
+        onset, rest = divmod(cp - 0xAC00, 28 * 21)
+        peak, coda = divmod(rest, 28)
+        seq = chr(onset + 0x1100) + chr(peak + 0x1161)
+        if coda:
+            seq += chr(coda + 0x11A7)
+        to_uni[cp] = seq
+
+    # Jamo -> Yale, including YaleMid()'s special case for ᆔ
+    jamo_to_yale = {ord(ch): val for ch, val in dict_0_YALE.items()}
+    jamo_to_yale[0x1172] = "ywu"
+
+    # YaleMid() runs PUAtoUni() on its input first, so fold that step into the Yale table.
+    to_yale = dict(jamo_to_yale)
+    for cp, seq in to_uni.items():
+        to_yale[cp] = seq.translate(jamo_to_yale)
+
+    return to_uni, to_yale
+
+def _get_native_tables() -> tuple[dict[int, str], dict[int, str]]:
+    global _native_tables
+    if _native_tables is None:
+        _native_tables = _build_native_tables()
+    return _native_tables
+
+def pua_to_unicode(text: str, *, backend: str | None = None) -> str:
     """
     Convert a Hanyang-PUA encoded string to Unicode Hangul/jamo.
-    
-    This is a thin wrapper around YaleKorean.PUAtoUni().
+
+    `text` may be a single token, a line or a whole file.
+    With the default backend, this is a thin wrapper around YaleKorean.PUAtoUni().
     """
+    if (backend or _backend) == "native":
+        return text.translate(_get_native_tables()[0])
     _require_yalekorean()
     return YaleKorean.PUAtoUni(text)
 
-def unicode_to_yale_mid(text: str) -> str:
+def unicode_to_yale_mid(text: str, *, backend: str | None = None) -> str:
     """
     Convert a Unicode Middle Korean string to Yale Romanization.
 
-    This is a thin wrapper around YaleKorean.YaleMid().
+    With the default backend, this is a thin wrapper around YaleKorean.YaleMid().
     """
+    if (backend or _backend) == "native":
+        yale = text.translate(_get_native_tables()[1])
+        return yale.replace("o", "wo").replace("O", "o")
     _require_yalekorean()
     return YaleKorean.YaleMid(text)
 
-def pua_to_yale(text: str) -> tuple[str, str]:
+def pua_to_yale(text: str, *, backend: str | None = None) -> tuple[str, str]:
     """
     Convenience function: PUA string -> (unicode_form, yale).
 
     Returns:
         (unicode_form, yale_form)
     """
-    uni = pua_to_unicode(text)
-    yale = unicode_to_yale_mid(uni)
+    uni = pua_to_unicode(text, backend=backend)
+    yale = unicode_to_yale_mid(uni, backend=backend)
     return uni, yale
 
+VOCAB_CACHE_FORMAT_VERSION = 2
+DEFAULT_VOCAB_CACHE_SIZE = 500_000
 
-def convert_token(token: Token) -> Token:
+class ConversionCache:
+    """
+    Bounded LRU cache of word-type conversions: pua -> (unicode_form, yale).
+
+    Middle Korean text is Zipfian, so a small vocabulary of forms makes up most tokens.
+    Each distinct PUA string is converted once; later occurrences are served from the cache.
+    A single cache is shared by every file in a run, and it can be saved to disk between runs.
+
+    The cached conversions belong to one backend: after `set_backend()` selects another one,
+    the cache starts over, and a saved vocabulary is only loaded by the backend that saved it.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_VOCAB_CACHE_SIZE) -> None:
+        self.maxsize = maxsize
+        self._items: OrderedDict[str, tuple[str, str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._pending: Path | None = None   # see load_on_first_use()
+        self.backend = _backend             # backend that converted the cached forms
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def convert(self, pua: str) -> tuple[str, str]:
+        """Return (unicode_form, yale_form) for `pua`, converting it only on a cache miss."""
+        if self.backend != _backend:
+            self._switch_backend()
+        if self._pending is not None:
+            self._load_pending()
+        items = self._items
+        forms = items.get(pua)
+        if forms is not None:
+            self.hits += 1
+            items.move_to_end(pua)
+            return forms
+
+        self.misses += 1
+        forms = pua_to_yale(pua)
+        items[pua] = forms
+        if len(items) > self.maxsize:
+            items.popitem(last=False)   # evict the least recently used form
+        return forms
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def _switch_backend(self) -> None:
+        # Forms converted by the previous backend must not be served for the new one.
+        self._items.clear()
+        self.backend = _backend
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> str:
+        return f"hits={self.hits} misses={self.misses} hit_rate={self.hit_rate:.1%} size={len(self)}"
+
+    def _version(self) -> tuple:
+        # Conversions depend on the backend and the converter, so a switch or a YaleKorean upgrade invalidates a saved vocabulary.
+        return (VOCAB_CACHE_FORMAT_VERSION, self.backend, converter_version())
+
+    def save(self, path: str | Path) -> None:
+        """Save the cached vocabulary (most recently used last) to `path`."""
+        if self.backend != _backend:
+            self._switch_backend()
+        if self._pending is not None:
+            self._load_pending()
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"version": self._version(), "items": list(self._items.items())}
+        with open(path, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, path: str | Path) -> int:
+        """
+        Load a vocabulary saved with `save`, returning the number of forms loaded.
+
+        Missing, corrupt or outdated files (or those of another backend) are ignored.
+        """
+        if self.backend != _backend:
+            self._switch_backend()
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+            if data["version"] != self._version():
+                return 0
+            items = data["items"]
+        except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError):
+            return 0
+
+        for pua, forms in items[-self.maxsize:]:
+            self._items[pua] = tuple(forms)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return len(items)
+
+    def load_on_first_use(self, path: str | Path) -> None:
+        """
+        Like `load`, but only when the first form is converted.
+
+        Runs where every file comes from the token cache never read the vocabulary
+        (nor import the converter to check its version).
+        """
+        self._pending = Path(path)
+
+    def _load_pending(self) -> None:
+        path, self._pending = self._pending, None
+        self.load(path)
+
+# Shared by every call to attach_yale() that does not pass its own cache.
+_default_cache = ConversionCache()
+
+def get_conversion_cache() -> ConversionCache:
+    """Return the run-wide conversion cache used by attach_yale() by default."""
+    return _default_cache
+
+
+def convert_token(token: Token, *, vocab: ConversionCache | None = None) -> Token:
     """
     Fill `unicode_form` and `yale` fields of a single Token in-place.
 
@@ -71,19 +318,37 @@ def convert_token(token: Token) -> Token:
     - After this function:
         token.unicode_form: Unicode Middle Korean form
         token.yale: Yale Romanization of the Unicode form
+
+    If `vocab` is given, the conversion goes through that word-type cache.
     """
-    unicode_form, yale_form = pua_to_yale(token.pua)
+    if vocab is not None:
+        unicode_form, yale_form = vocab.convert(token.pua)
+    else:
+        unicode_form, yale_form = pua_to_yale(token.pua)
     token.unicode_form = unicode_form
     token.yale = yale_form
-    if token.context is not None:
-        token.context = pua_to_unicode(token.context)
     return token
 
-def attach_yale(tokens: Iterable[Token]) -> list[Token]:
+def context_text(contexts: ContextTable, context_id: int) -> str:
+    """
+    Return the display form (Unicode, NFC) of one context entry.
+
+    Each entry is converted the first time it is shown and kept in `contexts.rendered`,
+    so a line is converted once no matter how many of its tokens are printed,
+    and lines that are never printed are never converted.
+    """
+    text = contexts.rendered.get(context_id)
+    if text is None:
+        text = unicodedata.normalize("NFC", pua_to_unicode(contexts.raw[context_id]))
+        contexts.rendered[context_id] = text
+    return text
+
+def attach_yale(tokens: Iterable[Token], *, vocab: ConversionCache | None = None) -> list[Token]:
     """
     Convert all tokens from PUA to Unicode + Yale, returning a new list.
 
     This mutates the Token objects in-place, but also returns them as a convenience.
+    Each distinct PUA form is converted once through `vocab` (default: the shared run-wide cache).
 
     Example usage:
 
@@ -96,7 +361,23 @@ def attach_yale(tokens: Iterable[Token]) -> list[Token]:
         for t in tokens[:10]:
             print(t.pua, "→", t.unicode_form, "→", t.yale)
     """
-    result: list[Token] = []
+    if vocab is None:
+        vocab = _default_cache
+
+    with profiling.stage("convert") as st:
+        hits, misses = vocab.hits, vocab.misses
+        result: list[Token] = []
+        for token in tokens:
+            result.append(convert_token(token, vocab=vocab))
+        st.count(tokens=len(result), cache_hits=vocab.hits - hits, cache_misses=vocab.misses - misses)
+        if result:
+            st.set_file(result[0].path)
+    return result
+
+def iter_attach_yale(tokens: Iterable[Token], *, vocab: ConversionCache | None = None) -> Iterator[Token]:
+    """Streaming version of attach_yale(): convert and yield tokens one at a time."""
+    if vocab is None:
+        vocab = _default_cache
+
     for token in tokens:
-        result.append(convert_token(token))
-    return result
\ No newline at end of file
+        yield convert_token(token, vocab=vocab)
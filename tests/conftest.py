@@ -0,0 +1,50 @@
+# conftest.py
+
+"""Shared fixtures: the sample excerpt (as tokens, as a corpus and its trigram index) and the tagger resources."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from midkrregextool.corpus import Corpus
+from midkrregextool.index import TrigramIndex
+from midkrregextool.resources import TaggerResources, load_resources
+
+FIXTURES = Path(__file__).parent / "fixtures"
+EXCERPT = FIXTURES / "sample_sekpo_excerpt.txt"
+ENCODING = "utf-8"
+
+
+@pytest.fixture(scope="session")
+def resources() -> TaggerResources:
+    return load_resources()
+
+@pytest.fixture(scope="session")
+def ingest_options(resources: TaggerResources) -> dict:
+    """Keyword arguments of pipeline.process_file / ingest_files for the excerpt."""
+    return dict(encoding=ENCODING, displaycontext="y", infl_suffixes=resources.infl_suffixes, lemma_list=resources.lemma_list)
+
+@pytest.fixture(scope="session")
+def excerpt_tokens(ingest_options) -> list:
+    """The excerpt, parsed, converted and tagged (not cached)."""
+    from midkrregextool.pipeline import process_file
+    return process_file(EXCERPT, **ingest_options)
+
+@pytest.fixture(scope="session")
+def corpus(excerpt_tokens) -> Corpus:
+    """The excerpt as a one-file corpus."""
+    c = Corpus()
+    c.add_file(EXCERPT, excerpt_tokens)
+    return c
+
+@pytest.fixture(scope="session")
+def index(corpus) -> TrigramIndex:
+    return TrigramIndex.from_corpus(corpus)
+
+
+def as_rows(tokens, hits) -> list[tuple[int, ...]]:
+    """Token hits (as from search_tokens) as tuples of positions in `tokens`, to compare with corpus rows."""
+    row = {id(t): i for i, t in enumerate(tokens)}
+    return [tuple(row[id(t)] for t in hit) for hit in hits]
@@ -0,0 +1,79 @@
+# test_aggregate.py
+
+"""
+Frequency counts (--group-by) are the same on a corpus and on a token stream, and match
+counting the hits of search_corpus one by one, for monogram, n-gram and structured patterns.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import replace
+
+import pytest
+
+from midkrregextool.aggregate import FORM_KEYS, GROUP_KEYS, NO_VALUE, count_corpus, count_tokens
+from midkrregextool.corpus import Corpus
+from midkrregextool.search import search_corpus
+from midkrregextool.tagger import parse_tagged_form
+
+from conftest import EXCERPT
+
+PATTERNS = [
+    "nila", "^ho/LEM", "-si", "lem~^ho", "lem=ho infl~^si",
+    r"si.*/INFL \S+/LEM", "nila|LEM hon", r"\S+ \S+", r"\S+ \S+ \S+", "i/INFL [^ ]*LEM",
+]
+
+COPY = EXCERPT.with_name("copy.txt")
+CENTURIES = {str(EXCERPT): 15, str(COPY): None}
+
+
+@pytest.fixture(scope="module")
+def tokens(excerpt_tokens) -> list:
+    """The excerpt twice, as two files (so that file and period groups differ)."""
+    return [*excerpt_tokens, *(replace(t, path=COPY) for t in excerpt_tokens)]
+
+@pytest.fixture(scope="module")
+def corpus(tokens) -> Corpus:
+    c = Corpus()
+    half = len(tokens) // 2
+    c.add_file(EXCERPT, tokens[:half])
+    c.add_file(COPY, tokens[half:])
+    return c
+
+def _label(view, key: str) -> str:
+    if key in FORM_KEYS:
+        if key == "tagged":
+            return view.tagged_form or NO_VALUE
+        return parse_tagged_form(view.tagged_form)[FORM_KEYS.index(key)] or NO_VALUE
+    if key == "source":
+        return view.source_id or NO_VALUE
+    if key == "is_note":
+        return view.is_note or NO_VALUE
+    if key == "file":
+        return str(view.path)
+    return f"{CENTURIES[str(view.path)]}c" if CENTURIES[str(view.path)] is not None else NO_VALUE
+
+
+@pytest.mark.parametrize("key", GROUP_KEYS)
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_corpus_and_stream_counts_agree(corpus, tokens, pattern, key):
+    on_corpus = count_corpus(corpus, pattern, key, centuries=CENTURIES)
+    on_stream = count_tokens(iter(tokens), pattern, key, centuries=CENTURIES)
+
+    assert on_corpus.hits == on_stream.hits
+    assert on_corpus.tokens == on_stream.tokens
+    assert on_corpus.total_tokens == on_stream.total_tokens == len(corpus)
+
+@pytest.mark.parametrize("key", GROUP_KEYS)
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_counts_match_the_hits(corpus, pattern, key):
+    hits = search_corpus(corpus, pattern)
+    if key in FORM_KEYS:
+        expected = Counter(" ".join(_label(view, key) for view in corpus.views(rows)) for rows in hits)
+    else:
+        expected = Counter(_label(corpus.view(rows[0]), key) for rows in hits)
+
+    counts = count_corpus(corpus, pattern, key, centuries=CENTURIES)
+    assert counts.hits == expected
+    assert counts.total_hits == len(hits)
@@ -0,0 +1,81 @@
+# test_bitmap.py
+
+"""
+Bitmap and HitSet operations give the same results as the same operations on plain sets
+of rows and hits, and "search within" re-checks the previous hits like the original loop.
+"""
+
+from __future__ import annotations
+
+import random
+import re
+
+import pytest
+
+from midkrregextool.bitmap import ARRAY_LIMIT, CHUNK_SIZE, Bitmap, HitSet
+from midkrregextool.corpus import Corpus
+from midkrregextool.search import filter_row_hits, search_corpus
+
+PAIRS = [
+    ("/LEM", "nila"),
+    ("si", "^ho/LEM"),
+    (r"\S+ \S+", "nila"),
+    (r"si.*/INFL \S+/LEM", r"\S+/LEM"),
+    (r"\S+/LEM \S+ \S+INFL", "LEM hon"),
+    ("lem~^ho", "infl~^si"),
+]
+
+
+def _row_sets() -> list[set[int]]:
+    """Row sets that exercise both containers and several chunks."""
+    rng = random.Random(12)
+    dense = set(rng.sample(range(CHUNK_SIZE), ARRAY_LIMIT * 3))
+    sparse = set(rng.sample(range(3 * CHUNK_SIZE), 500))
+    edges = {0, CHUNK_SIZE - 1, CHUNK_SIZE, 2 * CHUNK_SIZE + 5}
+    return [set(), dense, sparse, edges, dense | {CHUNK_SIZE + r for r in dense}]
+
+
+def _hits(corpus: Corpus, pattern: str) -> set[tuple[int, ...]]:
+    return set(search_corpus(corpus, pattern))
+
+def _contains(hit: tuple[int, ...], other: set[tuple[int, ...]]) -> bool:
+    return any(set(o) <= set(hit) for o in other)
+
+
+@pytest.mark.parametrize("a", _row_sets())
+@pytest.mark.parametrize("b", _row_sets())
+def test_bitmap_operations_match_sets(a, b):
+    x, y = Bitmap.from_rows(a), Bitmap.from_rows(b)
+    assert list(x) == sorted(a)
+    assert set(x & y) == a & b
+    assert set(x | y) == a | b
+    assert set(x - y) == a - b
+    assert set(x.complement(3 * CHUNK_SIZE)) == set(range(3 * CHUNK_SIZE)) - a
+    for k in (1, -1, 7, -CHUNK_SIZE + 3, CHUNK_SIZE + 1):
+        assert set(x.shift(k)) == {r + k for r in a if r + k >= 0}
+
+@pytest.mark.parametrize("first, second", PAIRS)
+def test_hitset_operations_match_brute_force(first, second, corpus):
+    a, b = _hits(corpus, first), _hits(corpus, second)
+    x, y = HitSet.from_row_hits(sorted(a)), HitSet.from_row_hits(sorted(b))
+
+    assert x.row_hits() == sorted(a)
+    assert set((x & y).row_hits()) == {h for h in a if _contains(h, b)}
+    assert set((x - y).row_hits()) == {h for h in a if not _contains(h, b)}
+    assert set((x | y).row_hits()) == a | b
+
+    boundaries = Bitmap.from_rows(start for start, *_ in corpus.joined_segments())
+    expected = {h + g for h in a for g in b if g[0] == h[-1] + 1 and g[0] not in boundaries}
+    assert set(x.then(y, boundaries).row_hits()) == expected
+
+@pytest.mark.parametrize("first, second", PAIRS)
+def test_search_within_rechecks_previous_hits(first, second, corpus):
+    previous = search_corpus(corpus, first)
+    views = [corpus.views(rows) for rows in previous]
+    if second.startswith(("lem", "infl")):
+        matched = {row for row, in search_corpus(corpus, second)}
+        expected = [rows for rows in previous if matched.intersection(rows)]
+    else:
+        rx = re.compile(second)
+        expected = [rows for rows, hit in zip(previous, views) if rx.search(" ".join(tok.tagged_form for tok in hit))]
+    assert filter_row_hits(corpus, previous, second) == expected
@@ -0,0 +1,68 @@
+# test_cache.py
+
+"""A cache entry is only reused while every input of the pipeline is unchanged (see cache.py)."""
+
+from __future__ import annotations
+
+import shutil
+
+import pytest
+
+from midkrregextool.cache import TokenCache
+from midkrregextool.pipeline import process_file
+from midkrregextool.yale import get_backend, set_backend
+
+from conftest import ENCODING, EXCERPT
+
+
+@pytest.fixture
+def cached(tmp_path, ingest_options):
+    """(cache, path of a copy of the excerpt, its tokens), with the entry already written."""
+    path = tmp_path / EXCERPT.name
+    shutil.copy(EXCERPT, path)
+    cache = TokenCache(tmp_path / "cache")
+    tokens = process_file(path, cache=cache, **ingest_options)
+    return cache, path, tokens
+
+
+def _fields(tokens):
+    return [(t.source_id, t.token_index, t.pua, t.unicode_form, t.yale, t.is_note, t.tagged_form, t.context_id) for t in tokens]
+
+
+def test_entry_is_reused(cached):
+    cache, path, tokens = cached
+    loaded = cache.load(path, encoding=ENCODING, displaycontext="y")
+    assert loaded is not None
+    assert _fields(loaded) == _fields(tokens)
+    assert cache.is_fresh(path, encoding=ENCODING, displaycontext="y")
+
+def test_encoding_and_displaycontext_invalidate(cached):
+    cache, path, _ = cached
+    assert cache.load(path, encoding="utf-16", displaycontext="y") is None
+    assert cache.load(path, encoding=ENCODING, displaycontext="n") is None
+
+def test_changed_file_invalidates(cached):
+    cache, path, _ = cached
+    with open(path, "a", encoding=ENCODING) as f:
+        f.write("\n")
+    assert cache.load(path, encoding=ENCODING, displaycontext="y") is None
+
+def test_changed_resources_invalidate(cached):
+    cache, path, _ = cached
+    cache.resources = tuple(digest[::-1] for digest in cache.resources)
+    assert cache.load(path, encoding=ENCODING, displaycontext="y") is None
+
+def test_converter_backend_invalidates(cached):
+    cache, path, _ = cached
+    previous = get_backend()
+    set_backend("native" if previous != "native" else "yalekorean")
+    try:
+        assert cache.load(path, encoding=ENCODING, displaycontext="y") is None
+    finally:
+        set_backend(previous)
+    assert cache.load(path, encoding=ENCODING, displaycontext="y") is not None
+
+def test_converter_version_invalidates(cached, monkeypatch):
+    cache, path, _ = cached
+    monkeypatch.setattr("midkrregextool.cache.converter_version", lambda: "0.0.0")
+    assert cache.load(path, encoding=ENCODING, displaycontext="y") is None
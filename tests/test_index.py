@@ -0,0 +1,70 @@
+# test_index.py
+
+"""The trigram query of a pattern never rules out a form the regex matches (see index.py)."""
+
+from __future__ import annotations
+
+import random
+import re
+
+import pytest
+
+from midkrregextool.index import ALL, TrigramIndex, plan_query
+from midkrregextool.search import ngram_size, search_corpus, search_tokens
+
+PATTERNS = [
+    "nila", "sinila", "^ho/LEM", "/INFL$", "LEM-(si|sya)", "(ho|hy)si", "s[iy]ni", "[a-z]+la/INFL",
+    "ni?la", "nil+a", "(?:ho)+", "a.i", "ni.*la", "^[^/]*/LEM$", r"\w+ho/LEM", "si|nila|kwo", "(sinila)",
+    "k[wy]o", "\\.", "/LEM-", "(?i)NILA", "ho/LEM-s?i", "x{2,}", "ni{0}la", "[^a]ila", "", "z", "成佛",
+]
+
+NGRAM_PATTERNS = [
+    r"\S+ \S+", "LEM-i/INFL \\S+/LEM", "nila \\S", "^ho/LEM \\S+", "i/INFL [^ ]*LEM", r"\S+/LEM \S+/LEM$", "a b",
+    r"si\S* \S+ \S*nila", r"^ho/LEM \S+ \S+", "nila [^ ]+ [^ ]+",
+]
+
+
+def _random_patterns(forms: list[str], n: int = 300) -> list[str]:
+    """Substrings of real forms, with some regex operators mixed in."""
+    rng = random.Random(0)
+    ops = ["", ".", ".*", "?", "+", "|a", "[ai]", "^", "$"]
+    patterns = []
+    for _ in range(n):
+        form = rng.choice(forms)
+        i = rng.randrange(len(form))
+        j = rng.randrange(i, len(form)) + 1
+        k = rng.randrange(i, j)
+        pattern = re.escape(form[i:k]) + rng.choice(ops) + re.escape(form[k:j])
+        patterns.append(pattern.lstrip("?+"))
+    return patterns
+
+
+def test_planner_examples():
+    assert str(plan_query("nila")) == "'ila' AND 'nil'"
+    assert plan_query(".") == ALL
+    assert plan_query("[^\\s]+") == ALL
+    assert plan_query("nila", re.IGNORECASE) == ALL
+
+def test_candidates_are_a_superset(index):
+    forms = [f for f in index.forms if f]
+    for pattern in PATTERNS + _random_patterns(forms):
+        rx = re.compile(pattern)
+        candidates = index.candidate_forms(plan_query(pattern))
+        if candidates is None:
+            continue
+        missed = [f for f, form in enumerate(index.forms) if rx.search(form) and f not in candidates]
+        assert not missed, (pattern, str(plan_query(pattern)))
+
+@pytest.mark.parametrize("pattern", PATTERNS + NGRAM_PATTERNS)
+def test_indexed_search_is_unchanged(pattern, corpus, index, excerpt_tokens):
+    assert search_corpus(corpus, pattern, index=index) == search_corpus(corpus, pattern)
+    indexed = search_tokens(excerpt_tokens, pattern, index=TrigramIndex.from_tokens(excerpt_tokens))
+    assert indexed == search_tokens(excerpt_tokens, pattern)
+
+@pytest.mark.parametrize("pattern", NGRAM_PATTERNS)
+def test_candidate_windows_are_a_superset(pattern, corpus, index):
+    starts = index.candidate_windows(plan_query(pattern), ngram_size(pattern), max_fraction=1.0)
+    if starts is None:
+        return
+    starts = set(starts)
+    assert all(rows[0] in starts for rows in search_corpus(corpus, pattern)), pattern
@@ -0,0 +1,38 @@
+# test_model.py
+
+"""Tokens and corpus views expose their context line as `context`, as Token did before the side table."""
+
+from __future__ import annotations
+
+import unicodedata
+
+import pytest
+
+from midkrregextool.corpus import Corpus
+from midkrregextool.model import Token
+from midkrregextool.parser import parse_file
+from midkrregextool.yale import pua_to_unicode
+
+from conftest import ENCODING, EXCERPT
+
+
+def test_token_context(excerpt_tokens):
+    t = excerpt_tokens[0]
+    expected = unicodedata.normalize("NFC", pua_to_unicode(t.contexts.raw[t.context_id]))
+    assert t.context == expected
+    assert t.unicode_form and unicodedata.normalize("NFC", t.unicode_form) in t.context
+
+def test_context_is_read_only(excerpt_tokens):
+    with pytest.raises(AttributeError):
+        excerpt_tokens[0].context = "x"
+
+def test_no_context():
+    assert Token(path="p", source_id="s", token_index=1, pua="x").context is None
+    tokens = parse_file(EXCERPT, encoding=ENCODING, displaycontext="n")
+    assert all(t.context is None for t in tokens)
+
+def test_view_context(excerpt_tokens):
+    corpus = Corpus()
+    corpus.add_file(EXCERPT, excerpt_tokens)
+    for row in (0, len(corpus) // 2, len(corpus) - 1):
+        assert corpus.view(row).context == excerpt_tokens[row].context
@@ -0,0 +1,31 @@
+# test_parser.py
+
+"""Streaming XML parsing (iterparse, dropping elements as they close) sees every <sent> of the document."""
+
+from __future__ import annotations
+
+import xml.etree.ElementTree as ET
+
+from midkrregextool.parser import iter_parse_xml_file
+
+
+def test_xml_sentences_are_all_read(tmp_path):
+    sents = [
+        f'<sent page="1:{i}a" n="{i}" lang="kor" type="MAIN">w{i}a w{i}b{" w" * (i % 3)}</sent>'
+        for i in range(1, 400)
+    ]
+    # Sentences directly under <body> and nested in <p> / <div>, so that elements close at several depths
+    body = "\n".join(
+        s if i % 3 == 0 else f"<p>{s}</p>" if i % 3 == 1 else f"<div><p>{s}<note/></p>tail</div>"
+        for i, s in enumerate(sents)
+    )
+    path = tmp_path / "doc.xml"
+    path.write_text(
+        f'<?xml version="1.0" encoding="utf-8"?>\n<text><teiHeader><title>釋譜詳節</title></teiHeader><body>\n{body}\n</body></text>\n',
+        encoding="utf-8",
+    )
+
+    tokens = list(iter_parse_xml_file(path))
+    root = ET.parse(path).getroot()
+    expected = [(f"釋譜詳節:{s.get('page')}:{s.get('n')}:kor", w) for s in root.iter("sent") for w in s.text.split()]
+    assert [(t.source_id, t.pua) for t in tokens] == expected
@@ -0,0 +1,73 @@
+# test_pipeline.py
+
+"""
+Chunked ingestion (--jobs with large TXT files split at source tag lines) gives the same
+tokens and context lines as parsing, converting and tagging each file serially.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from midkrregextool import parser
+from midkrregextool.cache import rows_to_tokens, tokens_to_rows
+from midkrregextool.pipeline import _ingest_chunk_worker, _init_worker, _merge_chunks, ingest_files, process_file
+from midkrregextool.parser import plan_chunks
+from midkrregextool.yale import get_backend
+
+from conftest import ENCODING, EXCERPT
+
+ENCODINGS = ["utf-8", "utf-8-sig", "utf-16", "utf-16-le"]
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    """Split even the small excerpt into chunks."""
+    monkeypatch.setattr(parser, "CHUNKED_MIN_BYTES", 0)
+
+def _copy(tmp_path: Path, encoding: str, newline: str = "\n") -> Path:
+    path = tmp_path / f"excerpt-{encoding}-{len(newline)}.txt"
+    text = EXCERPT.read_text(encoding=ENCODING)
+    path.write_text(text, encoding=encoding, newline=newline)
+    return path
+
+def _snapshot(tokens) -> tuple[list[tuple], list[str | None]]:
+    return tokens_to_rows(tokens), [t.context for t in tokens]
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+@pytest.mark.parametrize("n_chunks", [2, 5, 40])
+def test_plan_chunks_covers_the_file_at_source_tags(tmp_path, encoding, n_chunks):
+    path = _copy(tmp_path, encoding)
+    codec, ranges = plan_chunks(path, encoding=encoding, n_chunks=n_chunks)
+    data = path.read_bytes()
+
+    assert len(ranges) > 1
+    assert ranges[-1][1] == len(data)
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    for start, end in ranges[1:]:
+        assert data[start:end].decode(codec).startswith("<")
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+@pytest.mark.parametrize("displaycontext", ["y", "n"])
+def test_chunks_match_serial_parse(tmp_path, ingest_options, encoding, newline, displaycontext):
+    path = _copy(tmp_path, encoding, newline)
+    options = dict(ingest_options, encoding=encoding, displaycontext=displaycontext)
+    serial = process_file(path, **options)
+
+    _init_worker(options["infl_suffixes"], options["lemma_list"], get_backend())
+    codec, ranges = plan_chunks(path, encoding=encoding, n_chunks=6)
+    rows, contexts = _merge_chunks([_ingest_chunk_worker(path, start, end, codec, displaycontext) for start, end in ranges])
+
+    assert _snapshot(rows_to_tokens(path, rows, contexts)) == _snapshot(serial)
+
+def test_ingest_files_with_jobs_matches_serial(tmp_path, ingest_options):
+    files = [_copy(tmp_path, "utf-16"), _copy(tmp_path, "utf-16", "\r\n")]
+    options = dict(ingest_options, encoding="utf-16")
+
+    serial = [(path, _snapshot(tokens)) for path, tokens in ingest_files(files, jobs=1, **options)]
+    parallel = [(path, _snapshot(tokens)) for path, tokens in ingest_files(files, jobs=3, **options)]
+    assert parallel == serial
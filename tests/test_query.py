@@ -0,0 +1,92 @@
+# test_query.py
+
+"""
+Structured queries (lem= / infl~ conditions) find exactly the tokens whose lemma and INFL
+suffix satisfy every condition, checked token by token, on every search path.
+"""
+
+from __future__ import annotations
+
+import re
+from collections import Counter
+
+import pytest
+
+from midkrregextool.corpus import Corpus
+from midkrregextool.index import TrigramIndex
+from midkrregextool.query import Condition, FieldIndex, parse_query
+from midkrregextool.search import is_ngram_pattern, iter_search_tokens, search_corpus, search_tokens
+from midkrregextool.tagger import parse_tagged_form
+
+from conftest import EXCERPT, as_rows
+
+
+@pytest.fixture(scope="module")
+def queries(excerpt_tokens) -> list[str]:
+    """Queries built from the excerpt's most frequent (Yale) lemma + INFL suffix, covering every kind of lookup."""
+    fields = [parse_tagged_form(t.tagged_form) for t in excerpt_tokens]
+    lem, infl = Counter((lem, infl) for lem, infl in fields if lem.isascii() and len(lem) > 1 and infl).most_common(1)[0][0]
+    return [
+        f"lem={lem}", f"infl={infl}", "infl=", f"lem~^{lem[:2]}", f"infl~{infl[-2:]}$", f"infl~^{infl}$",
+        f"lem={lem} infl~^{infl[:1]}", "infl~^si", "infl~(ni|la)$", "lem~o", f"lem~^{lem[:2]} infl~a$",
+        f"lem={lem.upper()}", "lem=zzz", "infl~^", "lem~^$", "lem~[^a-z]",
+    ]
+
+def reference(tokens, pattern: str, flags: int = 0) -> list[tuple[int]]:
+    """Rows of the tokens that satisfy every condition, checked one token at a time."""
+    conditions = [re.fullmatch(r"(lem|infl)(=|~)(\S*)", part).groups() for part in pattern.split()]
+    hits = []
+    for row, t in enumerate(tokens):
+        values = dict(zip(("lem", "infl"), parse_tagged_form(t.tagged_form)))
+        if all(
+            re.search(value if op == "~" else f"^{re.escape(value)}$", values[field], flags)
+            for field, op, value in conditions
+        ):
+            hits.append((row,))
+    return hits
+
+
+def test_parse_query():
+    assert parse_query("lem=ho infl~^si") == [Condition("lem", "=", "ho"), Condition("infl", "~", "^si")]
+    assert parse_query("infl=") == [Condition("infl", "=", "")]
+    for pattern in ("ho", "lem=ho nila", "lem:ho", "", "si.*/INFL \\S+/LEM"):
+        assert parse_query(pattern) is None
+    assert not is_ngram_pattern("lem=ho infl~^si")
+    with pytest.raises(re.error):
+        parse_query("infl~(si")
+
+def test_probe_kinds():
+    assert Condition("lem", "=", "ho").probe() == ("exact", "ho")
+    assert Condition("lem", "=", "ho").probe(re.IGNORECASE) == ("regex", "^ho$")
+    assert Condition("infl", "~", "^si").probe() == ("prefix", "si")
+    assert Condition("infl", "~", "la$").probe() == ("suffix", "la")
+    assert Condition("infl", "~", "^sini$").probe() == ("exact", "sini")
+    assert Condition("infl", "~", "(ni|la)$").probe() == ("regex", "(ni|la)$")
+
+@pytest.mark.parametrize("flags", [0, re.IGNORECASE])
+def test_queries_match_brute_force(excerpt_tokens, corpus, queries, flags):
+    index = TrigramIndex.from_corpus(corpus)
+    token_index = TrigramIndex.from_tokens(excerpt_tokens)
+    for pattern in queries:
+        expected = reference(excerpt_tokens, pattern, flags)
+        assert search_corpus(corpus, pattern, flags) == expected, pattern
+        assert search_corpus(corpus, pattern, flags, index=index) == expected, pattern
+        assert as_rows(excerpt_tokens, search_tokens(excerpt_tokens, pattern, flags)) == expected, pattern
+        assert as_rows(excerpt_tokens, search_tokens(excerpt_tokens, pattern, flags, index=token_index)) == expected, pattern
+        assert as_rows(excerpt_tokens, iter_search_tokens(iter(excerpt_tokens), pattern, flags)) == expected, pattern
+
+def test_field_index_lookups(corpus, queries):
+    index = FieldIndex(corpus.tagged.values)
+    for pattern in queries:
+        conditions = parse_query(pattern)
+        expected = {corpus.tagged_ids[row] for row, in reference([corpus.view(r) for r in range(len(corpus))], pattern)}
+        assert index.form_ids(conditions) == expected, pattern
+
+def test_index_follows_added_files(excerpt_tokens, queries):
+    c = Corpus()
+    c.add_file(EXCERPT, excerpt_tokens[:100])
+    for pattern in queries:
+        search_corpus(c, pattern)
+    c.add_file(EXCERPT, excerpt_tokens[100:])
+    for pattern in queries:
+        assert search_corpus(c, pattern) == reference(excerpt_tokens, pattern), pattern
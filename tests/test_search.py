@@ -0,0 +1,80 @@
+# test_search.py
+
+"""
+N-gram search finds exactly the windows of k+1 tokens (for a pattern with k spaces) whose
+joined forms match, the same as the original pair search for bigrams, on every search path.
+"""
+
+from __future__ import annotations
+
+import re
+
+import pytest
+
+from midkrregextool.corpus import Corpus
+from midkrregextool.index import TrigramIndex
+from midkrregextool.search import iter_ngram_spans, iter_search_tokens, ngram_size, search_corpus, search_tokens
+
+from conftest import EXCERPT, as_rows
+
+BIGRAM_PATTERNS = [
+    r"si.*/INFL \S+/LEM", "nila|LEM hon", r"\S+ \S+", "LEM-i/INFL \\S+/LEM", "^ho/LEM \\S+", "nila \\S",
+    "/LEM$ ^s", r"LEM \S+INFL$", ".* .*", "a b", " ho", "(?:si|sya)/INFL \\S+", r"\S+/LEM \S+/LEM$", "LEM ",
+    # Spaces inside character classes do not make the windows longer
+    "[^ ]+ [^ ]+", "i/INFL [^ ]*LEM", "LEM [a-z ]", "[^ ]+/LEM$",
+]
+# (pattern, tokens per hit)
+LONGER_PATTERNS = [
+    (r"\S+ \S+ \S+", 3), (r"\S+/LEM \S+ \S+INFL", 3), ("si.* .* .*la", 3), (r"^\S+ ho\S* \S+$", 3),
+    ("[^ ]+ [^ ]+ [^ ]+", 3), (r"(\S+ ){2}\S+", 3), (r"/LEM [^ ]+ [\w/ -]+INFL$", 3),
+]
+
+
+def reference_pairs(tokens, pattern: str) -> list[tuple[int, int]]:
+    """The original bigram search (one file), as index pairs."""
+    rx = re.compile(pattern)
+    return [
+        (i, i + 1) for i in range(len(tokens) - 1)
+        if tokens[i].is_note == tokens[i + 1].is_note and rx.search(f"{tokens[i].tagged_form} {tokens[i + 1].tagged_form}")
+    ]
+
+def reference_windows(tokens, pattern: str, size: int) -> list[tuple[int, ...]]:
+    rx = re.compile(pattern)
+    return [
+        tuple(range(i, i + size)) for i in range(len(tokens) - size + 1)
+        if len({t.is_note for t in tokens[i:i + size]}) == 1 and rx.search(" ".join(t.tagged_form for t in tokens[i:i + size]))
+    ]
+
+
+
+
+@pytest.mark.parametrize("pattern", BIGRAM_PATTERNS)
+def test_bigram_size(pattern):
+    assert ngram_size(pattern) == 2
+
+@pytest.mark.parametrize("pattern", BIGRAM_PATTERNS)
+def test_bigrams_match_the_original_pair_search(pattern, excerpt_tokens, corpus, index):
+    expected = reference_pairs(excerpt_tokens, pattern)
+    assert search_corpus(corpus, pattern) == expected
+    assert search_corpus(corpus, pattern, index=index) == expected
+    assert as_rows(excerpt_tokens, search_tokens(excerpt_tokens, pattern)) == expected
+    assert as_rows(excerpt_tokens, search_tokens(excerpt_tokens, pattern, index=TrigramIndex.from_tokens(excerpt_tokens))) == expected
+    assert as_rows(excerpt_tokens, iter_search_tokens(iter(excerpt_tokens), pattern)) == expected
+
+@pytest.mark.parametrize("pattern, size", LONGER_PATTERNS)
+def test_longer_ngrams_are_windows(pattern, size, excerpt_tokens, corpus, index):
+    expected = reference_windows(excerpt_tokens, pattern, size)
+    assert expected
+    assert search_corpus(corpus, pattern) == expected
+    assert search_corpus(corpus, pattern, index=index) == expected
+    assert [tuple(range(a, b + 1)) for a, b in iter_ngram_spans(corpus, pattern)] == expected
+    assert as_rows(excerpt_tokens, iter_search_tokens(iter(excerpt_tokens), pattern)) == expected
+
+def test_hits_never_span_files(excerpt_tokens):
+    corpus = Corpus()
+    corpus.add_file(EXCERPT, excerpt_tokens)
+    corpus.add_file(EXCERPT.with_name("copy.txt"), excerpt_tokens)
+    n = len(excerpt_tokens)
+    hits = search_corpus(corpus, r"\S+ \S+")
+    assert (n - 1, n) not in hits
+    assert len(hits) == 2 * len(reference_pairs(excerpt_tokens, r"\S+ \S+"))
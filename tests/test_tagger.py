@@ -0,0 +1,153 @@
+# test_tagger.py
+
+"""
+The compiled Tagger gives the same analyses as the original linear scans over the resource lists,
+and suffix discovery counts the same endings as the original per-token loops.
+"""
+
+from __future__ import annotations
+
+import random
+import re
+import unicodedata
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+from midkrregextool.tagger import (
+    Tagger, analyze_yale, count_word_endings, propose_infl_suffixes, split_lem_infl, tag_tokens, update_suffix_counter, yale_frequencies,
+)
+
+
+# The original implementations (before the tries and the memo), kept as the reference.
+
+def _contains_han(s: str) -> bool:
+    return any("CJK UNIFIED IDEOGRAPH" in unicodedata.name(ch, "") for ch in s)
+
+def reference_analyze(yale: str, infl_suffixes: list[str], lemmas: list[str]) -> str:
+    if not yale:
+        return ""
+    for lem in lemmas:
+        if yale.startswith(lem):
+            suffix = yale[len(lem):]
+            return f"{lem}/LEM" if not suffix else f"{lem}/LEM-{suffix}/INFL"
+    if _contains_han(yale):
+        m1 = re.match(r"^([\u4E00-\u9FFF]+ho)(.+)$", yale)
+        m2 = re.match(r"^([\u4E00-\u9FFF]+)([^\u4E00-\u9FFF]+)$", yale)
+        if m1:
+            return f"{m1.group(1)}/LEM-{m1.group(2)}/INFL"
+        if m2:
+            return f"{m2.group(1)}/LEM-{m2.group(2)}/INFL"
+        return f"{yale}/LEM"
+    for suf in infl_suffixes:
+        if yale.endswith(suf):
+            lem = yale[:-len(suf)]
+            if not lem:
+                return f"{yale}/LEM"
+            if re.search(r"[aeiou]", lem):
+                return f"{lem}/LEM-{suf}/INFL"
+    return f"{yale}/LEM"
+
+def reference_split(yale: str, infl_suffixes: list[str]) -> tuple[str, str] | None:
+    if not yale:
+        return None
+    for suf in infl_suffixes:
+        if yale.endswith(suf) and len(yale) > len(suf) and re.search(r"[aeiou]", yale[:-len(suf)]):
+            return yale[:-len(suf)], suf
+    return None
+
+def reference_endings(freq: dict[str, int], max_len: int, proper: bool) -> Counter[str]:
+    counts: Counter[str] = Counter()
+    for word, n in freq.items():
+        for L in range(1, min(len(word) - proper, max_len) + 1):
+            counts[word[-L:]] += n
+    return counts
+
+def reference_update_suffix_counter(counter: Counter, tokens, tagger: Tagger, *, max_len: int, suffix_must_endwith: str | None) -> None:
+    for t in tokens:
+        yale = t.yale
+        if not yale or tagger.split(yale) is not None:
+            continue
+        for L in range(1, min(len(yale), max_len) + 1):
+            if L < len(yale):
+                if suffix_must_endwith is not None and (len(suffix_must_endwith) >= len(yale) or not yale.endswith(suffix_must_endwith)):
+                    continue
+                counter[yale[-L:]] += 1
+
+def reference_propose(tokens, tagger: Tagger, *, max_len: int, min_count: int, top_k: int) -> list[tuple[str, int]]:
+    c: Counter[str] = Counter()
+    for t in tokens:
+        yale = t.yale
+        if not yale or tagger.split(yale) is not None:
+            continue
+        for L in range(1, min(max_len, len(yale)) + 1):
+            c[yale[-L:]] += 1
+    items = [(suf, cnt) for suf, cnt in c.items() if cnt >= min_count]
+    items.sort(key=lambda x: (-len(x[0]), -x[1], x[0]))
+    return items[:top_k]
+
+
+@pytest.fixture(scope="module")
+def forms(excerpt_tokens, resources) -> list[str]:
+    """Every Yale form of the excerpt, plus forms that exercise each branch of the analysis."""
+    extra = ["", "a", "nila", "sinila", "hsinila", "成佛ho", "成佛hosinila", "成佛i", "成佛", "佛子ho"]
+    extra += [suf for suf in resources.infl_suffixes[:50]] + [lem + "nila" for lem in resources.lemma_list[:50]]
+    return sorted({t.yale for t in excerpt_tokens}) + extra
+
+@pytest.fixture(scope="module")
+def discovery_tokens(excerpt_tokens) -> list:
+    """The excerpt's tokens, plus random words over a small alphabet (many shared endings, empty words)."""
+    rng = random.Random(23)
+    words = ["".join(rng.choice("aabnil.") for _ in range(rng.randint(0, 9))) for _ in range(3000)]
+    return list(excerpt_tokens) + [SimpleNamespace(yale=w) for w in words]
+
+@pytest.fixture(scope="module", params=["built", "precompiled"])
+def tagger(request, resources) -> Tagger:
+    if request.param == "built":
+        return Tagger(resources.infl_suffixes, resources.lemma_list)
+    return Tagger.from_resources(resources)
+
+
+def test_analyze_matches_reference(tagger, forms, resources):
+    for yale in forms:
+        expected = reference_analyze(yale, resources.infl_suffixes, resources.lemma_list)
+        assert tagger.analyze(yale) == expected, yale
+        # twice: the second answer comes from the memo
+        assert tagger.analyze(yale) == expected, yale
+
+def test_split_matches_reference(tagger, forms, resources):
+    for yale in forms:
+        assert tagger.split(yale) == reference_split(yale, resources.infl_suffixes), yale
+
+def test_module_functions(forms, resources):
+    for yale in forms[:200]:
+        assert analyze_yale(yale, resources.infl_suffixes, resources.lemma_list) == reference_analyze(yale, resources.infl_suffixes, resources.lemma_list)
+        assert split_lem_infl(yale, resources.infl_suffixes) == reference_split(yale, resources.infl_suffixes)
+
+def test_tag_tokens(excerpt_tokens, resources):
+    tagged = tag_tokens(list(excerpt_tokens), resources.infl_suffixes, resources.lemma_list)
+    assert [t.tagged_form for t in tagged] == [reference_analyze(t.yale, resources.infl_suffixes, resources.lemma_list) for t in tagged]
+
+@pytest.mark.parametrize("max_len", [1, 3, 6, 12])
+@pytest.mark.parametrize("proper", [False, True])
+def test_count_word_endings_matches_naive_loop(discovery_tokens, max_len, proper):
+    freq = yale_frequencies(discovery_tokens)
+    freq[""] = 3
+    assert count_word_endings(freq, max_len=max_len, proper=proper) == reference_endings(freq, max_len, proper)
+
+@pytest.mark.parametrize("max_len", [1, 3, 6, 12])
+@pytest.mark.parametrize("suffix_must_endwith", [None, "nila", "a", ""])
+def test_update_suffix_counter_matches_original(discovery_tokens, resources, max_len, suffix_must_endwith):
+    tagger = Tagger(resources.infl_suffixes, resources.lemma_list)
+    counter, expected = Counter({"nila": 1}), Counter({"nila": 1})
+    update_suffix_counter(counter, discovery_tokens, resources.infl_suffixes, max_len=max_len, suffix_must_endwith=suffix_must_endwith, tagger=tagger)
+    reference_update_suffix_counter(expected, discovery_tokens, tagger, max_len=max_len, suffix_must_endwith=suffix_must_endwith)
+    assert counter == expected
+
+@pytest.mark.parametrize("max_len", [1, 6, 10])
+def test_propose_infl_suffixes_matches_original(discovery_tokens, resources, max_len):
+    tagger = Tagger(resources.infl_suffixes, resources.lemma_list)
+    for min_count, top_k in ((1, 1000), (2, 50), (20, 10)):
+        assert propose_infl_suffixes(discovery_tokens, resources.infl_suffixes, max_len=max_len, min_count=min_count, top_k=top_k, tagger=tagger) \
+            == reference_propose(discovery_tokens, tagger, max_len=max_len, min_count=min_count, top_k=top_k)
@@ -0,0 +1,61 @@
+# test_yale_backends.py
+
+"""The native conversion tables give the same forms as YaleKorean (see yale.py)."""
+
+from __future__ import annotations
+
+import pytest
+
+from midkrregextool.parser import parse_file
+from midkrregextool.yale import BACKENDS, ConversionCache, get_backend, pua_to_unicode, pua_to_yale, set_backend
+
+from conftest import ENCODING, EXCERPT
+
+
+@pytest.fixture(scope="module")
+def tokens():
+    return parse_file(EXCERPT, encoding=ENCODING, displaycontext="y")
+
+
+def test_backends_agree_on_every_token(tokens):
+    assert tokens
+    for t in tokens:
+        assert pua_to_yale(t.pua, backend="native") == pua_to_yale(t.pua, backend="yalekorean"), t.pua
+
+def test_backends_agree_on_context_lines(tokens):
+    lines = tokens[0].contexts.raw
+    assert lines
+    for line in lines:
+        assert pua_to_unicode(line, backend="native") == pua_to_unicode(line, backend="yalekorean")
+
+
+@pytest.fixture
+def backend():
+    """Restore the selected backend after the test."""
+    previous = get_backend()
+    yield
+    set_backend(previous)
+
+def test_cache_is_not_shared_across_backends(tokens, backend):
+    form = tokens[0].pua
+    vocab = ConversionCache()
+    set_backend(BACKENDS[0])
+    vocab.convert(form)
+    vocab.convert(form)
+    assert (vocab.hits, vocab.misses) == (1, 1)
+
+    set_backend(BACKENDS[1])
+    vocab.convert(form)
+    assert (vocab.hits, vocab.misses) == (1, 2)
+
+def test_saved_vocabulary_belongs_to_its_backend(tokens, backend, tmp_path):
+    path = tmp_path / "vocab.bin"
+    set_backend(BACKENDS[0])
+    vocab = ConversionCache()
+    for t in tokens[:10]:
+        vocab.convert(t.pua)
+    vocab.save(path)
+
+    assert ConversionCache().load(path) == len(vocab)
+    set_backend(BACKENDS[1])
+    assert ConversionCache().load(path) == 0